@@ -0,0 +1,299 @@
+"""
+In-process address search over `properties`.
+
+Each property's address, municipality and province are normalized (case and
+accents folded, punctuation dropped) and split into tokens. The index keeps:
+
+- postings: token -> property IDs
+- a sorted vocabulary, so a prefix is a bisect plus a slice
+- trigrams over the vocabulary (not over documents), so a misspelled token
+  finds similar tokens with a few set lookups
+
+A query token matches a vocabulary token exactly (1.0), as a prefix (0.8, so
+search-as-you-type works on the word being typed) or by trigram similarity
+(Jaccard, scaled to at most 0.6, for tokens of three or more characters).
+Every query token must match. Each query token becomes a property -> best
+score map built with set operations, most selective token first and every
+later one restricted to the survivors (and to the landlord's properties), so
+a common token such as a province code never expands into a scan. Ranking is
+a top-k heap over what is left.
+
+`upsert`/`remove` keep the index current for writes made through this API.
+Writes made elsewhere (the Node API, the console) show up at the next
+background rebuild, `ADDRESS_INDEX_REFRESH_SECONDS` after the previous one.
+A failed rebuild keeps serving the old index and is not retried for
+`ADDRESS_INDEX_RETRY_SECONDS`, so a degraded datastore sees one scan per
+retry interval rather than one per search.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import heapq
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Any
+
+import datastore
+
+
+PROPERTIES = "properties"
+FIELDS = ("address", "municipality", "province")
+REFRESH_SECONDS = float(os.getenv("ADDRESS_INDEX_REFRESH_SECONDS", "300"))
+RETRY_SECONDS = float(os.getenv("ADDRESS_INDEX_RETRY_SECONDS", "30"))
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+EXACT, PREFIX, FUZZY_WEIGHT = 1.0, 0.8, 0.6
+MIN_SIMILARITY = 0.4
+MIN_FUZZY_LENGTH = 3
+# a lone one-character prefix expands to most of the vocabulary and ranks
+# nothing; after another token ("12 m") it is the word being typed
+MIN_PREFIX_LENGTH = 2
+
+logger = logging.getLogger("rentchain.address_index")
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+def tokenize(text: str) -> list[str]:
+    return normalize(text).split()
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, dict):
+        return " ".join(str(part) for part in value.values() if part)
+    return str(value) if value else ""
+
+
+class _Entry:
+    __slots__ = ("landlord_id", "tokens", "display")
+
+    def __init__(self, landlord_id: Any, tokens: frozenset[str], display: dict[str, Any]) -> None:
+        self.landlord_id = landlord_id
+        self.tokens = tokens
+        self.display = display
+
+
+class AddressIndex:
+    def __init__(self) -> None:
+        self._entries: dict[str, _Entry] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._vocabulary: list[str] = []
+        self._trigrams: dict[str, set[str]] = collections.defaultdict(set)
+        self._by_landlord: dict[Any, set[str]] = collections.defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def upsert(self, document: datastore.Document) -> None:
+        doc_id = document["id"]
+        tokens = frozenset(
+            token for field in FIELDS for token in tokenize(_field_text(document.get(field)))
+        )
+        display = {"rc_prop_id": document.get("rc_prop_id", doc_id)}
+        display.update((field, document.get(field)) for field in FIELDS)
+        landlord_id = document.get("landlord_id")
+        previous = self._entries.get(doc_id)
+        self._entries[doc_id] = _Entry(landlord_id, tokens, display)
+        if previous is not None and previous.landlord_id != landlord_id:
+            self._unlink_landlord(previous.landlord_id, doc_id)
+        self._by_landlord[landlord_id].add(doc_id)
+        old_tokens = previous.tokens if previous is not None else frozenset()
+        for token in old_tokens - tokens:
+            self._unpost(token, doc_id)
+        for token in tokens - old_tokens:
+            self._post(token, doc_id)
+
+    def remove(self, doc_id: str) -> None:
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            self._unlink_landlord(entry.landlord_id, doc_id)
+            for token in entry.tokens:
+                self._unpost(token, doc_id)
+
+    def _unlink_landlord(self, landlord_id: Any, doc_id: str) -> None:
+        members = self._by_landlord[landlord_id]
+        members.discard(doc_id)
+        if not members:
+            del self._by_landlord[landlord_id]
+
+    def _post(self, token: str, doc_id: str) -> None:
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = set()
+            bisect.insort(self._vocabulary, token)
+            for gram in trigrams(token):
+                self._trigrams[gram].add(token)
+        postings.add(doc_id)
+
+    def _unpost(self, token: str, doc_id: str) -> None:
+        postings = self._postings[token]
+        postings.discard(doc_id)
+        if postings:
+            return
+        del self._postings[token]
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+        for gram in trigrams(token):
+            members = self._trigrams[gram]
+            members.discard(token)
+            if not members:
+                del self._trigrams[gram]
+
+    def _matches(self, query_token: str, typing: bool = False) -> dict[str, float]:
+        """Vocabulary tokens matching `query_token`, with their scores."""
+        matches: dict[str, float] = {}
+        if len(query_token) < MIN_PREFIX_LENGTH and not typing:
+            if query_token in self._postings:
+                matches[query_token] = EXACT
+        else:
+            vocabulary = self._vocabulary
+            position = bisect.bisect_left(vocabulary, query_token)
+            while position < len(vocabulary) and vocabulary[position].startswith(query_token):
+                token = vocabulary[position]
+                matches[token] = EXACT if token == query_token else PREFIX
+                position += 1
+        if len(query_token) >= MIN_FUZZY_LENGTH:
+            grams = trigrams(query_token)
+            shared: collections.Counter[str] = collections.Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            for token, count in shared.items():
+                if token in matches:
+                    continue
+                # a padded token has len + 1 trigrams (fewer only with repeats)
+                similarity = count / (len(grams) + len(token) + 1 - count)
+                if similarity >= MIN_SIMILARITY:
+                    matches[token] = FUZZY_WEIGHT * similarity
+        return matches
+
+    def _scores(self, matches: dict[str, float], within: set[str] | None) -> dict[str, float]:
+        """Best score per property for one query token, restricted to `within`."""
+        scores: dict[str, float] = {}
+        # ascending, so a property matching several tokens keeps its best score
+        for token, score in sorted(matches.items(), key=lambda item: item[1]):
+            postings = self._postings[token]
+            scores.update(dict.fromkeys(postings if within is None else postings & within, score))
+        return scores
+
+    def search(
+        self, query: str, landlord_id: Any = None, limit: int = DEFAULT_LIMIT
+    ) -> list[dict[str, Any]]:
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+        last = len(query_tokens) - 1
+        per_token = [
+            self._matches(token, typing=0 < position == last) for position, token in enumerate(query_tokens)
+        ]
+        if not all(per_token):
+            return []
+        within = None
+        if landlord_id is not None:
+            within = self._by_landlord.get(landlord_id)
+            if not within:
+                return []
+        # most selective token first, so later tokens only touch its candidates
+        per_token.sort(key=lambda matches: sum(len(self._postings[token]) for token in matches))
+        totals: dict[str, float] = {}
+        for position, matches in enumerate(per_token):
+            scores = self._scores(matches, within)
+            if position:
+                scores = {doc_id: totals[doc_id] + score for doc_id, score in scores.items()}
+            totals = scores
+            if not totals:
+                return []
+            if position + 1 < len(per_token):
+                within = set(totals)
+
+        entries = self._entries
+        # ties go to the property with fewer tokens: "12 main st" before "12 main st unit 4"
+        best = heapq.nsmallest(
+            limit, totals.items(), key=lambda item: (-item[1], len(entries[item[0]].tokens), item[0])
+        )
+        return [
+            {**entries[doc_id].display, "score": round(total / len(query_tokens), 4)}
+            for doc_id, total in best
+        ]
+
+
+class PropertySearch:
+    """Owns the live index: lazy first build, periodic background rebuilds."""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, retry_seconds: float = RETRY_SECONDS) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.index = AddressIndex()
+        self.built_at: float | None = None
+        # no rebuild starts before this, after one failed
+        self.retry_at = 0.0
+        self._lock: asyncio.Lock | None = None
+        self._refresh: asyncio.Task | None = None
+        # writes seen while a rebuild is reading; replayed onto the new index
+        self._pending: list[datastore.Document] | None = None
+
+    async def _build(self) -> AddressIndex:
+        index = AddressIndex()
+        async for document in datastore.query_all(PROPERTIES):
+            index.upsert(document)
+        return index
+
+    async def ready(self) -> AddressIndex:
+        if self.built_at is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self.built_at is None:
+                    self.index = await self._build()
+                    self.built_at = time.monotonic()
+        elif (
+            time.monotonic() - self.built_at > self.refresh_seconds
+            and time.monotonic() >= self.retry_at
+            and (self._refresh is None or self._refresh.done())
+        ):
+            self._refresh = asyncio.create_task(self._rebuild(), name="address-index-rebuild")
+        return self.index
+
+    async def _rebuild(self) -> None:
+        started = time.monotonic()
+        self._pending = []
+        try:
+            index = await self._build()
+        except Exception:
+            logger.warning("address index rebuild failed", exc_info=True)
+            self.retry_at = time.monotonic() + self.retry_seconds
+            return
+        else:
+            for document in self._pending:
+                index.upsert(document)
+            self.index, self.built_at = index, started
+        finally:
+            self._pending = None
+
+    def upsert(self, document: datastore.Document) -> None:
+        # before the first build there is nothing to keep current
+        if self.built_at is not None:
+            self.index.upsert(document)
+        if self._pending is not None:
+            self._pending.append(document)
+
+    def reset(self) -> None:
+        self.index, self.built_at = AddressIndex(), None
+
+
+search = PropertySearch()
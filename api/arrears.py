@@ -0,0 +1,255 @@
+"""
+Arrears and aging over ledger entries, computed column-wise.
+
+`Ledger.from_entries` reduces ledger entries to four parallel integer
+columns (lease index, entry kind, amount in cents, due day as a proleptic
+ordinal) plus lease -> property lookup tables. `compute` ages them as of a
+date:
+
+- balance per lease: charges and payment reversals add; payments, credits
+  and write-offs subtract
+- payments apply balance-forward to the oldest charge first, so a charge's
+  outstanding amount is its running total within the lease minus everything
+  paid, clipped to [0, amount]
+- outstanding amounts are bucketed by days past due (`BUCKETS`)
+- late-fee exposure is charged on each charge outstanding past the grace
+  period: a flat fee plus `LATE_FEE_RATE_BP` basis points, floored to a cent
+- per-property rollups sum the per-lease results
+
+With NumPy installed, every step is a whole-array operation (lexsort, cumsum,
+searchsorted, bincount). Without it, `_compute_python` runs the same integer
+arithmetic in a loop. The two engines return identical results, which
+tests/test_arrears.py checks.
+"""
+
+from __future__ import annotations
+
+import array
+import datetime as dt
+import functools
+import os
+from typing import Any, Iterable
+
+
+CHARGE, CREDIT, REVERSAL = 0, 1, 2
+KINDS = {
+    "scheduled_rent_charge": CHARGE,
+    "one_time_charge": CHARGE,
+    "nsf_fee": CHARGE,
+    "payment_applied": CREDIT,
+    "credit": CREDIT,
+    "write_off": CREDIT,
+    "payment_reversal": REVERSAL,
+}
+BUCKETS = ("current", "days_1_30", "days_31_60", "days_61_90", "days_91_plus")
+# upper bounds of every bucket but the last, in days past due
+BUCKET_EDGES = (0, 30, 60, 90)
+LATE_FEE_GRACE_DAYS = int(os.getenv("LATE_FEE_GRACE_DAYS", "5"))
+LATE_FEE_FLAT_CENTS = int(os.getenv("LATE_FEE_FLAT_CENTS", "0"))
+LATE_FEE_RATE_BP = int(os.getenv("LATE_FEE_RATE_BP", "500"))
+
+
+@functools.cache
+def _numpy() -> Any:
+    # imported on first use: NumPy adds ~100 ms to a cold start
+    try:
+        import numpy
+    except ImportError:  # optional speedup; see requirements.txt
+        return None
+    return numpy
+
+
+def numpy_available() -> bool:
+    return _numpy() is not None
+
+
+def _ordinal(value: Any) -> int | None:
+    if isinstance(value, dt.datetime):
+        return value.date().toordinal()
+    if isinstance(value, dt.date):
+        return value.toordinal()
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return dt.date.fromisoformat(value[:10]).toordinal()
+        except ValueError:
+            return None
+    return None
+
+
+class Ledger:
+    """Columnar ledger: `lease[i]`, `kind[i]`, `amount[i]`, `day[i]` describe entry i."""
+
+    def __init__(self) -> None:
+        # typed arrays: NumPy wraps them without copying, and they pickle compactly
+        self.lease = array.array("q")
+        self.kind = array.array("b")
+        self.amount = array.array("q")
+        self.day = array.array("q")
+        self.lease_ids: list[str] = []
+        self.lease_property: list[int] = []
+        self.property_ids: list[str] = []
+        self._lease_index: dict[str, int] = {}
+        self._property_index: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def add(self, lease_id: str, rc_prop_id: str, kind: int, amount: int, day: int) -> None:
+        lease = self._lease_index.get(lease_id)
+        if lease is None:
+            prop = self._property_index.get(rc_prop_id)
+            if prop is None:
+                prop = self._property_index[rc_prop_id] = len(self.property_ids)
+                self.property_ids.append(rc_prop_id)
+            lease = self._lease_index[lease_id] = len(self.lease_ids)
+            self.lease_ids.append(lease_id)
+            self.lease_property.append(prop)
+        self.lease.append(lease)
+        self.kind.append(kind)
+        self.amount.append(amount)
+        self.day.append(day)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[dict[str, Any]]) -> "Ledger":
+        """Entries without a known type, a lease, an integer amount or a date are skipped."""
+        ledger = cls()
+        for entry in entries:
+            kind = KINDS.get(entry.get("type"))
+            amount = entry.get("amount_cents")
+            lease_id = entry.get("lease_id")
+            if kind is None or not lease_id or not isinstance(amount, int):
+                continue
+            day = _ordinal(entry.get("due_date")) or _ordinal(entry.get("effective_date"))
+            if day is None:
+                continue
+            ledger.add(lease_id, entry.get("rc_prop_id") or "", kind, amount, day)
+        return ledger
+
+    def columns(self) -> dict[str, Any]:
+        """Cheap to pickle to a worker process."""
+        return {
+            "lease": self.lease, "kind": self.kind, "amount": self.amount, "day": self.day,
+            "lease_ids": self.lease_ids, "lease_property": self.lease_property,
+            "property_ids": self.property_ids,
+        }
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, Any]) -> "Ledger":
+        ledger = cls()
+        for name in ("lease", "kind", "amount", "day", "lease_ids", "lease_property", "property_ids"):
+            setattr(ledger, name, columns[name])
+        return ledger
+
+
+def _compute_numpy(ledger: Ledger, as_of: int) -> tuple[list, list, list, list]:
+    np = _numpy()
+    leases = len(ledger.lease_ids)
+    lease = np.frombuffer(ledger.lease, dtype=np.int64)
+    kind = np.frombuffer(ledger.kind, dtype=np.int8)
+    amount = np.frombuffer(ledger.amount, dtype=np.int64)
+    day = np.frombuffer(ledger.day, dtype=np.int64)
+
+    # bincount sums in float64, exact for integer totals below 2**53 cents
+    signed = np.where(kind == CREDIT, -amount, amount)
+    balance = np.bincount(lease, weights=signed, minlength=leases).astype(np.int64)
+    paid = np.bincount(lease, weights=np.where(kind == CHARGE, 0, -signed), minlength=leases)
+    paid = np.maximum(paid.astype(np.int64), 0)
+
+    charges = kind == CHARGE
+    c_lease, c_amount, c_day = lease[charges], amount[charges], day[charges]
+    order = np.lexsort((c_day, c_lease))
+    c_lease, c_amount, c_day = c_lease[order], c_amount[order], c_day[order]
+    running = np.cumsum(c_amount)
+    if len(running):
+        starts = np.flatnonzero(np.r_[True, c_lease[1:] != c_lease[:-1]])
+        before = (running - c_amount)[starts]
+        running -= np.repeat(before, np.diff(np.r_[starts, len(c_lease)]))
+    outstanding = np.clip(running - paid[c_lease], 0, c_amount)
+
+    past_due = as_of - c_day
+    bucket = np.searchsorted(np.asarray(BUCKET_EDGES), past_due, side="left")
+    aged = np.bincount(
+        c_lease * len(BUCKETS) + bucket, weights=outstanding, minlength=leases * len(BUCKETS)
+    ).astype(np.int64).reshape(leases, len(BUCKETS))
+
+    late = (outstanding > 0) & (past_due > LATE_FEE_GRACE_DAYS)
+    fees = np.where(late, LATE_FEE_FLAT_CENTS + outstanding * LATE_FEE_RATE_BP // 10_000, 0)
+    exposure = np.bincount(c_lease, weights=fees, minlength=leases).astype(np.int64)
+
+    oldest = np.full(leases, -1, dtype=np.int64)
+    owing = outstanding > 0
+    np.maximum.at(oldest, c_lease[owing], past_due[owing])
+    return balance.tolist(), aged.tolist(), exposure.tolist(), oldest.tolist()
+
+
+def _compute_python(ledger: Ledger, as_of: int) -> tuple[list, list, list, list]:
+    leases = len(ledger.lease_ids)
+    balance = [0] * leases
+    paid = [0] * leases
+    charges: list[list[tuple[int, int]]] = [[] for _ in range(leases)]
+    for lease, kind, amount, day in zip(ledger.lease, ledger.kind, ledger.amount, ledger.day):
+        if kind == CHARGE:
+            balance[lease] += amount
+            charges[lease].append((day, amount))
+        elif kind == CREDIT:
+            balance[lease] -= amount
+            paid[lease] += amount
+        else:
+            balance[lease] += amount
+            paid[lease] -= amount
+
+    aged = [[0] * len(BUCKETS) for _ in range(leases)]
+    exposure = [0] * leases
+    oldest = [-1] * leases
+    for lease, lease_charges in enumerate(charges):
+        credit = max(paid[lease], 0)
+        running = 0
+        # stable on day, like the lexsort, so same-day charges fill in entry order
+        for day, amount in sorted(lease_charges, key=lambda charge: charge[0]):
+            running += amount
+            outstanding = min(max(running - credit, 0), amount)
+            past_due = as_of - day
+            bucket = 0
+            while bucket < len(BUCKET_EDGES) and past_due > BUCKET_EDGES[bucket]:
+                bucket += 1
+            aged[lease][bucket] += outstanding
+            if outstanding > 0:
+                if past_due > LATE_FEE_GRACE_DAYS:
+                    exposure[lease] += LATE_FEE_FLAT_CENTS + outstanding * LATE_FEE_RATE_BP // 10_000
+                oldest[lease] = max(oldest[lease], past_due)
+    return balance, aged, exposure, oldest
+
+
+def compute(ledger: Ledger, as_of: dt.date, engine: str = "auto") -> dict[str, Any]:
+    """Age `ledger` as of `as_of`. `engine` is "numpy", "python" or "auto"."""
+    if engine == "auto":
+        engine = "numpy" if numpy_available() else "python"
+    if engine == "numpy" and not numpy_available():
+        raise RuntimeError("numpy is not installed")
+    run = _compute_numpy if engine == "numpy" else _compute_python
+    balance, aged, exposure, oldest = run(ledger, as_of.toordinal())
+
+    leases = []
+    properties = [
+        {"rc_prop_id": prop_id, "leases": 0, "leases_in_arrears": 0, "balance_cents": 0,
+         **{name: 0 for name in BUCKETS}, "late_fee_exposure_cents": 0}
+        for prop_id in ledger.property_ids
+    ]
+    for index, lease_id in enumerate(ledger.lease_ids):
+        buckets = dict(zip(BUCKETS, aged[index]))
+        leases.append({
+            "lease_id": lease_id,
+            "rc_prop_id": ledger.property_ids[ledger.lease_property[index]],
+            "balance_cents": balance[index],
+            **buckets,
+            "late_fee_exposure_cents": exposure[index],
+            "oldest_days_past_due": oldest[index] if oldest[index] > 0 else 0,
+        })
+        rollup = properties[ledger.lease_property[index]]
+        rollup["leases"] += 1
+        rollup["leases_in_arrears"] += oldest[index] > 0
+        rollup["balance_cents"] += balance[index]
+        rollup["late_fee_exposure_cents"] += exposure[index]
+        for name, value in buckets.items():
+            rollup[name] += value
+    return {"as_of": as_of.isoformat(), "engine": engine, "leases": leases, "properties": properties}
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Address search: index build, per-keystroke query latency and incremental
+updates for a synthetic portfolio, against a linear scan of the same data.
+
+Queries replay typing "<number> <street> <suffix>" one keystroke at a time,
+plus a set of misspelled queries.
+
+    python benchmarks/bench_address_search.py --properties 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import address_index
+
+
+STREETS = [
+    "Main", "Maple", "Oak", "Pine", "Cedar", "Birch", "Elm", "Willow", "Spring", "Quinpool",
+    "Robie", "Barrington", "Agricola", "Gottingen", "Portland", "Windmill", "Herring Cove",
+    "Saint-Denis", "Sherbrooke", "Wellington", "King", "Queen", "Yonge", "Bloor", "Dundas",
+]
+SUFFIXES = ["Street", "Avenue", "Road", "Drive", "Court", "Boulevard", "Lane", "Crescent"]
+PLACES = [("Halifax", "NS"), ("Dartmouth", "NS"), ("Montréal", "QC"), ("Toronto", "ON"),
+          ("Ottawa", "ON"), ("Moncton", "NB"), ("Charlottetown", "PE")]
+LANDLORD = "landlord-0"
+
+
+def make_properties(count: int, landlords: int, rng: random.Random) -> list[dict]:
+    properties = []
+    for index in range(count):
+        municipality, province = rng.choice(PLACES)
+        address = f"{rng.randint(1, 3000)} {rng.choice(STREETS)} {rng.choice(SUFFIXES)}"
+        if rng.random() < 0.3:
+            address += f", Unit {rng.randint(1, 40)}"
+        properties.append({
+            "id": f"prop-{index:06d}", "rc_prop_id": f"prop-{index:06d}", "address": address,
+            "municipality": municipality, "province": province,
+            "landlord_id": f"landlord-{index % landlords}",
+        })
+    return properties
+
+
+def keystrokes(text: str) -> list[str]:
+    return [text[:end] for end in range(1, len(text) + 1)]
+
+
+def typo(word: str, rng: random.Random) -> str:
+    position = rng.randrange(1, len(word))
+    return word[:position] + word[position + 1:]
+
+
+def scan(properties: list[dict], query: str) -> list[dict]:
+    tokens = address_index.tokenize(query)
+    results = []
+    for document in properties:
+        if document["landlord_id"] != LANDLORD:
+            continue
+        text = address_index.normalize(
+            " ".join(document[field] for field in address_index.FIELDS)
+        )
+        if all(token in text for token in tokens):
+            results.append(document)
+    return results[:address_index.DEFAULT_LIMIT]
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {statistics.median(samples) * 1000:7.3f} ms   p99 {p99 * 1000:7.3f} ms"
+
+
+def run(count: int, landlords: int) -> None:
+    rng = random.Random(7)
+    properties = make_properties(count, landlords, rng)
+
+    started = time.perf_counter()
+    index = address_index.AddressIndex()
+    for document in properties:
+        index.upsert(document)
+    build = time.perf_counter() - started
+    print(f"properties: {count:,}, landlords: {landlords}, vocabulary: {len(index._vocabulary):,}")
+    print(f"build: {build * 1000:.0f} ms")
+
+    targets = [document for document in properties if document["landlord_id"] == LANDLORD]
+    typed = [query for document in rng.sample(targets, 20) for query in keystrokes(document["address"])]
+    misspelled = [
+        " ".join(typo(word, rng) if len(word) > 4 else word for word in document["address"].split())
+        for document in rng.sample(targets, 100)
+    ]
+
+    for label, queries in (("typed", typed), ("misspelled", misspelled)):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, LANDLORD)
+            samples.append(time.perf_counter() - started)
+        print(f"index, {label:10s} ({len(queries):4d} queries)  {percentiles(samples)}")
+
+    samples = []
+    for query in typed[:200]:
+        started = time.perf_counter()
+        scan(properties, query)
+        samples.append(time.perf_counter() - started)
+    print(f"linear scan, typed  ( 200 queries)  {percentiles(samples)}")
+
+    samples = []
+    for document in rng.sample(properties, 1000):
+        changed = {**document, "address": f"{rng.randint(1, 3000)} {rng.choice(STREETS)} Way"}
+        started = time.perf_counter()
+        index.upsert(changed)
+        samples.append(time.perf_counter() - started)
+    print(f"incremental upsert (1000 writes)        {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--properties", type=int, default=50_000)
+    parser.add_argument("--landlords", type=int, default=1)
+    args = parser.parse_args()
+    run(args.properties, args.landlords)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Arrears aging: NumPy engine against the pure-Python fallback on a synthetic ledger.
+
+Each lease gets five years of monthly rent charges, most months a payment
+(sometimes late, sometimes short), and the odd bounced payment with its NSF
+fee. Loading entries into columns is timed separately, both engines age the
+same columns, and their results are compared.
+
+    python benchmarks/bench_arrears.py --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import arrears
+
+
+START = dt.date(2020, 1, 1)
+
+
+def make_entries(rows: int, rng: random.Random) -> list[dict]:
+    entries: list[dict] = []
+    index = 0
+    while len(entries) < rows:
+        lease = {"lease_id": f"lease-{index:06d}", "rc_prop_id": f"prop-{index // 3:06d}"}
+        rent = rng.randrange(80_000, 300_000, 500)
+        for month in range(60):
+            due = dt.date(START.year + month // 12, month % 12 + 1, 1)
+            entries.append({**lease, "type": "scheduled_rent_charge", "amount_cents": rent, "due_date": due})
+            roll = rng.random()
+            if roll < 0.85:
+                paid = rent if roll < 0.75 else rent // 2
+                paid_on = due + dt.timedelta(days=rng.randrange(0, 40))
+                entries.append({**lease, "type": "payment_applied", "amount_cents": paid, "effective_date": paid_on})
+            elif roll < 0.88:
+                bounced = due + dt.timedelta(days=9)
+                entries.append({**lease, "type": "payment_reversal", "amount_cents": rent, "effective_date": bounced})
+                entries.append({**lease, "type": "nsf_fee", "amount_cents": 4_500, "due_date": bounced})
+        index += 1
+    return entries[:rows]
+
+
+def timed(label: str, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:28s} {best * 1000:9.1f} ms")
+    return result
+
+
+def run(rows: int, repeat: int) -> None:
+    entries = make_entries(rows, random.Random(11))
+    as_of = dt.date(START.year + 5, 1, 15)
+    ledger = timed("load columns", lambda: arrears.Ledger.from_entries(entries), repeat)
+    print(f"rows: {len(ledger):,}, leases: {len(ledger.lease_ids):,}, properties: {len(ledger.property_ids):,}")
+
+    python = timed("python engine", lambda: arrears.compute(ledger, as_of, engine="python"), repeat)
+    if not arrears.numpy_available():
+        print("numpy is not installed; skipping the vectorized engine")
+        return
+    vectorized = timed("numpy engine", lambda: arrears.compute(ledger, as_of, engine="numpy"), repeat)
+    same = vectorized["leases"] == python["leases"] and vectorized["properties"] == python["properties"]
+    print(f"identical results: {same}")
+    if not same:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Load test for the event_log SSE fan-out: thousands of subscribers on one loop.
+
+Each subscriber is a task draining `hub.stream(...)`, the same generator the
+route hands to StreamingResponse, so the measured cost includes buffering,
+coalescing and SSE framing. Sockets are left out. Every subscriber is scoped
+to the one landlord the events belong to, and filters are mixed: most watch
+one entity, some watch an entity type and a few watch the whole landlord. A
+configurable share of subscribers never reads, to show that slow consumers
+stay bounded. Reports publish cost, delivery latency and memory.
+
+    python benchmarks/bench_event_stream.py --subscribers 5000 --events 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import asyncio
+import pathlib
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import event_stream
+import metrics
+
+
+ENTITIES = 500
+LANDLORD = "landlord-000"
+
+
+def make_event(index: int) -> dict:
+    entity = index % ENTITIES
+    return {
+        "id": f"event-{index}",
+        "event_type": "unit.updated",
+        "entity_type": "unit",
+        "entity_id": f"unit-{entity}",
+        "context": {"landlord_id": LANDLORD},
+        "payload": {"fields": ["rent_cents"], "published_at": time.perf_counter()},
+    }
+
+
+async def no_upstream(since, until):
+    return
+    yield
+
+
+async def consume(stream, latencies: array.array) -> None:
+    async for chunk in stream:
+        received = time.perf_counter()
+        for line in chunk.split(b"\n"):
+            if line.startswith(b"data: {\"id\""):
+                marker = line.rfind(b'"published_at":')
+                published = float(line[marker + 15:line.index(b"}", marker)])
+                latencies.append(received - published)
+
+
+async def run(subscribers: int, events: int, slow_share: float, batch: int) -> None:
+    hub = event_stream.EventHub(no_upstream, poll_interval=3600, registry=metrics.MetricsRegistry())
+    latencies = array.array("d")
+    chooser = random.Random(0)
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+
+    tasks, slow = [], []
+    for index in range(subscribers):
+        if index % 100 == 0:
+            stream = hub.stream(LANDLORD)
+        elif index % 10 == 0:
+            stream = hub.stream(LANDLORD, "unit")
+        else:
+            stream = hub.stream(LANDLORD, "unit", f"unit-{index % ENTITIES}")
+        if chooser.random() < slow_share:
+            await anext(stream)  # subscribed, never read again
+            slow.append(stream)
+        else:
+            tasks.append(asyncio.create_task(consume(stream, latencies)))
+    await asyncio.sleep(0.1)
+    connected = tracemalloc.take_snapshot()
+
+    publish_seconds = []
+    for start in range(0, events, batch):
+        for index in range(start, min(start + batch, events)):
+            started = time.perf_counter()
+            hub.publish(make_event(index))
+            publish_seconds.append(time.perf_counter() - started)
+        await asyncio.sleep(0)  # one poll's worth, then let consumers run
+    await asyncio.sleep(0.5)
+    loaded = tracemalloc.take_snapshot()
+
+    def mib(after, before) -> float:
+        return sum(stat.size_diff for stat in after.compare_to(before, "filename")) / 2**20
+
+    latencies = sorted(latencies)
+    publish_seconds.sort()
+    print(f"subscribers: {len(hub)} ({len(slow)} never read), events: {events}")
+    print(f"publish p50 / p99:      {statistics.median(publish_seconds) * 1e6:9.1f} / "
+          f"{publish_seconds[int(len(publish_seconds) * 0.99)] * 1e6:9.1f} us")
+    if latencies:
+        print(f"delivery p50 / p99:     {latencies[len(latencies) // 2] * 1000:9.2f} / "
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:9.2f} ms  ({len(latencies):,} deliveries)")
+    print(f"memory, connected:      {mib(connected, baseline):9.2f} MiB")
+    print(f"memory, after events:   {mib(loaded, baseline):9.2f} MiB")
+    displaced = {labels[0]: value for labels, value in hub.displaced.values.items()}
+    print(f"displaced:              {displaced}")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for stream in slow:
+        await stream.aclose()
+    await hub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--slow-share", type=float, default=0.05)
+    parser.add_argument("--batch", type=int, default=50, help="events published per loop turn")
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.events, args.slow_share, args.batch))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Identifier normalization throughput: one batch request against one request per identifier.
+
+Runs on the in-memory datastore backend, so the numbers are the API's own
+cost (routing, dedupe, memo, record building, batched writes) without
+Firestore latency. The portfolio mixes Ontario and Nova Scotia properties;
+`--duplicates` is the share of items that repeat an earlier one, as
+re-submitted onboarding spreadsheets do. The batch is run twice: with a cold
+memo, then again with the memo warm.
+
+    python benchmarks/bench_identity_batch.py --identifiers 5000 --duplicates 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import httpx
+
+# one client address far outpaces any production rate limit
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("INTERNAL_JOB_TOKEN", "bench")
+
+import identity_oracle
+import identity_routes
+import main
+import repository
+
+
+URL = "/internal/identity-oracle/normalize"
+
+
+def make_items(count: int, duplicates: float, rng: random.Random) -> tuple[dict, list[dict]]:
+    properties = {}
+    items: list[dict] = []
+    for index in range(count):
+        if items and rng.random() < duplicates:
+            items.append(dict(rng.choice(items)))
+            continue
+        prop_id = f"prop-{index:06d}"
+        province = "ON" if index % 3 else "NS"
+        properties[prop_id] = {"rc_prop_id": prop_id, "province": province, "city": "Toronto"}
+        digits = 9 if province == "ON" else 8
+        raw = "".join(rng.choice("0123456789") for _ in range(digits))
+        identifier = f"{raw[:4]}-{raw[4:]}" if index % 2 else raw
+        items.append({"propertyId": prop_id, "identifier": identifier})
+    return {"properties": properties}, items
+
+
+async def run(count: int, duplicates: float, single: int, seed: int) -> None:
+    rng = random.Random(seed)
+    data, items = make_items(count, duplicates, rng)
+    headers = {"X-Internal-Job-Token": identity_routes.INTERNAL_JOB_TOKEN}
+    identity_oracle.MAX_BATCH_SIZE = max(identity_oracle.MAX_BATCH_SIZE, count)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        def reset() -> repository.MemoryRepository:
+            backend = repository.MemoryRepository(data)
+            repository.set_repository(backend)
+            return backend
+
+        reset()
+        identity_oracle.memos.clear()
+        started = time.perf_counter()
+        for item in items[:single]:
+            response = await client.post(URL, json={"items": [item]}, headers=headers)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        print(f"{'one request per identifier':30s} {single / elapsed:12,.0f} identifiers/s  ({single:,} requests)")
+
+        for label in ("batch, cold memo", "batch, warm memo"):
+            if label.endswith("cold memo"):
+                identity_oracle.memos.clear()
+            backend = reset()
+            started = time.perf_counter()
+            response = await client.post(URL, json={"items": items}, headers=headers)
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            body = response.json()
+            print(f"{label:30s} {count / elapsed:12,.0f} identifiers/s  "
+                  f"({elapsed * 1000:.1f} ms; {body['unique']:,} unique, {body['runsWritten']:,} runs, "
+                  f"{len(backend):,} documents stored)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--identifiers", type=int, default=5000)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--single", type=int, default=500, help="identifiers sent one request each")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    asyncio.run(run(args.identifiers, args.duplicates, args.single, args.seed))
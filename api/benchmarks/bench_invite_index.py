@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Invite validity checks: the token-hash index against a datastore read per check.
+
+For each index size, fills an `invite_index.InviteIndex` with open invites
+(expiries spread over a week) and times `get` for hits and misses while the
+clock moves forward, so lazy expiry is part of the measured cost. Flat
+per-check times across sizes show the check is O(1). The baseline reads
+each invite with `datastore.get_document` from the in-memory backend, which
+is still far cheaper than a Firestore round trip. The churn run then writes
+many times the entry cap in new, redeemed and expiring invites and reports
+the index and heap sizes, which stay bounded.
+
+    python benchmarks/bench_invite_index.py --sizes 1000 10000 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import datastore
+import invite_index
+import repository
+
+
+WEEK_MS = 7 * 24 * 3600 * 1000
+
+
+def fill(size: int, rng: random.Random) -> tuple[invite_index.InviteIndex, list[str]]:
+    index = invite_index.InviteIndex(max_entries=size)
+    hashes = [invite_index.hash_token(f"token-{i}") for i in range(size)]
+    for token_hash in hashes:
+        index.apply(token_hash, {"status": "pending", "expires_at": rng.uniform(1, WEEK_MS)}, now=0)
+    return index, hashes
+
+
+def per_check(index: invite_index.InviteIndex, hashes: list[str], checks: int, rng: random.Random) -> float:
+    probes = [rng.choice(hashes) for _ in range(checks)]
+    # the clock sweeps one hour across the run, expiring invites as it goes
+    step = 3600 * 1000 / checks
+    started = time.perf_counter()
+    now = 0.0
+    for token_hash in probes:
+        now += step
+        index.get(token_hash, now)
+    return (time.perf_counter() - started) / checks
+
+
+async def per_read(hashes: list[str], checks: int, rng: random.Random) -> float:
+    documents = {token_hash: {"status": "pending", "expires_at": WEEK_MS} for token_hash in hashes}
+    repository.set_repository(repository.MemoryRepository({invite_index.INVITES: documents}))
+    probes = [rng.choice(hashes) for _ in range(checks)]
+    started = time.perf_counter()
+    for token_hash in probes:
+        await datastore.get_document(invite_index.INVITES, token_hash)
+    return (time.perf_counter() - started) / checks
+
+
+def churn(cap: int, writes: int, rng: random.Random) -> None:
+    index = invite_index.InviteIndex(max_entries=cap)
+    peak_heap = 0
+    now = 0.0
+    for i in range(writes):
+        now += 60_000
+        token_hash = f"h{i}"
+        index.apply(token_hash, {"status": "pending", "expires_at": now + rng.uniform(0, WEEK_MS)}, now)
+        if i % 3 == 0:  # a third are redeemed a little later
+            index.apply(f"h{i // 2}", {"status": "redeemed"}, now)
+        peak_heap = max(peak_heap, index.heap_size)
+    print(f"churn: {writes:,} writes, cap {cap:,}: index {len(index):,}, heap {index.heap_size:,} "
+          f"(peak {peak_heap:,}), evicted {index.evicted:,}")
+
+
+def run(sizes: list[int], checks: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for size in sizes:
+        index, hashes = fill(size, rng)
+        hit = per_check(index, hashes, checks, rng)
+        missing = [invite_index.hash_token(f"unknown-{i}") for i in range(1000)]
+        miss = per_check(index, missing, checks, rng)
+        read = asyncio.run(per_read(hashes, min(checks, 20_000), rng))
+        print(f"{size:>9,} open: index hit {hit * 1e9:7.0f} ns   miss {miss * 1e9:7.0f} ns   "
+              f"datastore read {read * 1e9:9.0f} ns   ({read / hit:,.0f}x)")
+    churn(min(sizes), 20 * min(sizes), rng)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.checks, args.seed)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measure per-request overhead of MetricsMiddleware.
+
+Drives a bare ASGI app directly (no server, no HTTP parsing) with and without
+the middleware and reports the difference in microseconds per request.
+
+    python benchmarks/bench_metrics_middleware.py --requests 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import metrics
+
+
+class _Route:
+    path = "/landlords/{landlord_id}/dashboard"
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def run(app, count: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/landlords/l1/dashboard"}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        return None
+
+    started = time.perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started
+
+
+async def main(count: int, rounds: int) -> None:
+    wrapped = metrics.MetricsMiddleware(bare_app, metrics.MetricsRegistry())
+    await run(bare_app, 1000)
+    await run(wrapped, 1000)
+    bare = min([await run(bare_app, count) for _ in range(rounds)])
+    instrumented = min([await run(wrapped, count) for _ in range(rounds)])
+    overhead_us = (instrumented - bare) / count * 1e6
+    print(f"requests/round:         {count}")
+    print(f"bare app:               {bare / count * 1e6:.3f} us/request")
+    print(f"with MetricsMiddleware: {instrumented / count * 1e6:.3f} us/request")
+    print(f"middleware overhead:    {overhead_us:.3f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.rounds))
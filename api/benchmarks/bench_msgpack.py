@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+JSON against MessagePack for the list routes: payload size, encode and decode time.
+
+Seeds the bench_routes.py portfolio into the in-memory backend and fetches
+each list route twice through the app, once with the default JSON and once
+with `Accept: application/msgpack`. For each format it reports the body size
+(raw and gzipped as GZipMiddleware would send it), the server's encode time
+for the same content, the client's decode time (stdlib `json`, `orjson`
+when installed, `msgpack`), and the end-to-end request time over the ASGI
+transport. The overview is fetched for one added property with `--units`
+units and a lease on most of them (one document holding both lists); the
+ledger export is a stream with one record per entry.
+
+    python benchmarks/bench_msgpack.py --properties 100 --landlords 5 --units 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import pathlib
+import random
+import statistics
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import httpx
+
+# one client address far outpaces any production rate limit
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import main
+import repository
+import responses
+from bench_routes import make_portfolio
+
+
+MSGPACK = {"Accept": responses.MSGPACK_MEDIA_TYPE}
+
+
+def per_call(fn: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def ndjson_loads(body: bytes) -> list:
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def msgpack_stream_loads(body: bytes) -> list:
+    unpacker = responses.msgpack.Unpacker()
+    unpacker.feed(body)
+    return list(unpacker)
+
+
+def report(label: str, json_body: bytes, packed_body: bytes, repeat: int, stream: bool) -> None:
+    content = ndjson_loads(json_body) if stream else json.loads(json_body)
+    if stream:
+        encoders = {
+            "json": lambda: b"\n".join(responses.dumps(record) for record in content),
+            "msgpack": lambda: b"".join(responses.msgpack_dumps(record) for record in content),
+        }
+        decoders = {"json": lambda: ndjson_loads(json_body), "msgpack": lambda: msgpack_stream_loads(packed_body)}
+        if responses.orjson is not None:
+            decoders["orjson"] = lambda: [responses.orjson.loads(line) for line in json_body.splitlines()]
+    else:
+        encoders = {"json": lambda: responses.dumps(content), "msgpack": lambda: responses.msgpack_dumps(content)}
+        decoders = {"json": lambda: json.loads(json_body), "msgpack": lambda: responses.msgpack.unpackb(packed_body)}
+        if responses.orjson is not None:
+            decoders["orjson"] = lambda: responses.orjson.loads(json_body)
+
+    print(label)
+    for name, body in (("json", json_body), ("msgpack", packed_body)):
+        zipped = len(gzip.compress(body, compresslevel=main.GZIP_LEVEL))
+        print(f"  {name:8s} {len(body) / 1024:9,.1f} KiB   gzipped {zipped / 1024:8,.1f} KiB   "
+              f"encode {per_call(encoders[name], repeat):7.3f} ms")
+    for name, decode in decoders.items():
+        print(f"  decode with {name:8s} {per_call(decode, repeat):7.3f} ms")
+
+
+def add_large_property(data: dict, units: int, rng: random.Random) -> str:
+    prop_id = "prop-large"
+    data["properties"][prop_id] = {"rc_prop_id": prop_id, "landlord_id": "landlord-000", "city": "Toronto"}
+    for u in range(units):
+        unit_id = f"{prop_id}-u{u}"
+        data["units"][unit_id] = {
+            "unit_id": unit_id, "rc_prop_id": prop_id, "label": f"Unit {u + 1}",
+            "rent": rng.randint(900, 3200), "bedrooms": rng.randint(0, 3), "status": "occupied",
+        }
+        if rng.random() < 0.85:
+            lease_id = f"lease-{unit_id}"
+            data["leases"][lease_id] = {
+                "lease_id": lease_id, "rc_prop_id": prop_id, "unit_id": unit_id, "tenant_id": f"tenant-{unit_id}",
+                "status": "active", "start_date": "2025-09-01", "end_date": "2026-08-31",
+                "monthly_rent_cents": rng.randint(90_000, 320_000),
+            }
+    return prop_id
+
+
+async def run(properties: int, landlords: int, units: int, requests: int, repeat: int, seed: int) -> None:
+    rng = random.Random(seed)
+    data = make_portfolio(properties, landlords, rng)
+    prop_id = add_large_property(data, units, rng)
+    repository.set_repository(repository.MemoryRepository(data))
+    entries = sum(entry["landlord_id"] == "landlord-000" for entry in data["ledger_entries"].values())
+    routes = (
+        (f"GET /properties/{{id}}/overview ({units} units)", f"/properties/{prop_id}/overview", False),
+        (f"GET /landlords/{{id}}/ledger/export ({entries:,} entries)",
+         "/landlords/landlord-000/ledger/export?page_size=1000", True),
+    )
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, url, stream in routes:
+            json_response = await client.get(url)
+            packed_response = await client.get(url, headers=MSGPACK)
+            for response in (json_response, packed_response):
+                response.raise_for_status()
+            assert packed_response.headers["content-type"] == responses.MSGPACK_MEDIA_TYPE
+            report(label, json_response.content, packed_response.content, repeat, stream)
+
+            for name, headers in (("json", {}), ("msgpack", MSGPACK)):
+                samples = []
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    (await client.get(url, headers=headers)).raise_for_status()
+                    samples.append(time.perf_counter() - started)
+                print(f"  request  {name:8s} p50 {statistics.median(samples) * 1000:7.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--properties", type=int, default=100)
+    parser.add_argument("--landlords", type=int, default=5)
+    parser.add_argument("--units", type=int, default=500, help="units on the overview property")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50, help="encode/decode repetitions")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    if responses.msgpack is None:
+        raise SystemExit("msgpack is not installed")
+    asyncio.run(run(args.properties, args.landlords, args.units, args.requests, args.repeat, args.seed))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Profiler middleware overhead: unprofiled and profiled requests against a bare ASGI app.
+
+Drives the middleware directly with ASGI messages (no HTTP client, no
+server), so the numbers are the middleware's own cost per request.
+
+    python benchmarks/bench_profiler.py --requests 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import metrics
+import profiler
+
+
+HEADERS = [(b"host", b"api"), (b"accept", b"application/json"), (b"user-agent", b"bench")]
+
+
+async def endpoint(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive() -> dict:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+async def per_request(app, count: int, headers: list) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/health", "headers": headers}
+    started = time.perf_counter()
+    for _ in range(count):
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / count
+
+
+def middleware(**options) -> profiler.ProfilerMiddleware:
+    return profiler.ProfilerMiddleware(
+        endpoint, profiles=profiler.ProfileBuffer(), registry=metrics.MetricsRegistry(), **options
+    )
+
+
+async def run(count: int) -> None:
+    cases = [
+        ("bare app", endpoint, HEADERS),
+        ("off (no token, rate 0)", middleware(token="", sample_rate=0), HEADERS),
+        ("token set, rate 0", middleware(token="secret", sample_rate=0), HEADERS),
+        ("token set, rate 0.01", middleware(token="secret", sample_rate=0.01), HEADERS),
+        ("profiled (header)", middleware(token="secret"), HEADERS + [(b"x-debug-profile", b"secret")]),
+    ]
+    baseline = None
+    for label, app, headers in cases:
+        runs = count if "profiled" not in label else max(1, count // 100)
+        seconds = await per_request(app, runs, headers)
+        baseline = seconds if baseline is None else baseline
+        print(f"{label:26s} {seconds * 1e6:8.2f} us/request   (+{(seconds - baseline) * 1e6:6.2f} us)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Route latency against the in-memory datastore backend, no network involved.
+
+Seeds a synthetic portfolio (landlords, properties, units, leases,
+applications, ledger entries) into `repository.MemoryRepository`, starts
+the app's lifespan, and drives the read routes through httpx's ASGI
+transport. The seed is fixed by `--seed`, so runs are comparable across
+commits. The numbers cover routing, middleware, caching, serialization and
+the repository layer; Firestore round trips are left out on purpose.
+
+    python benchmarks/bench_routes.py --properties 2000 --requests 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import os
+import pathlib
+import random
+import statistics
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import httpx
+
+# one client address far outpaces any production rate limit
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import main
+import repository
+
+
+UNITS_PER_PROPERTY = 8
+ENTRIES_PER_LEASE = 12
+
+
+def make_portfolio(properties: int, landlords: int, rng: random.Random) -> dict:
+    data: dict[str, dict[str, dict]] = {
+        "properties": {}, "units": {}, "leases": {}, "applications": {}, "tenants": {}, "ledger_entries": {},
+    }
+    start = dt.datetime(2025, 1, 1, tzinfo=dt.timezone.utc)
+    for p in range(properties):
+        prop_id = f"prop-{p:05d}"
+        landlord_id = f"landlord-{p % landlords:03d}"
+        data["properties"][prop_id] = {
+            "rc_prop_id": prop_id, "landlord_id": landlord_id,
+            "address": f"{rng.randint(1, 9999)} {rng.choice(['Main', 'Oak', 'King', 'Queen'])} St",
+            "city": rng.choice(["Toronto", "Ottawa", "Halifax", "Calgary"]),
+        }
+        for u in range(UNITS_PER_PROPERTY):
+            unit_id = f"{prop_id}-u{u}"
+            data["units"][unit_id] = {"unit_id": unit_id, "rc_prop_id": prop_id, "rent": rng.randint(900, 3200)}
+            if rng.random() < 0.85:
+                lease_id = f"lease-{unit_id}"
+                tenant_id = f"tenant-{unit_id}"
+                data["tenants"][tenant_id] = {"display_name": f"Tenant {unit_id}"}
+                data["leases"][lease_id] = {
+                    "lease_id": lease_id, "rc_prop_id": prop_id, "unit_id": unit_id, "tenant_id": tenant_id,
+                    "status": "active",
+                }
+                for month in range(ENTRIES_PER_LEASE):
+                    entry_id = f"{lease_id}-{month}"
+                    data["ledger_entries"][entry_id] = {
+                        "landlord_id": landlord_id, "lease_id": lease_id, "type": "scheduled_rent_charge",
+                        "amount_cents": 150_000, "due_date": f"2025-{month + 1:02d}-01",
+                        "created_at": start + dt.timedelta(days=30 * month, seconds=len(data["ledger_entries"])),
+                    }
+            else:
+                application_id = f"app-{unit_id}"
+                data["applications"][application_id] = {
+                    "application_id": application_id, "rc_prop_id": prop_id, "status": "submitted",
+                }
+    return data
+
+
+def routes(data: dict, rng: random.Random) -> dict[str, Callable[[], str]]:
+    prop_ids = list(data["properties"])
+    unit_ids = list(data["units"])
+    landlords = sorted({prop["landlord_id"] for prop in data["properties"].values()})
+    return {
+        "GET /health/db": lambda: "/health/db",
+        "GET /properties/{id}": lambda: f"/properties/{rng.choice(prop_ids)}",
+        "GET /units/{id}": lambda: f"/units/{rng.choice(unit_ids)}",
+        "GET /properties/{id}/overview": lambda: f"/properties/{rng.choice(prop_ids)}/overview",
+        "GET overview ?fields=units.rent": lambda: f"/properties/{rng.choice(prop_ids)}/overview?fields=units.rent",
+        "GET /landlords/{id}/properties/search": (
+            lambda: f"/landlords/{rng.choice(landlords)}/properties/search?q=main"
+        ),
+        "GET /landlords/{id}/kpis": lambda: f"/landlords/{rng.choice(landlords)}/kpis",
+        "GET /landlords/{id}/ledger/export": lambda: f"/landlords/{rng.choice(landlords)}/ledger/export?page_size=500",
+    }
+
+
+async def run(properties: int, landlords: int, requests: int, seed: int) -> None:
+    rng = random.Random(seed)
+    data = make_portfolio(properties, landlords, rng)
+    backend = repository.MemoryRepository(data)
+    repository.set_repository(backend)
+    print(f"seeded {len(backend):,} documents ({properties:,} properties, {landlords} landlords)")
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for label, path in routes(data, rng).items():
+                await client.get(path())  # warm caches and indexes once
+                samples = []
+                for _ in range(requests):
+                    url = path()
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    samples.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        raise SystemExit(f"{label}: {url} returned {response.status_code}")
+                samples.sort()
+                p50 = statistics.median(samples) * 1000
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+                print(f"{label:40s} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+    print(f"full collection scans: {backend.scans:,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--properties", type=int, default=2000)
+    parser.add_argument("--landlords", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(run(args.properties, args.landlords, args.requests, args.seed))
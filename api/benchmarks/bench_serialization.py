@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compare JSON serialization paths for a 10k-row dashboard payload.
+
+- fastapi default: jsonable_encoder + JSONResponse (what a plain dict return costs)
+- FastJSONResponse with orjson (when installed)
+- FastJSONResponse stdlib fallback
+Also reports bytes on the wire with and without gzip at the app's level.
+
+    python benchmarks/bench_serialization.py --rows 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gzip
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main
+import responses
+
+
+def make_rows(count: int) -> list[dict]:
+    start = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+    return [
+        {
+            "id": f"application-{index:06d}",
+            "application_id": f"application-{index:06d}",
+            "rc_prop_id": f"prop-{index % 250:04d}",
+            "status": ("submitted", "screening", "approved", "declined")[index % 4],
+            "applicant_name": f"Applicant {index}",
+            "monthly_income_cents": 450_000 + index,
+            "submitted_at": start + dt.timedelta(minutes=index),
+            "documents": [f"doc-{index}-a", f"doc-{index}-b"],
+            "screening": {"score": 600 + index % 200, "flags": []},
+        }
+        for index in range(count)
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def run(rows: int, repeat: int) -> None:
+    payload = {"items": make_rows(rows)}
+    cases = {
+        "fastapi default (jsonable_encoder)": lambda: JSONResponse(jsonable_encoder(payload)).body,
+        "stdlib fallback": lambda: responses.stdlib_dumps(payload),
+    }
+    if responses.orjson is not None:
+        cases["FastJSONResponse (orjson)"] = lambda: responses.FastJSONResponse(payload).body
+
+    print(f"rows: {rows}, median of {repeat}")
+    for name, fn in cases.items():
+        print(f"{name:36s} {timed(fn, repeat):8.2f} ms")
+
+    body = responses.FastJSONResponse(payload).body
+    compressed = gzip.compress(body, compresslevel=main.GZIP_LEVEL)
+    gzip_ms = timed(lambda: gzip.compress(body, compresslevel=main.GZIP_LEVEL), repeat)
+    print(f"bytes on wire, identity:             {len(body):>10,}")
+    print(f"bytes on wire, gzip level {main.GZIP_LEVEL}:          {len(compressed):>10,}"
+          f"  ({len(compressed) / len(body):.1%}, {gzip_ms:.2f} ms to compress)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Measure API cold start: import time, app construction and first request.
+
+Each sample runs in a fresh interpreter so module caches don't hide import
+cost. The first request goes to /health through an in-process ASGI client,
+so it includes lazy initialization but no network.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+
+
+API_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+built = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    client.get("/health")
+    first = time.perf_counter()
+    client.get("/health")
+    second = time.perf_counter()
+heavy = sorted(name for name in ("google.cloud.firestore", "grpc") if name in sys.modules)
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (built - imported) * 1000,
+    "lifespan_startup_ms": (ready - built) * 1000,
+    "first_request_ms": (first - ready) * 1000,
+    "warm_request_ms": (second - first) * 1000,
+    "heavy_modules_loaded": heavy,
+}))
+"""
+
+
+def sample() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=API_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs: int) -> None:
+    samples = [sample() for _ in range(runs)]
+    print(f"runs: {runs}")
+    for key in ("import_ms", "create_app_ms", "lifespan_startup_ms", "first_request_ms", "warm_request_ms"):
+        values = [item[key] for item in samples]
+        print(f"{key:22s} median {statistics.median(values):8.2f}  max {max(values):8.2f}")
+    print(f"heavy modules loaded at startup: {samples[-1]['heavy_modules_loaded'] or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.runs)
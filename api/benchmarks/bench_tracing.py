@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tracing overhead: instrumented routes with sampling off, and with every request traced.
+
+First times one `tracing.span()` block on its own: outside a trace (the
+shared no-op every instrumented call pays when sampling is off) and inside
+one. Then drives two routes from bench_routes.py over the in-memory backend
+with half the requests traced, once into memory and once to a rotating
+JSONL file. The traced/untraced difference is what tracing costs a
+sampled request. The no-op cost times the spans in a request is what the
+instrumentation costs everyone else.
+
+    python benchmarks/bench_tracing.py --properties 500 --requests 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import httpx
+
+# one client address far outpaces any production rate limit
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import main
+import repository
+import tracing
+from bench_routes import make_portfolio
+
+
+def per_span(iterations: int) -> tuple[float, float, float]:
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        pass
+    empty = time.perf_counter_ns() - started
+
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        with tracing.span("datastore.get", collection="units"):
+            pass
+    noop = time.perf_counter_ns() - started
+
+    exporter = tracing.MemoryExporter()
+    traced = 0
+    # one trace per 100 spans, as a request with a large overview would have
+    for _ in range(iterations // 100):
+        with tracing.start_trace("bench", exporter=exporter):
+            started = time.perf_counter_ns()
+            for _ in range(100):
+                with tracing.span("datastore.get", collection="units"):
+                    pass
+            traced += time.perf_counter_ns() - started
+    return empty / iterations, (noop - empty) / iterations, traced / (iterations // 100 * 100)
+
+
+async def drive(label: str | None, data: dict, requests: int, seed: int) -> None:
+    """Half the requests are traced, picked at random, so both halves see the same conditions."""
+    rng = random.Random(seed)
+    prop_ids = list(data["properties"])
+    app = main.create_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/properties/{}", "/properties/{}/overview"):
+            samples: dict[bool, list[float]] = {False: [], True: []}
+            for _ in range(requests):
+                url = path.format(rng.choice(prop_ids))
+                started = time.perf_counter()
+                response = await client.get(url)
+                elapsed = time.perf_counter() - started
+                response.raise_for_status()
+                samples["x-trace-id" in response.headers].append(elapsed)
+            if label is not None:
+                off, on = (statistics.median(samples[traced]) * 1000 for traced in (False, True))
+                print(f"{label:16s} GET {path.format('{id}'):26s} not traced p50 {off:7.3f} ms   "
+                      f"traced p50 {on:7.3f} ms   ({(on - off) * 1000:+.0f} us)")
+
+
+async def run(properties: int, requests: int, seed: int) -> None:
+    data = make_portfolio(properties, 20, random.Random(seed))
+    repository.set_repository(repository.MemoryRepository(data))
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl = tracing.JsonlExporter(os.path.join(directory, "traces.jsonl"), max_bytes=5 * 1024 * 1024, backups=2)
+        # the first pass warms the datastore caches and is not reported
+        modes = ((None, tracing.MemoryExporter()), ("memory exporter", tracing.MemoryExporter()),
+                 ("JSONL exporter", jsonl))
+        # the middleware reads these when the app builds its stack, on its first request
+        tracing.SAMPLE_RATE = 0.5
+        for label, exporter in modes:
+            tracing.default_exporter = exporter
+            await drive(label, data, requests, seed)
+        jsonl.close()
+        written = sum(path.stat().st_size for path in pathlib.Path(directory).iterdir())
+        print(f"{written / 1024:,.0f} KiB of spans on disk (rotated at 5 MiB, 2 backups)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--properties", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    empty, noop, traced = per_span(args.iterations)
+    print(f"span outside a trace (no-op): {noop:6.0f} ns   inside a trace: {traced:6.0f} ns   "
+          f"(empty loop {empty:.0f} ns)")
+    asyncio.run(run(args.properties, args.requests, args.seed))
@@ -0,0 +1,186 @@
+"""
+Bounded in-process read-through cache for hot documents.
+
+One `TTLCache` per collection, each with its own TTL and entry cap; the least
+recently used entry is evicted when a cache is full. A cache given a `weigh`
+function and `max_bytes` also evicts until the weights of its entries fit
+the byte budget. Writes made through
+`datastore` invalidate the affected key, and a per-cache generation counter
+stops a read that raced with a write from storing the stale document.
+
+Hit, miss, eviction and expiry counters are published on /metrics.
+"""
+
+from __future__ import annotations
+
+import collections
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+import metrics
+
+
+MISSING = object()
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# collection -> (ttl seconds, max entries)
+CACHE_CONFIG = {
+    "properties": (
+        _env_float("CACHE_PROPERTIES_TTL_SECONDS", 60),
+        _env_int("CACHE_PROPERTIES_MAX_ENTRIES", 5_000),
+    ),
+    "units": (
+        _env_float("CACHE_UNITS_TTL_SECONDS", 30),
+        _env_int("CACHE_UNITS_MAX_ENTRIES", 20_000),
+    ),
+}
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+        max_bytes: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        if (max_bytes is None) != (weigh is None):
+            raise ValueError("max_bytes and weigh go together")
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._weigh = weigh
+        self._clock = clock
+        # key -> (expires at, value, weight)
+        self._entries: collections.OrderedDict[str, tuple[float, Any, int]] = collections.OrderedDict()
+        self.bytes = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every invalidation; compare before storing a slow load."""
+        return self._generation
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value, weight = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.bytes -= weight
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        weight = self._weigh(value) if self._weigh is not None else 0
+        previous = self._entries.get(key)
+        if previous is not None:
+            self.bytes -= previous[2]
+        self._entries[key] = (self._clock() + self.ttl, value, weight)
+        self._entries.move_to_end(key)
+        self.bytes += weight
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.bytes > self.max_bytes and self._entries
+        ):
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        self._generation += 1
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self.bytes = 0
+
+    async def read_through(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        generation = self._generation
+        value = await load()
+        if generation == self._generation:
+            self.set(key, value)
+        return value
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+caches: dict[str, TTLCache] = {
+    collection: TTLCache(collection, ttl, max_entries)
+    for collection, (ttl, max_entries) in CACHE_CONFIG.items()
+}
+# document versions (Firestore update_time) for ETags, kept apart from the
+# documents so a version check never needs the full document
+versions: dict[str, TTLCache] = {
+    collection: TTLCache(f"{collection}_versions", ttl, max_entries)
+    for collection, (ttl, max_entries) in CACHE_CONFIG.items()
+}
+
+
+def invalidate(collection: str, key: str) -> None:
+    for registry in (caches, versions):
+        cache = registry.get(collection)
+        if cache is not None:
+            cache.invalidate(key)
+
+
+def clear_all() -> None:
+    """Empty every cache and zero its counters, as at process start."""
+    for registry in (caches, versions):
+        for cache in registry.values():
+            cache.clear()
+            cache.hits = cache.misses = cache.evictions = cache.expirations = 0
+
+
+def _collector(stat: str) -> Callable[[], list[tuple[dict[str, str], float]]]:
+    return lambda: [({"collection": name}, cache.stats()[stat]) for name, cache in caches.items()]
+
+
+for _stat, _kind in (
+    ("hits", "counter"),
+    ("misses", "counter"),
+    ("evictions", "counter"),
+    ("expirations", "counter"),
+    ("size", "gauge"),
+):
+    _name = f"cache_{_stat}_total" if _kind == "counter" else "cache_entries"
+    metrics.REGISTRY.register_collector(_name, f"Document cache {_stat} by collection.", _kind, _collector(_stat))
@@ -0,0 +1,229 @@
+"""
+Datastore access for API routes.
+
+Thin async helpers over the configured `repository` backend (the pooled
+Firestore client in production). Documents are returned as plain dicts with
+the document ID under "id", the same shape the Node API uses
+(`{ id: doc.id, ...doc.data() }`).
+
+Cached collections hold each document together with the version token of
+the read that returned it; `get_versioned` hands out both, so a body and
+its ETag never come from different reads.
+
+Reads of cached collections go through `cache`; every write made here
+invalidates the cached copy, so routes never have to remember to. Cache misses
+and queries are coalesced by `singleflight`, so identical concurrent reads
+share one RPC. Cached and coalesced documents are copied for each caller,
+nested maps and lists included. Each backend call is a `tracing` span
+(`datastore.get`, `datastore.query`, ...); cache hits are not.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Iterable, Sequence
+
+import cache
+import repository
+import singleflight
+import tracing
+
+
+Document = repository.Document
+Filter = repository.Filter
+
+Conflict = repository.Conflict
+copy_document = repository.copy_document
+
+MAX_BATCH_WRITES = repository.MAX_BATCH_WRITES
+
+
+async def _fetch(collection: str, doc_id: str, metadata_only: bool = False) -> tuple[Document | None, str | None]:
+    version_cache = cache.versions.get(collection)
+    generation = version_cache.generation if version_cache is not None else 0
+    with tracing.span("datastore.get", collection=collection, metadata_only=metadata_only):
+        document, version = await repository.get_repository().get(
+            collection, doc_id, metadata_only=metadata_only
+        )
+    if version_cache is not None and version_cache.generation == generation:
+        version_cache.set(doc_id, version)
+    return document, version
+
+
+async def _fetch_version(collection: str, doc_id: str) -> str | None:
+    _, version = await _fetch(collection, doc_id, metadata_only=True)
+    return version
+
+
+async def get_version(collection: str, doc_id: str) -> str | None:
+    """Version token (update time) of a document, or None if it doesn't exist."""
+    version_cache = cache.versions.get(collection)
+    if version_cache is not None:
+        version = version_cache.get(doc_id)
+        if version is not cache.MISSING:
+            return version
+    version, _ = await singleflight.flights.do(
+        ("version", collection, doc_id), lambda: _fetch_version(collection, doc_id)
+    )
+    return version
+
+
+async def _coalesced_fetch(collection: str, doc_id: str) -> tuple[Document | None, str | None]:
+    pair, _ = await singleflight.flights.do(("get", collection, doc_id), lambda: _fetch(collection, doc_id))
+    return pair
+
+
+async def get_versioned(collection: str, doc_id: str) -> tuple[Document | None, str | None]:
+    """
+    A document and its version token from the same read (or the same cache
+    entry), so an ETag built from the version always describes the body.
+    """
+    document_cache = cache.caches.get(collection)
+    if document_cache is None:
+        document, version = await _coalesced_fetch(collection, doc_id)
+    else:
+        document, version = await document_cache.read_through(
+            doc_id, lambda: _coalesced_fetch(collection, doc_id)
+        )
+    # callers get their own copy so they cannot mutate a shared or cached one
+    return (copy_document(document) if document is not None else None), version
+
+
+async def get_document(collection: str, doc_id: str) -> Document | None:
+    document, _ = await get_versioned(collection, doc_id)
+    return document
+
+
+async def get_documents(collection: str, doc_ids: Iterable[str]) -> dict[str, Document]:
+    """
+    Batched multi-get: one `get_all` RPC for every ID not already cached.
+    Missing documents are left out of the result.
+    """
+    document_cache = cache.caches.get(collection)
+    found: dict[str, Document] = {}
+    wanted: list[str] = []
+    for doc_id in dict.fromkeys(doc_ids):
+        cached = document_cache.get(doc_id) if document_cache is not None else cache.MISSING
+        if cached is cache.MISSING:
+            wanted.append(doc_id)
+        elif cached[0] is not None:
+            found[doc_id] = copy_document(cached[0])
+    if not wanted:
+        return found
+
+    version_cache = cache.versions.get(collection)
+    generation = document_cache.generation if document_cache is not None else 0
+    version_generation = version_cache.generation if version_cache is not None else 0
+    with tracing.span("datastore.get_many", collection=collection, count=len(wanted)):
+        fetched = await repository.get_repository().get_many(collection, wanted)
+    # documents and versions are stored as the pairs they were read as
+    if document_cache is not None and document_cache.generation == generation:
+        for doc_id in wanted:
+            document_cache.set(doc_id, fetched.get(doc_id, (None, None)))
+    if version_cache is not None and version_cache.generation == version_generation:
+        for doc_id in wanted:
+            version_cache.set(doc_id, fetched.get(doc_id, (None, None))[1])
+    for doc_id in wanted:
+        if doc_id in fetched:
+            found[doc_id] = copy_document(fetched[doc_id][0])
+    return found
+
+
+async def set_document(
+    collection: str, doc_id: str, data: dict[str, Any], merge: bool = False
+) -> None:
+    with tracing.span("datastore.set", collection=collection):
+        await repository.get_repository().set(collection, doc_id, data, merge=merge)
+    singleflight.flights.forget(("get", collection, doc_id))
+    singleflight.flights.forget(("version", collection, doc_id))
+    cache.invalidate(collection, doc_id)
+
+
+async def update_document(collection: str, doc_id: str, data: dict[str, Any], version: str) -> None:
+    """
+    Set the fields in `data` only if the document is still at `version` (from
+    `get_versioned`); raises `Conflict` if another write got there first.
+    """
+    with tracing.span("datastore.update", collection=collection):
+        await repository.get_repository().update(collection, doc_id, data, version)
+    singleflight.flights.forget(("get", collection, doc_id))
+    singleflight.flights.forget(("version", collection, doc_id))
+    cache.invalidate(collection, doc_id)
+
+
+async def set_documents(collection: str, documents: dict[str, dict[str, Any]]) -> None:
+    """Write many documents with batched commits."""
+    items = list(documents.items())
+    with tracing.span("datastore.set_many", collection=collection, count=len(items)):
+        await repository.get_repository().set_many(collection, items)
+    for doc_id, _ in items:
+        singleflight.flights.forget(("get", collection, doc_id))
+        singleflight.flights.forget(("version", collection, doc_id))
+        cache.invalidate(collection, doc_id)
+
+
+async def query_page(
+    collection: str,
+    *,
+    filters: Sequence[Filter] = (),
+    order_by: Sequence[str] = (),
+    start_after: Sequence[Any] | None = None,
+    limit: int,
+    select: Sequence[str] | None = None,
+) -> list[Document]:
+    """
+    Fetch one page of a query ordered by `order_by` plus document ID.
+
+    `start_after` holds the values of the last document of the previous page,
+    one per `order_by` field followed by the document ID. `select` limits the
+    fields read (a Firestore projection); paging a projected query needs the
+    `order_by` fields in it. Identical queries already in flight are joined
+    rather than re-issued.
+    """
+    key = (
+        "query",
+        singleflight.fingerprint(collection, filters, order_by, start_after, limit, select),
+    )
+    page, shared = await singleflight.flights.do(
+        key,
+        lambda: _query_page(collection, filters, order_by, start_after, limit, select),
+    )
+    return [copy_document(doc) for doc in page] if shared else page
+
+
+async def _query_page(
+    collection: str,
+    filters: Sequence[Filter],
+    order_by: Sequence[str],
+    start_after: Sequence[Any] | None,
+    limit: int,
+    select: Sequence[str] | None = None,
+) -> list[Document]:
+    with tracing.span("datastore.query", collection=collection, limit=limit) as query_span:
+        page = await repository.get_repository().query(collection, filters, order_by, start_after, limit, select)
+        query_span.set(count=len(page))
+    return page
+
+
+async def query_all(
+    collection: str,
+    *,
+    filters: Sequence[Filter] = (),
+    order_by: Sequence[str] = (),
+    page_size: int = 500,
+    select: Sequence[str] | None = None,
+) -> AsyncIterator[Document]:
+    """Iterate every match, one `query_page` at a time."""
+    if select is not None:
+        select = list(dict.fromkeys([*select, *order_by]))
+    start_after = None
+    while True:
+        page = await query_page(
+            collection, filters=filters, order_by=order_by, start_after=start_after, limit=page_size,
+            select=select,
+        )
+        for document in page:
+            yield document
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        start_after = [last.get(field) for field in order_by] + [last["id"]]
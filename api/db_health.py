@@ -0,0 +1,103 @@
+"""
+Datastore readiness probe for /health/db.
+
+The probe pings the configured `repository` backend (one document read through
+the shared pool on Firestore) and caches the result for a short TTL, so load
+balancer polling never turns into database traffic. Concurrent callers during
+a refresh wait on the same probe instead of issuing their own read. Recent
+probe latencies are kept in a fixed window for p50/p99.
+
+The timeout covers the whole ping, including waiting for a pool slot, so an
+exhausted pool reports 503 rather than hanging the health check.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import os
+import time
+from typing import Any, Callable
+
+import repository
+
+
+HEALTH_TTL_SECONDS = float(os.getenv("HEALTH_DB_TTL_SECONDS", "5"))
+HEALTH_TIMEOUT_SECONDS = float(os.getenv("HEALTH_DB_TIMEOUT_SECONDS", "2"))
+LATENCY_WINDOW = 256
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class DbHealthProbe:
+    def __init__(
+        self,
+        repository_getter: Callable[[], repository.Repository] = repository.get_repository,
+        ttl: float = HEALTH_TTL_SECONDS,
+        timeout: float = HEALTH_TIMEOUT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._repository_getter = repository_getter
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._latencies: collections.deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+        self._result: dict[str, Any] | None = None
+        self._checked_at = 0.0
+        self._lock: asyncio.Lock | None = None
+        self.probes = 0
+
+    def _fresh(self) -> bool:
+        return self._result is not None and self._clock() - self._checked_at < self.ttl
+
+    async def check(self) -> dict[str, Any]:
+        if self._fresh():
+            return {**self._result, "cached": True}
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._fresh():
+                return {**self._result, "cached": True}
+            self._result = await self._probe()
+            self._checked_at = self._clock()
+            return {**self._result, "cached": False}
+
+    async def _probe(self) -> dict[str, Any]:
+        self.probes += 1
+        started = time.perf_counter()
+        error = None
+        backend = self._repository_getter()
+        try:
+            # backend.ping() acquires its pool slot inside this deadline
+            async with asyncio.timeout(self.timeout):
+                await backend.ping()
+        except Exception as exc:  # any failure means "not ready"
+            error = f"{type(exc).__name__}: {exc}"
+        elapsed = time.perf_counter() - started
+        if error is None:
+            self._latencies.append(elapsed)
+
+        samples = list(self._latencies)
+        result: dict[str, Any] = {
+            "status": "ok" if error is None else "error",
+            "service": "rentchain-api",
+            "database": backend.name,
+            "latency_ms": {
+                "last": round(elapsed * 1000, 3),
+                "p50": round(percentile(samples, 0.50) * 1000, 3),
+                "p99": round(percentile(samples, 0.99) * 1000, 3),
+            },
+            "samples": len(samples),
+        }
+        if error is not None:
+            result["error"] = error
+        return result
+
+
+probe = DbHealthProbe()
@@ -0,0 +1,90 @@
+"""
+ETags and conditional GET.
+
+Document routes derive the ETag from the document's version (its Firestore
+update time). When a request carries `If-None-Match`, the version comes from
+`datastore.get_version` (version cache or a metadata-only read) and a match
+gets a 304 before the document is loaded or serialized. Otherwise the tag
+is built from the version read together with the body
+(`datastore.get_versioned`), so a 200 is never tagged with a version newer
+than the document it carries. Composite responses
+use a hash of the serialized body instead: the 304 still saves the bytes on
+the wire.
+
+Tags are weak (`W/"..."`) because GZip changes the bytes of a
+representation without changing its meaning. A MessagePack body is a
+different representation, so version tags include the negotiated media type
+(body hashes differ anyway), and both 200s and 304s carry `Vary: Accept` so
+a cache never answers one `Accept` with the other's tag.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from responses import MSGPACK_MEDIA_TYPE, FastJSONResponse, wants_msgpack
+
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def _digest(*parts: str | bytes) -> str:
+    hasher = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        hasher.update(part.encode() if isinstance(part, str) else part)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def for_version(collection: str, doc_id: str, version: str, variant: str = "") -> str:
+    """
+    `variant` tells apart representations of one version, such as `fields=`
+    projections; the negotiated media type is added to it here.
+    """
+    if wants_msgpack():
+        variant = f"{variant};{MSGPACK_MEDIA_TYPE}"
+    parts = (collection, doc_id, version, variant) if variant else (collection, doc_id, version)
+    return f'W/"{_digest(*parts)}"'
+
+
+def for_body(body: bytes) -> str:
+    return f'W/"{_digest(body)}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(request: Request, tag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 9110 requires for GET."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(tag)
+    return any(_opaque(candidate) == wanted for candidate in header.split(","))
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept"})
+
+
+def tagged(response: Response, tag: str) -> Response:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers.add_vary_header("Accept")
+    return response
+
+
+def hashed_response(request: Request, content: Any) -> Response:
+    response = FastJSONResponse(content)
+    tag = for_body(response.body)
+    if matches(request, tag):
+        return not_modified(tag)
+    return tagged(response, tag)
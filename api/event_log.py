@@ -0,0 +1,204 @@
+"""
+Write-behind appender for the `event_log` collection.
+
+Mutating routes call `writer.append(...)` instead of writing the event
+synchronously. Events go into a bounded in-process queue; a background task
+drains it and commits batched writes when a batch fills up or the flush
+interval passes, whichever comes first. When the queue is full `append`
+waits, which pushes back on the routes producing events.
+
+Every event gets its document ID when it is appended, so a retried batch
+rewrites the same documents instead of duplicating them. The FastAPI lifespan
+starts the writer and stops it on shutdown, which flushes everything still
+queued. Outside the lifespan (scripts, tests) `append` writes through directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+import datastore
+import metrics
+
+
+EVENT_LOG_COLLECTION = "event_log"
+PROPERTIES = "properties"
+MAX_BATCH_SIZE = datastore.MAX_BATCH_WRITES
+FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL_SECONDS", "0.25"))
+MAX_QUEUED_EVENTS = int(os.getenv("EVENT_LOG_MAX_QUEUED", "10000"))
+RETRY_BACKOFF_SECONDS = (0.1, 0.5, 2.0)
+
+logger = logging.getLogger("rentchain.event_log")
+
+FlushFn = Callable[[dict[str, dict[str, Any]]], Awaitable[None]]
+
+
+def _write_events(events: dict[str, dict[str, Any]]) -> Awaitable[None]:
+    return datastore.set_documents(EVENT_LOG_COLLECTION, events)
+
+
+def build_event(
+    event_type: str,
+    entity_type: str,
+    entity_id: str,
+    *,
+    context: dict[str, Any] | None = None,
+    payload: dict[str, Any] | None = None,
+    created_by: str | None = None,
+) -> dict[str, Any]:
+    return {
+        "event_type": event_type,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "context": context or {},
+        "payload": payload or {},
+        "created_at": dt.datetime.now(dt.timezone.utc),
+        "created_by": created_by,
+        "status": "pending",
+    }
+
+
+async def landlord_of(document: dict[str, Any]) -> str | None:
+    """
+    The landlord an event about `document` belongs in `context.landlord_id`
+    (event_stream delivers by it): its own, or its property's.
+    """
+    landlord_id = document.get("landlord_id")
+    if landlord_id or not document.get("rc_prop_id"):
+        return landlord_id
+    prop = await datastore.get_document(PROPERTIES, document["rc_prop_id"])
+    return prop.get("landlord_id") if prop is not None else None
+
+
+class EventLogWriter:
+    def __init__(
+        self,
+        flush_fn: FlushFn = _write_events,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_queued: int = MAX_QUEUED_EVENTS,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self._flush_fn = flush_fn
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._unflushed: list[dict[str, dict[str, Any]]] = []
+        self.flush_seconds = registry.histogram(
+            "event_log_flush_seconds",
+            "Time to commit one event_log batch.",
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+        )
+        self.written = registry.counter("event_log_events_written_total", "event_log events committed.")
+        self.failures = registry.counter("event_log_flush_failures_total", "Failed event_log batch commits.")
+        registry.register_collector(
+            "event_log_queue_depth", "Events waiting to be flushed.", "gauge", lambda: [({}, self.depth)]
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def append(self, event: dict[str, Any]) -> str:
+        event_id = uuid.uuid4().hex
+        if not self.running:
+            await self._flush({event_id: event})
+        else:
+            await self._queue.put((event_id, event))
+        return event_id
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._task = asyncio.create_task(self._run(), name="event-log-writer")
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still queued."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self._drain(final=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            event_id, event = await self._queue.get()
+            batch = {event_id: event}
+            deadline = loop.time() + self.flush_interval
+            try:
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    # asyncio.timeout, not wait_for: on 3.11 wait_for can swallow
+                    # the cancellation stop() relies on
+                    try:
+                        async with asyncio.timeout(remaining):
+                            event_id, event = await self._queue.get()
+                    except TimeoutError:
+                        break
+                    batch[event_id] = event
+            except asyncio.CancelledError:
+                self._unflushed.append(batch)
+                raise
+            await self._flush_with_retry(batch)
+
+    async def _drain(self, final: bool = False) -> None:
+        while self._unflushed:
+            await self._flush_with_retry(self._unflushed.pop(), final=final)
+        while self._queue is not None and not self._queue.empty():
+            batch = {}
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                event_id, event = self._queue.get_nowait()
+                batch[event_id] = event
+            await self._flush_with_retry(batch, final=final)
+
+    async def _flush_with_retry(self, batch: dict[str, dict[str, Any]], final: bool = False) -> None:
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await self._flush(batch)
+                    return
+                except Exception:
+                    self.failures.inc()
+                    if final and attempt >= len(RETRY_BACKOFF_SECONDS):
+                        logger.exception(
+                            "dropping %d event_log events after %d attempts", len(batch), attempt + 1
+                        )
+                        return
+                    delay = RETRY_BACKOFF_SECONDS[min(attempt, len(RETRY_BACKOFF_SECONDS) - 1)]
+                    attempt += 1
+                    logger.warning("event_log flush failed, retrying in %.1fs", delay, exc_info=True)
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # shutdown mid-flush or mid-backoff: keep the batch for the final drain
+            self._unflushed.append(batch)
+            raise
+
+    async def _flush(self, batch: dict[str, dict[str, Any]]) -> None:
+        started = time.perf_counter()
+        await self._flush_fn(batch)
+        self.flush_seconds.observe(time.perf_counter() - started)
+        self.written.inc(value=len(batch))
+
+
+writer = EventLogWriter()
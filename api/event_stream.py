@@ -0,0 +1,277 @@
+"""
+Server-sent event fan-out of `event_log` entries for live dashboards.
+
+Each process has one upstream listener (`hub`). It polls `event_log` and
+hands each entry to the subscribers whose filter matches. Every subscription
+is scoped to one landlord, and an entry is only delivered to subscribers of
+the landlord in its `context.landlord_id`; entries without one go to nobody.
+Within a landlord, subscribers are indexed by `(entity_type, entity_id)`, by
+`entity_type` and as whole-landlord, so publishing costs O(matching
+subscribers) rather than O(connections). The poller runs only while someone
+is subscribed; when the last subscriber leaves, the hub forgets where it
+stopped reading, so the first poll after an idle spell starts from then
+instead of replaying (and querying) everything written in between.
+
+`event_log` is written behind (see event_log.py), so an entry can land with a
+`created_at` slightly older than entries already seen. Rather than re-reading
+an overlap window on every poll, each poll reads the window
+`(watermark, now - SETTLE]` and moves the watermark to its upper end: windows
+do not overlap, so every entry is read once, and an entry is read only after
+it has had `EVENT_STREAM_SETTLE_SECONDS` to land. That delay is the price of
+the single read; an entry that takes longer than it to be written is missed,
+as one older than the overlap window was before.
+
+Each event is encoded as an SSE frame once; subscribers buffer that shared
+bytes object. Every subscriber's buffer is bounded and keyed by (entity,
+event type). A newer event for the same key replaces the pending one, because
+a dashboard only needs the latest state. When distinct keys still overflow
+the buffer, the oldest are dropped and the client receives a `dropped` event
+telling it to refetch. One slow client can cost at most `SUBSCRIBER_BUFFER`
+frames of memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime as dt
+import logging
+import os
+from typing import Any, AsyncIterator, Callable
+
+import datastore
+import event_log
+import metrics
+import responses
+
+
+POLL_INTERVAL_SECONDS = float(os.getenv("EVENT_STREAM_POLL_SECONDS", "1.0"))
+SETTLE = dt.timedelta(seconds=float(os.getenv("EVENT_STREAM_SETTLE_SECONDS", "3")))
+SUBSCRIBER_BUFFER = int(os.getenv("EVENT_STREAM_SUBSCRIBER_BUFFER", "256"))
+HEARTBEAT_SECONDS = 15.0
+MEDIA_TYPE = "text/event-stream"
+HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+logger = logging.getLogger("rentchain.event_stream")
+
+FetchFn = Callable[[dt.datetime, dt.datetime], AsyncIterator[datastore.Document]]
+
+
+def _read_event_log(since: dt.datetime, until: dt.datetime) -> AsyncIterator[datastore.Document]:
+    return datastore.query_all(
+        event_log.EVENT_LOG_COLLECTION,
+        filters=[("created_at", ">", since), ("created_at", "<=", until)],
+        order_by=["created_at"],
+    )
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+def landlord_of(event: dict[str, Any]) -> str | None:
+    context = event.get("context")
+    return context.get("landlord_id") if isinstance(context, dict) else None
+
+
+class Subscriber:
+    def __init__(
+        self, landlord_id: str, entity_type: str | None, entity_id: str | None, buffer: int
+    ) -> None:
+        self.landlord_id = landlord_id
+        self.entity_type = entity_type
+        self.entity_id = entity_id
+        self.buffer = buffer
+        self.pending: collections.OrderedDict[tuple, bytes] = collections.OrderedDict()
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def offer(self, key: tuple, frame: bytes) -> str | None:
+        """Buffer `frame` under `key`. Returns "coalesced" or "dropped" if an older one gave way."""
+        displaced = None
+        if key in self.pending:
+            del self.pending[key]
+            displaced = "coalesced"
+        elif len(self.pending) >= self.buffer:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+            displaced = "dropped"
+        self.pending[key] = frame
+        self.ready.set()
+        return displaced
+
+    def take(self) -> tuple[list[bytes], int]:
+        frames, dropped = list(self.pending.values()), self.dropped
+        self.pending.clear()
+        self.dropped = 0
+        self.ready.clear()
+        return frames, dropped
+
+
+class EventHub:
+    def __init__(
+        self,
+        fetch: FetchFn = _read_event_log,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+        buffer: int = SUBSCRIBER_BUFFER,
+        settle: dt.timedelta = SETTLE,
+        clock: Callable[[], dt.datetime] = _utcnow,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self._fetch = fetch
+        self.poll_interval = poll_interval
+        self.buffer = buffer
+        self.settle = settle
+        self.clock = clock
+        self._by_entity: dict[tuple[str, str, str], set[Subscriber]] = collections.defaultdict(set)
+        self._by_type: dict[tuple[str, str], set[Subscriber]] = collections.defaultdict(set)
+        self._by_landlord: dict[str, set[Subscriber]] = collections.defaultdict(set)
+        self._count = 0
+        self._watermark: dt.datetime | None = None
+        self._task: asyncio.Task | None = None
+        self.published = registry.counter("event_stream_events_total", "event_log entries fanned out.")
+        self.displaced = registry.counter(
+            "event_stream_displaced_total",
+            "Events a slow subscriber never saw, by reason.",
+            labelnames=("reason",),
+        )
+        registry.register_collector(
+            "event_stream_subscribers", "Open event stream subscriptions.", "gauge",
+            lambda: [({}, self._count)],
+        )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _index(self, subscriber: Subscriber) -> tuple[dict, Any]:
+        landlord_id = subscriber.landlord_id
+        if subscriber.entity_id is not None:
+            return self._by_entity, (landlord_id, subscriber.entity_type, subscriber.entity_id)
+        if subscriber.entity_type is not None:
+            return self._by_type, (landlord_id, subscriber.entity_type)
+        return self._by_landlord, landlord_id
+
+    def subscribe(
+        self, landlord_id: str, entity_type: str | None = None, entity_id: str | None = None
+    ) -> Subscriber:
+        subscriber = Subscriber(landlord_id, entity_type, entity_id, self.buffer)
+        table, key = self._index(subscriber)
+        table[key].add(subscriber)
+        self._count += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll(), name="event-stream-poller")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        table, key = self._index(subscriber)
+        members = table.get(key, set())
+        if subscriber not in members:
+            return
+        members.discard(subscriber)
+        if not members:
+            del table[key]
+        self._count -= 1
+        if not self._count:
+            # the next subscriber starts from its own "now", not from the last poll
+            self._watermark = None
+            if self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    def publish(self, event: dict[str, Any]) -> None:
+        landlord_id = landlord_of(event)
+        if not landlord_id:
+            return
+        entity_type, entity_id = event.get("entity_type"), event.get("entity_id")
+        key = (entity_type, entity_id, event.get("event_type"))
+        frame = None
+        displaced: collections.Counter[str] = collections.Counter()
+        for group in (
+            self._by_entity.get((landlord_id, entity_type, entity_id), ()),
+            self._by_type.get((landlord_id, entity_type), ()),
+            self._by_landlord.get(landlord_id, ()),
+        ):
+            for subscriber in group:
+                if frame is None:
+                    # serialized once, shared by every subscriber's buffer
+                    frame = format_event(event)
+                reason = subscriber.offer(key, frame)
+                if reason is not None:
+                    displaced[reason] += 1
+        self.published.inc()
+        for reason, count in displaced.items():
+            self.displaced.inc((reason,), count)
+
+    async def poll_once(self) -> int:
+        """Publish the entries created since the last poll that have settled. Returns how many."""
+        until = self.clock() - self.settle
+        if self._watermark is None:
+            # subscribers see what happens from now on, not history
+            self._watermark = until
+        if until <= self._watermark:
+            return 0
+        published = 0
+        async for entry in self._fetch(self._watermark, until):
+            self.publish(entry)
+            published += 1
+        # the next window starts where this one ended, so no entry is read twice
+        self._watermark = until
+        return published
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.warning("event_log poll failed", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+
+    async def stop(self) -> None:
+        self._watermark = None
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stream(
+        self,
+        landlord_id: str,
+        entity_type: str | None = None,
+        entity_id: str | None = None,
+        heartbeat: float = HEARTBEAT_SECONDS,
+    ) -> AsyncIterator[bytes]:
+        subscriber = self.subscribe(landlord_id, entity_type, entity_id)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    async with asyncio.timeout(heartbeat):
+                        await subscriber.ready.wait()
+                except TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                frames, dropped = subscriber.take()
+                if dropped:
+                    frames.insert(0, b"event: dropped\ndata: " + responses.dumps({"count": dropped}) + b"\n\n")
+                yield b"".join(frames)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def _field(value: Any) -> bytes:
+    # a line break inside a field would end it and start a forged one
+    return str(value).replace("\r", " ").replace("\n", " ").encode()
+
+
+def format_event(event: dict[str, Any]) -> bytes:
+    return (
+        b"id: " + _field(event.get("id", ""))
+        + b"\nevent: " + _field(event.get("event_type") or "message")
+        + b"\ndata: " + responses.dumps(event) + b"\n\n"
+    )
+
+
+hub = EventHub()
@@ -0,0 +1,102 @@
+"""
+Process-wide async Firestore client pool.
+
+The google-cloud-firestore client is imported and created on first use, so
+importing the API never pays for gRPC setup. All datastore calls go through
+`FirestorePool.acquire()`, which round-robins over a fixed number of clients
+(one gRPC channel each) and caps the number of in-flight RPCs.
+
+Set FIRESTORE_EMULATOR_HOST to point the client at a local emulator; the
+google library picks it up on its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import inspect
+import itertools
+import os
+from typing import Any, AsyncIterator, Callable
+
+
+FIRESTORE_POOL_SIZE = int(os.getenv("FIRESTORE_POOL_SIZE", "2"))
+FIRESTORE_MAX_INFLIGHT = int(os.getenv("FIRESTORE_MAX_INFLIGHT", "64"))
+
+ClientFactory = Callable[[], Any]
+
+
+def _default_factory() -> Any:
+    from google.cloud import firestore
+
+    return firestore.AsyncClient(project=os.getenv("FIRESTORE_PROJECT") or None)
+
+
+class FirestorePool:
+    def __init__(
+        self,
+        factory: ClientFactory = _default_factory,
+        size: int = FIRESTORE_POOL_SIZE,
+        max_inflight: int = FIRESTORE_MAX_INFLIGHT,
+    ) -> None:
+        if size < 1 or max_inflight < 1:
+            raise ValueError("pool size and max_inflight must be >= 1")
+        self._factory = factory
+        self.size = size
+        self.max_inflight = max_inflight
+        self._clients: list[Any] = []
+        self._cursor = itertools.count()
+        self._semaphore: asyncio.Semaphore | None = None
+        self.inflight = 0
+
+    def _next_client(self) -> Any:
+        index = next(self._cursor) % self.size
+        while len(self._clients) <= index:
+            self._clients.append(self._factory())
+        return self._clients[index]
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Any]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        async with self._semaphore:
+            self.inflight += 1
+            try:
+                yield self._next_client()
+            finally:
+                self.inflight -= 1
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, []
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close is None:
+                continue
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+_factory: ClientFactory = _default_factory
+_pool: FirestorePool | None = None
+
+
+def get_pool() -> FirestorePool:
+    global _pool
+    if _pool is None:
+        _pool = FirestorePool(_factory)
+    return _pool
+
+
+def set_client_factory(factory: ClientFactory | None) -> None:
+    """Swap the client factory (emulator stand-ins, tests). Drops the current pool."""
+    global _factory, _pool
+    _factory = factory or _default_factory
+    _pool = None
+
+
+async def close_pool() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
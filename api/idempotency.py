@@ -0,0 +1,217 @@
+"""
+`Idempotency-Key` handling for mutating requests.
+
+A POST, PUT, PATCH or DELETE that carries `Idempotency-Key` runs once. Its
+response (status, headers, body) is kept in a `cache.TTLCache` under the
+caller's key, and a retry with the same key gets that response back with
+`Idempotent-Replayed: true`. The replay is a dict lookup: it never reaches
+the route or the database. A retry that arrives while the first request is
+still running waits for it and then replays its response, instead of running
+the write a second time.
+
+Keys are scoped to the path, not to the client address: a phone that moves
+from wifi to cellular between retries must still get the stored response.
+Each stored entry also records a fingerprint of the method, path, query, body and
+negotiated media type (JSON or MessagePack, see responses.py), so a retry
+never replays a body in a format it did not ask for. Reusing a key for a
+different request is a 422. 5xx responses and failed requests are not
+stored, so a retry after a server error runs again. Bodies larger than
+`MAX_STORED_BODY` are passed through without being stored, and the store as
+a whole is held to `IDEMPOTENCY_MAX_BYTES`, least recently used first out.
+The request body is buffered to fingerprint it, so a keyed request with a
+body over `IDEMPOTENCY_MAX_REQUEST_BODY` gets a 413.
+
+The store is per process. A retry routed to another instance runs again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from typing import Any
+
+import cache
+import metrics
+import responses
+
+
+HEADER = b"idempotency-key"
+METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "50000"))
+MAX_STORED_BODY = int(os.getenv("IDEMPOTENCY_MAX_STORED_BODY", str(1 << 20)))
+MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(256 << 20)))
+MAX_REQUEST_BODY = int(os.getenv("IDEMPOTENCY_MAX_REQUEST_BODY", str(4 << 20)))
+# bookkeeping per stored response on top of its body and headers
+ENTRY_OVERHEAD = 256
+# a retry waiting on an in-flight original gives up after this and gets a 409
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+MAX_KEY_LENGTH = 255
+
+
+class _Stored:
+    __slots__ = ("fingerprint", "status", "headers", "body")
+
+    def __init__(self, fingerprint: str, status: int, headers: list, body: bytes) -> None:
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers) + ENTRY_OVERHEAD
+
+
+def _media_type(scope: dict[str, Any]) -> str:
+    accept = next((value for name, value in scope["headers"] if name == b"accept"), b"")
+    return responses.MSGPACK_MEDIA_TYPE if responses.prefers_msgpack(accept) else responses.JSON_MEDIA_TYPE
+
+
+def _fingerprint(scope: dict[str, Any], body: bytes) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    request = (scope["method"], scope["path"], scope.get("query_string", b""), _media_type(scope), body)
+    for part in request:
+        part = part.encode() if isinstance(part, str) else part
+        hasher.update(part)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+async def _read_body(receive: Any, limit: int) -> bytes | None:
+    """The whole request body, or None as soon as it passes `limit` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _error(status_code: int, detail: str) -> responses.FastJSONResponse:
+    return responses.FastJSONResponse({"detail": detail}, status_code=status_code)
+
+
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        store: cache.TTLCache | None = None,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self.app = app
+        self.store = store if store is not None else cache.TTLCache(
+            "idempotency", TTL_SECONDS, MAX_ENTRIES, max_bytes=MAX_BYTES, weigh=_Stored.size
+        )
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.outcomes = registry.counter(
+            "idempotency_requests_total",
+            "Requests carrying Idempotency-Key, by outcome.",
+            labelnames=("outcome",),
+        )
+        registry.register_collector(
+            "idempotency_keys", "Stored idempotent responses.", "gauge", lambda: [({}, len(self.store))]
+        )
+        registry.register_collector(
+            "idempotency_stored_bytes", "Bytes held by stored idempotent responses.", "gauge",
+            lambda: [({}, self.store.bytes)],
+        )
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            await self.app(scope, receive, send)
+            return
+        raw_key = next((value for name, value in scope["headers"] if name == HEADER), None)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _error(400, "invalid Idempotency-Key")(scope, receive, send)
+            return
+
+        body = await _read_body(receive, MAX_REQUEST_BODY)
+        if body is None:
+            self.outcomes.inc(("too_large",))
+            await _error(413, "request body too large for an idempotent request")(scope, receive, send)
+            return
+        fingerprint = _fingerprint(scope, body)
+        key = "\0".join((scope["path"], raw_key.decode("latin-1")))
+
+        while True:
+            stored = self.store.get(key)
+            if stored is not cache.MISSING:
+                if stored.fingerprint != fingerprint:
+                    self.outcomes.inc(("mismatch",))
+                    await _error(422, "Idempotency-Key was used for a different request")(scope, receive, send)
+                    return
+                self.outcomes.inc(("replayed",))
+                await self._replay(stored, send)
+                return
+            flight = self._inflight.get(key)
+            if flight is None:
+                break
+            self.outcomes.inc(("joined",))
+            try:
+                async with asyncio.timeout(WAIT_SECONDS):
+                    await asyncio.shield(flight)
+            except TimeoutError:
+                await _error(409, "a request with this Idempotency-Key is still in progress")(
+                    scope, receive, send
+                )
+                return
+            # the original finished; loop to replay it, or run if it wasn't stored
+
+        self.outcomes.inc(("executed",))
+        flight = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            await self._execute(scope, receive, send, key, fingerprint, body)
+        finally:
+            del self._inflight[key]
+            flight.set_result(None)
+
+    async def _execute(
+        self, scope: dict[str, Any], receive: Any, send: Any, key: str, fingerprint: str, body: bytes
+    ) -> None:
+        replayed_body = False
+
+        async def replay_receive() -> dict[str, Any]:
+            nonlocal replayed_body
+            if not replayed_body:
+                replayed_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start: dict[str, Any] = {}
+        chunks: list[bytes] = []
+        size = 0
+
+        async def capture(message: dict[str, Any]) -> None:
+            nonlocal size
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body" and size <= MAX_STORED_BODY:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                chunks.append(chunk)
+            await send(message)
+
+        await self.app(scope, replay_receive, capture)
+        status = start.get("status", 500)
+        if status < 500 and size <= MAX_STORED_BODY:
+            self.store.set(key, _Stored(fingerprint, status, list(start.get("headers", [])), b"".join(chunks)))
+
+    async def _replay(self, stored: _Stored, send: Any) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": stored.status,
+            "headers": [*stored.headers, (b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": stored.body})
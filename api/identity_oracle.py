@@ -0,0 +1,324 @@
+"""
+Batch syntax normalization of external property identifiers.
+
+The same rules as the Node identity oracle's syntax adapters: an Ontario PIN
+is 9 digits (`ca-on:pin`), a Nova Scotia PID is 8 (`ca-ns:pid`), and every
+non-digit is dropped. Each normalized identifier gets an immutable
+`identity_oracle_runs` record and updates the property's
+`property_identity_profiles` document, in the shapes the Node service writes.
+
+`normalize_batch` takes thousands of identifiers at once, for portfolio
+onboarding:
+
+- identical items (same property, identifier, type, province and
+  municipality) are normalized and recorded once; the repeats point at the
+  same run
+- properties and existing profiles are each read with one batched get
+- syntax results are memoized per namespace in a bounded LRU, so an
+  identifier seen before (a re-run, the same parcel under two properties)
+  skips normalization
+- runs and profiles are written with batched commits, not one write each
+
+External verification (Halifax R400, the Ontario gateway) stays on the
+Node API's single-identifier route; batch runs are syntax-only.
+"""
+
+from __future__ import annotations
+
+import collections
+import datetime as dt
+import os
+import re
+import uuid
+from typing import Any, Callable, Sequence
+
+import datastore
+import metrics
+
+
+RUNS_COLLECTION = "identity_oracle_runs"
+PROFILES_COLLECTION = "property_identity_profiles"
+PROPERTIES_COLLECTION = "properties"
+MAX_BATCH_SIZE = int(os.getenv("IDENTITY_BATCH_MAX_ITEMS", "10000"))
+MEMO_MAX_ENTRIES = int(os.getenv("IDENTITY_MEMO_MAX_ENTRIES", "50000"))
+ACTOR_TYPES = ("system", "admin")
+_NON_DIGITS = re.compile(r"\D")
+
+# status, reason, normalized identifier
+Syntax = tuple[str, str | None, str | None]
+
+
+class InvalidIdentifier(ValueError):
+    """An item that cannot be normalized; the message is the Node API's error code."""
+
+
+class Namespace:
+    __slots__ = ("key", "province", "identifier_type", "digits", "length_reason")
+
+    def __init__(self, key: str, province: str, identifier_type: str, digits: int, length_reason: str) -> None:
+        self.key = key
+        self.province = province
+        self.identifier_type = identifier_type
+        self.digits = digits
+        self.length_reason = length_reason
+
+    def normalize(self, identifier: str) -> Syntax:
+        digits = _NON_DIGITS.sub("", identifier)
+        if not digits:
+            return ("invalid", "identifier_required", None)
+        if len(digits) != self.digits:
+            return ("invalid", self.length_reason, None)
+        return ("valid", None, digits)
+
+
+NAMESPACES = {
+    "ON": Namespace("ca-on:pin", "ON", "pin", 9, "ontario_pin_must_have_9_digits"),
+    "NS": Namespace("ca-ns:pid", "NS", "pid", 8, "nova_scotia_pid_must_have_8_digits"),
+}
+_PROVINCE_NAMES = {"ONTARIO": "ON", "NOVA SCOTIA": "NS"}
+
+
+def _first_string(*values: Any) -> str:
+    for value in values:
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return ""
+
+
+def normalize_province(value: Any) -> str | None:
+    province = str(value or "").strip().upper()
+    return _PROVINCE_NAMES.get(province, province) or None
+
+
+def select_namespace(province: str | None, identifier_type: Any) -> Namespace:
+    wanted = str(identifier_type or "").strip().lower()
+    if wanted and wanted not in ("pin", "pid"):
+        raise InvalidIdentifier("identifier_type_not_supported")
+    namespace = NAMESPACES.get(province or "")
+    if namespace is None:
+        raise InvalidIdentifier("province_not_supported")
+    if wanted and wanted != namespace.identifier_type:
+        raise InvalidIdentifier("identifier_type_not_supported_for_province")
+    return namespace
+
+
+class NormalizationMemo:
+    """Syntax results per namespace, least recently used evicted past `max_entries` each."""
+
+    def __init__(
+        self, max_entries: int = MEMO_MAX_ENTRIES, registry: metrics.MetricsRegistry = metrics.REGISTRY
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self._entries: dict[str, collections.OrderedDict[str, Syntax]] = {}
+        self.lookups = registry.counter(
+            "identity_memo_lookups_total", "Identifier normalization memo lookups.",
+            labelnames=("namespace", "result"),
+        )
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def normalize(self, namespace: Namespace, identifier: str) -> Syntax:
+        entries = self._entries.get(namespace.key)
+        if entries is None:
+            entries = self._entries[namespace.key] = collections.OrderedDict()
+        result = entries.get(identifier)
+        if result is not None:
+            entries.move_to_end(identifier)
+            self.lookups.inc((namespace.key, "hit"))
+            return result
+        self.lookups.inc((namespace.key, "miss"))
+        result = entries[identifier] = namespace.normalize(identifier)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def _item_key(item: dict[str, Any]) -> tuple:
+    return tuple(
+        str(item.get(field) or "").strip()
+        for field in ("propertyId", "identifier", "identifierType", "province", "municipality")
+    )
+
+
+def build_run(
+    run_id: str,
+    property_id: str,
+    prop: dict[str, Any],
+    namespace: Namespace,
+    municipality: str,
+    identifier: str,
+    syntax: Syntax,
+    created_at: str,
+    actor_id: str,
+    actor_type: str,
+) -> dict[str, Any]:
+    status, reason, normalized = syntax
+    return {
+        "id": run_id,
+        "propertyId": property_id,
+        "rc_prop_id": _first_string(prop.get("rc_prop_id"), prop.get("rcPropId"), property_id) or None,
+        "province": namespace.province,
+        "municipality": municipality or None,
+        "namespaceKey": namespace.key,
+        "identifierType": namespace.identifier_type,
+        "originalIdentifier": identifier,
+        "normalizedIdentifier": normalized,
+        "syntaxResult": {
+            "status": status, "ok": status == "valid", "reason": reason, "normalizedIdentifier": normalized,
+        },
+        "verificationStatus": "SYNTAX_ONLY" if status == "valid" else None,
+        "confidence": None,
+        "sourceType": None,
+        "sourceKey": None,
+        "sourceLabel": None,
+        "sourceHealth": None,
+        "policyGate": None,
+        "usageGate": None,
+        "flags": [],
+        "notes": [],
+        "relatedNamespaces": [],
+        "createdAt": created_at,
+        "createdBy": actor_id or None,
+        "actorType": actor_type,
+    }
+
+
+def apply_run(profile: dict[str, Any] | None, run: dict[str, Any]) -> dict[str, Any]:
+    """A property's profile after `run`, the way the Node service builds it."""
+    existing = {key: value for key, value in (profile or {}).items() if key != "id"}
+    identifiers = dict(existing.get("identifiers") or {})
+    identifiers[run["namespaceKey"]] = {
+        "identifierType": run["identifierType"],
+        "originalIdentifier": run["originalIdentifier"],
+        "normalizedIdentifier": run["normalizedIdentifier"],
+        "syntaxStatus": run["syntaxResult"]["status"],
+        **{field: run[field] for field in (
+            "verificationStatus", "confidence", "sourceType", "sourceKey", "sourceLabel", "sourceHealth",
+            "policyGate", "usageGate", "flags", "notes", "relatedNamespaces",
+        )},
+        "lastRunId": run["id"],
+        "updatedAt": run["createdAt"],
+    }
+    return {
+        **existing,
+        "propertyId": run["propertyId"],
+        "rc_prop_id": run["rc_prop_id"],
+        "province": run["province"],
+        "municipality": run["municipality"],
+        "namespaceKey": run["namespaceKey"],
+        "latestRunId": run["id"],
+        "lastRunAt": run["createdAt"],
+        "identifierType": run["identifierType"],
+        "syntaxStatus": run["syntaxResult"]["status"],
+        "identifiers": identifiers,
+    }
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+async def normalize_batch(
+    items: Sequence[Any],
+    actor_id: str = "",
+    actor_type: str = "system",
+    memo: NormalizationMemo | None = None,
+    clock: Callable[[], dt.datetime] = _utcnow,
+) -> dict[str, Any]:
+    """
+    Normalize and record every item; returns one result per item, in order.
+
+    An item that cannot be normalized (unknown property, unsupported
+    province or type) gets an `error` instead of a run and does not fail
+    the batch.
+    """
+    memo = memo if memo is not None else memos
+    actor_type = actor_type if actor_type in ACTOR_TYPES else "system"
+    created_at = clock().isoformat()
+
+    unique: dict[tuple, int] = {}
+    order: list[int] = []
+    for item in items:
+        key = _item_key(item) if isinstance(item, dict) else ("",) * 5
+        order.append(unique.setdefault(key, len(unique)))
+    keys = list(unique)
+
+    property_ids = [key[0] for key in keys if key[0]]
+    props = await datastore.get_documents(PROPERTIES_COLLECTION, property_ids)
+
+    outcomes: list[dict[str, Any]] = []
+    runs: dict[str, dict[str, Any]] = {}
+    for property_id, identifier, identifier_type, province, municipality in keys:
+        outcome: dict[str, Any] = {"propertyId": property_id or None, "identifier": identifier}
+        outcomes.append(outcome)
+        try:
+            if not property_id:
+                raise InvalidIdentifier("property_id_required")
+            if not identifier:
+                raise InvalidIdentifier("identifier_required")
+            prop = props.get(property_id)
+            if prop is None:
+                raise InvalidIdentifier("property_not_found")
+            namespace = select_namespace(
+                normalize_province(province or prop.get("province") or prop.get("addressProvince")), identifier_type
+            )
+        except InvalidIdentifier as exc:
+            outcome["error"] = str(exc)
+            continue
+        syntax = memo.normalize(namespace, identifier)
+        run_id = uuid.uuid4().hex
+        municipality = _first_string(
+            municipality, prop.get("municipality"), prop.get("city"), prop.get("addressCity")
+        )
+        runs[run_id] = build_run(
+            run_id, property_id, prop, namespace, municipality, identifier, syntax, created_at, actor_id,
+            actor_type,
+        )
+        outcome.update({
+            "runId": run_id,
+            "namespaceKey": namespace.key,
+            "normalizedIdentifier": syntax[2],
+            "syntaxStatus": syntax[0],
+            "reason": syntax[1],
+        })
+
+    by_property: dict[str, list[dict[str, Any]]] = {}
+    for run in runs.values():
+        by_property.setdefault(run["propertyId"], []).append(run)
+    existing = await datastore.get_documents(PROFILES_COLLECTION, list(by_property))
+    profiles: dict[str, dict[str, Any]] = {}
+    for property_id, property_runs in by_property.items():
+        profile = existing.get(property_id)
+        for run in property_runs:
+            profile = apply_run(profile, run)
+        profiles[property_id] = profile
+
+    # runs are the audit trail: written before the profiles that point at them
+    if runs:
+        await datastore.set_documents(RUNS_COLLECTION, runs)
+    if profiles:
+        await datastore.set_documents(PROFILES_COLLECTION, profiles)
+
+    seen: set[int] = set()
+    results = []
+    for position, index in enumerate(order):
+        result = {"index": position, **outcomes[index], "duplicate": index in seen}
+        seen.add(index)
+        results.append(result)
+    return {
+        "received": len(items),
+        "unique": len(keys),
+        "runsWritten": len(runs),
+        "profilesWritten": len(profiles),
+        "errors": sum(1 for outcome in outcomes if "error" in outcome),
+        "results": results,
+    }
+
+
+memos = NormalizationMemo()
@@ -0,0 +1,49 @@
+"""
+Internal identity oracle routes.
+
+Like the Node API's `/api/internal/identity-oracle/run`, these are for jobs,
+not users: every call needs `X-Internal-Job-Token` matching
+`INTERNAL_JOB_TOKEN`, and without a configured token every call is refused.
+"""
+
+from __future__ import annotations
+
+import hmac
+import os
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException, Request
+
+import identity_oracle
+from responses import FastJSONResponse
+
+
+INTERNAL_JOB_TOKEN = os.getenv("INTERNAL_JOB_TOKEN", "").strip()
+TOKEN_HEADER = "x-internal-job-token"
+
+router = APIRouter()
+
+
+def _require_job_token(request: Request) -> None:
+    presented = request.headers.get(TOKEN_HEADER, "").strip()
+    if not INTERNAL_JOB_TOKEN or not hmac.compare_digest(presented.encode(), INTERNAL_JOB_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+@router.post("/internal/identity-oracle/normalize")
+async def normalize_identifiers(
+    request: Request,
+    items: list[Any] = Body(..., embed=True),
+    actor_id: str = Body("", alias="actorId"),
+    actor_type: str = Body("system", alias="actorType"),
+):
+    """Normalize and record a batch of identifiers; see `identity_oracle.normalize_batch`."""
+    _require_job_token(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(items) > identity_oracle.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"at most {identity_oracle.MAX_BATCH_SIZE} items per batch"
+        )
+    result = await identity_oracle.normalize_batch(items, actor_id=actor_id, actor_type=actor_type)
+    return FastJSONResponse(result)
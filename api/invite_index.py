@@ -0,0 +1,223 @@
+"""
+In-process index of open `tenancy_invites`, keyed by token hash.
+
+Invites are stored under the SHA-256 of their token (the Node API's
+`hashTenancyInviteToken`), with `status` and `expires_at` in epoch
+milliseconds. Only open invites are indexed: pending and not yet expired.
+Checking a token is one hash and one dict lookup, plus the expiry comparison.
+
+Expiry times are kept in a min-heap. Expired invites are not swept on a
+timer; each lookup and each write first pops whatever has expired off the top
+of the heap, so the hot set only ever holds open invites and an invite is
+never served past its expiry. An invite that stops being open for another
+reason (redeemed, superseded, re-dated) leaves a stale heap entry, skipped
+when it surfaces; the heap is compacted when stale entries outnumber live
+ones. Past `INVITE_INDEX_MAX_ENTRIES` the soonest-expiring invite is dropped
+to make room, so memory is bounded whatever the write rate.
+
+`apply` keeps the index current from invite writes made through this API.
+A token the index does not hold is read from the datastore once (a document
+get by ID) and indexed if it turns out to be open, so invites created
+elsewhere (the Node API) are found on first use. Invites redeemed elsewhere
+stay in the index until the next rebuild, `INVITE_INDEX_REFRESH_SECONDS`
+after the previous one, so a check can pass for an invite that is already
+used. A failed rebuild keeps the old index and is retried only after
+`INVITE_INDEX_RETRY_SECONDS`, not on every check. Redemption does not rely on the index: it reads the document and
+writes it conditionally on the version it read (see `invite_routes`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import os
+import time
+from typing import Any, Callable
+
+import datastore
+
+
+INVITES = "tenancy_invites"
+OPEN_STATUS = "pending"
+MAX_ENTRIES = int(os.getenv("INVITE_INDEX_MAX_ENTRIES", "100000"))
+REFRESH_SECONDS = float(os.getenv("INVITE_INDEX_REFRESH_SECONDS", "300"))
+RETRY_SECONDS = float(os.getenv("INVITE_INDEX_RETRY_SECONDS", "30"))
+# compact the heap once it holds this many times more entries than the index
+COMPACT_RATIO = 2
+
+logger = logging.getLogger("rentchain.invite_index")
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(str(token or "").strip().encode()).hexdigest()
+
+
+def _now_millis() -> float:
+    return time.time() * 1000
+
+
+def expires_at(invite: dict[str, Any]) -> float:
+    """Expiry in epoch ms; an invite without one never expires, as in the Node API."""
+    value = invite.get("expires_at", invite.get("expiresAt"))
+    return value if isinstance(value, (int, float)) and value else math.inf
+
+
+def is_open(invite: dict[str, Any], now: float) -> bool:
+    return (invite.get("status") or OPEN_STATUS) == OPEN_STATUS and expires_at(invite) > now
+
+
+class InviteIndex:
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self._open: dict[str, dict[str, Any]] = {}
+        self._expiry: list[tuple[float, str]] = []
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    @property
+    def heap_size(self) -> int:
+        return len(self._expiry)
+
+    def _live(self, expiry: float, token_hash: str) -> bool:
+        invite = self._open.get(token_hash)
+        return invite is not None and expires_at(invite) == expiry
+
+    def evict_expired(self, now: float) -> None:
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            expiry, token_hash = heapq.heappop(heap)
+            if self._live(expiry, token_hash):
+                del self._open[token_hash]
+                self.evicted += 1
+
+    def _compact(self) -> None:
+        self._expiry = [(expires_at(invite), token_hash) for token_hash, invite in self._open.items()]
+        heapq.heapify(self._expiry)
+
+    def apply(self, token_hash: str, invite: dict[str, Any] | None, now: float) -> None:
+        """Index `invite` if it is open, otherwise drop it. None means deleted."""
+        self.evict_expired(now)
+        if invite is None or not is_open(invite, now):
+            self._open.pop(token_hash, None)
+        else:
+            self._open[token_hash] = invite
+            heapq.heappush(self._expiry, (expires_at(invite), token_hash))
+            while len(self._open) > self.max_entries:
+                expiry, soonest = heapq.heappop(self._expiry)
+                if self._live(expiry, soonest):
+                    del self._open[soonest]
+                    self.evicted += 1
+        if len(self._expiry) > COMPACT_RATIO * len(self._open) + 64:
+            self._compact()
+
+    def get(self, token_hash: str, now: float) -> dict[str, Any] | None:
+        """The open invite for `token_hash`, or None if the index does not hold one."""
+        if self._expiry and self._expiry[0][0] <= now:
+            self.evict_expired(now)
+        invite = self._open.get(token_hash)
+        # an invite is open until its expiry, whenever the heap gets to it
+        if invite is not None and expires_at(invite) <= now:
+            return None
+        return invite
+
+
+class InviteLookup:
+    """Owns the live index: lazy first build, read-through misses, periodic rebuilds."""
+
+    def __init__(
+        self,
+        refresh_seconds: float = REFRESH_SECONDS,
+        max_entries: int = MAX_ENTRIES,
+        clock: Callable[[], float] = _now_millis,
+        retry_seconds: float = RETRY_SECONDS,
+    ) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        # no rebuild starts before this, after one failed
+        self.retry_at = 0.0
+        self.max_entries = max_entries
+        self.clock = clock
+        self.index = InviteIndex(max_entries)
+        self.built_at: float | None = None
+        self.hits = 0
+        self.misses = 0
+        self._lock: asyncio.Lock | None = None
+        self._refresh: asyncio.Task | None = None
+        # writes seen while a rebuild is reading; replayed onto the new index
+        self._pending: list[tuple[str, dict[str, Any] | None]] | None = None
+
+    async def _build(self) -> InviteIndex:
+        index = InviteIndex(self.max_entries)
+        now = self.clock()
+        async for invite in datastore.query_all(INVITES, filters=[("status", "==", OPEN_STATUS)]):
+            index.apply(invite["id"], invite, now)
+        return index
+
+    async def ready(self) -> InviteIndex:
+        if self.built_at is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self.built_at is None:
+                    self.index = await self._build()
+                    self.built_at = time.monotonic()
+        elif (
+            time.monotonic() - self.built_at > self.refresh_seconds
+            and time.monotonic() >= self.retry_at
+            and (self._refresh is None or self._refresh.done())
+        ):
+            self._refresh = asyncio.create_task(self._rebuild(), name="invite-index-rebuild")
+        return self.index
+
+    async def _rebuild(self) -> None:
+        started = time.monotonic()
+        self._pending = []
+        try:
+            index = await self._build()
+        except Exception:
+            logger.warning("invite index rebuild failed", exc_info=True)
+            self.retry_at = time.monotonic() + self.retry_seconds
+            return
+        else:
+            now = self.clock()
+            for token_hash, invite in self._pending:
+                index.apply(token_hash, invite, now)
+            self.index, self.built_at = index, started
+        finally:
+            self._pending = None
+
+    def apply(self, token_hash: str, invite: dict[str, Any] | None) -> None:
+        """Record an invite write; `invite` is the document as written, None if deleted."""
+        if self.built_at is not None:
+            self.index.apply(token_hash, invite, self.clock())
+        if self._pending is not None:
+            self._pending.append((token_hash, invite))
+
+    async def find(self, token_hash: str) -> dict[str, Any] | None:
+        """
+        The invite document for `token_hash`, open or not, or None if there is
+        none. An open invite in the index costs no datastore read.
+        """
+        index = await self.ready()
+        invite = index.get(token_hash, self.clock())
+        if invite is not None:
+            self.hits += 1
+            return dict(invite)
+        self.misses += 1
+        document = await datastore.get_document(INVITES, token_hash)
+        if document is not None and is_open(document, self.clock()):
+            self.apply(token_hash, document)
+        return document
+
+    def reset(self) -> None:
+        self.index, self.built_at = InviteIndex(self.max_entries), None
+
+
+invites = InviteLookup()
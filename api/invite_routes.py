@@ -0,0 +1,147 @@
+"""
+Tenancy invite routes: check a token, redeem it.
+
+Both take the token in the body, never the path, so it stays out of access
+logs. Errors use the Node API's codes (`invite_not_found`, `invite_expired`,
+`invite_used`, `invite_email_mismatch`). Checks are answered from
+`invite_index`. Redemption reads the invite document itself and writes it
+only while it is still at the version that read returned, so of two
+redemptions racing anywhere (another instance, the Node API) one gets 409
+`invite_used`. Within a process redemptions of the same token also take
+turns on a lock, so the loser sees the redeemed invite instead of a
+conflict, whichever datastore backend is configured.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+from fastapi import APIRouter, Body, HTTPException
+
+import datastore
+import event_log
+import invite_index
+from responses import FastJSONResponse
+
+
+router = APIRouter()
+
+ERROR_STATUS = {
+    "invite_not_found": 404,
+    "invite_email_mismatch": 403,
+    "invite_used": 409,
+    "invite_expired": 410,
+}
+# what a not-yet-authenticated tenant may see about the invite they hold
+PUBLIC_FIELDS = ("rc_prop_id", "property_id", "unit_id", "application_id", "invited_name", "expires_at")
+
+# token hash -> (lock, redemptions holding or waiting on it)
+_redeeming: dict[str, tuple[asyncio.Lock, int]] = {}
+
+
+def _normalize_email(value: Any) -> str | None:
+    return str(value or "").strip().lower() or None
+
+
+def _problem(invite: dict[str, Any] | None, now: float) -> str | None:
+    if invite is None:
+        return "invite_not_found"
+    if invite_index.expires_at(invite) <= now:
+        return "invite_expired"
+    status = invite.get("status") or invite_index.OPEN_STATUS
+    if status == "redeemed":
+        return "invite_used"
+    if status != invite_index.OPEN_STATUS:
+        return "invite_expired"
+    return None
+
+
+def _fail(error: str) -> None:
+    raise HTTPException(status_code=ERROR_STATUS[error], detail=error)
+
+
+def _public(invite: dict[str, Any]) -> dict[str, Any]:
+    return {field: invite.get(field) for field in PUBLIC_FIELDS}
+
+
+@contextlib.asynccontextmanager
+async def _redeem_lock(token_hash: str) -> AsyncIterator[None]:
+    """One redemption of a token at a time in this process; the entry goes with its last user."""
+    lock, users = _redeeming.get(token_hash, (None, 0))
+    lock = lock or asyncio.Lock()
+    _redeeming[token_hash] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _redeeming[token_hash]
+        if users == 1:
+            del _redeeming[token_hash]
+        else:
+            _redeeming[token_hash] = (lock, users - 1)
+
+
+@router.post("/tenancy-invites/check")
+async def check_invite(token: str = Body(..., embed=True, min_length=1)):
+    lookup = invite_index.invites
+    invite = await lookup.find(invite_index.hash_token(token))
+    error = _problem(invite, lookup.clock())
+    if error is not None:
+        _fail(error)
+    return FastJSONResponse({"valid": True, "invite": _public(invite)})
+
+
+@router.post("/tenancy-invites/redeem")
+async def redeem_invite(
+    token: str = Body(..., min_length=1),
+    redeemed_by_uid: str = Body(..., min_length=1),
+    redeemed_by_email: str | None = Body(None),
+):
+    lookup = invite_index.invites
+    token_hash = invite_index.hash_token(token)
+    async with _redeem_lock(token_hash):
+        invite, version = await datastore.get_versioned(invite_index.INVITES, token_hash)
+        now = lookup.clock()
+        error = _problem(invite, now)
+        if error is not None:
+            # the Node API marks lapsed invites expired; a concurrent write wins over that
+            if error == "invite_expired" and invite.get("status") == invite_index.OPEN_STATUS:
+                with contextlib.suppress(datastore.Conflict):
+                    await datastore.update_document(invite_index.INVITES, token_hash, {"status": "expired"}, version)
+            lookup.apply(token_hash, invite)
+            _fail(error)
+
+        email = _normalize_email(redeemed_by_email)
+        invited = _normalize_email(invite.get("invited_email"))
+        if invited and email and invited != email:
+            _fail("invite_email_mismatch")
+
+        update = {
+            "status": "redeemed",
+            "redeemed_at": int(now),
+            "redeemed_by_uid": redeemed_by_uid.strip(),
+            "redeemed_by_email": email,
+        }
+        try:
+            await datastore.update_document(invite_index.INVITES, token_hash, update, version)
+        except datastore.Conflict:
+            # written elsewhere since the read: drop it so the next check reads it again
+            lookup.apply(token_hash, None)
+            _fail("invite_used")
+        redeemed = {**invite, **update}
+        lookup.apply(token_hash, redeemed)
+    await event_log.writer.append(
+        event_log.build_event(
+            "tenant_invite_redeemed", "tenancy_invite", token_hash,
+            context={
+                "landlord_id": await event_log.landlord_of(invite),
+                "propertyId": invite.get("property_id"), "tenantId": invite.get("tenant_id"),
+                "applicationId": invite.get("application_id"), "rc_prop_id": invite.get("rc_prop_id"),
+            },
+            payload={"tenantId": invite.get("tenant_id"), "redeemedByUid": update["redeemed_by_uid"]},
+            created_by=update["redeemed_by_uid"],
+        )
+    )
+    return FastJSONResponse({"redeemed": True, "invite": _public(redeemed)})
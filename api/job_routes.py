@@ -0,0 +1,82 @@
+"""
+Job routes: enqueue, poll, stream and cancel background jobs.
+
+Jobs are scoped to the landlord that enqueued them; a job ID under another
+landlord's path is a 404. Kinds this service enqueues itself (lease
+deadlines) cannot be enqueued here and are rejected as unknown. The stream route sends the job as NDJSON, one line
+per status change, and ends once the job finishes.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import StreamingResponse
+
+import jobs
+import ledger_export
+import reports  # noqa: F401  registers the report job kinds
+import responses
+from responses import FastJSONResponse
+
+
+router = APIRouter()
+
+
+def _public(job: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in job.items() if key != "seq"}
+
+
+async def _get_or_404(landlord_id: str, job_id: str) -> dict[str, Any]:
+    job = await jobs.runner.get(job_id)
+    if job is None or job["landlord_id"] != landlord_id:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@router.post("/landlords/{landlord_id}/jobs", status_code=202)
+async def enqueue_job(
+    landlord_id: str,
+    kind: str = Body(...),
+    params: dict[str, Any] = Body(default_factory=dict),
+    priority: int = Body(0, ge=jobs.MIN_PRIORITY, le=jobs.MAX_PRIORITY),
+):
+    known = jobs.runner.kinds.get(kind)
+    if known is not None and not known.public:
+        raise HTTPException(status_code=400, detail=f"unknown job kind {kind!r}")
+    try:
+        job = await jobs.runner.enqueue(kind, landlord_id, params, priority)
+    except jobs.UnknownJobKind as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse(
+        _public(job),
+        status_code=202,
+        headers={"Location": f"/landlords/{landlord_id}/jobs/{job['id']}"},
+    )
+
+
+@router.get("/landlords/{landlord_id}/jobs/{job_id}")
+async def get_job(landlord_id: str, job_id: str):
+    return FastJSONResponse(_public(await _get_or_404(landlord_id, job_id)))
+
+
+@router.get("/landlords/{landlord_id}/jobs/{job_id}/stream")
+async def stream_job(landlord_id: str, job_id: str):
+    await _get_or_404(landlord_id, job_id)
+
+    async def lines():
+        async for job in jobs.runner.watch(job_id):
+            yield responses.dumps(_public(job)) + b"\n"
+
+    return StreamingResponse(lines(), media_type=ledger_export.NDJSON_MEDIA_TYPE)
+
+
+@router.delete("/landlords/{landlord_id}/jobs/{job_id}")
+async def cancel_job(landlord_id: str, job_id: str):
+    await _get_or_404(landlord_id, job_id)
+    try:
+        job = await jobs.runner.cancel(job_id)
+    except jobs.JobNotCancellable as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return FastJSONResponse(_public(job))
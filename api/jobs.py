@@ -0,0 +1,482 @@
+"""
+Background jobs for report work that must not run on the event loop.
+
+A job is a row in a local SQLite queue, so the subsystem needs no broker and
+queued work survives a restart. `runner.enqueue(...)` writes the row and
+returns it. The runner keeps one priority heap per executor (higher priority
+first, then FIFO). Its dispatcher starts jobs while the executor has a free
+slot and the job's landlord is under `JOB_MAX_PER_LANDLORD`. A landlord at its
+cap has further jobs parked on its own heap; each finished job hands back one
+parked entry, so a landlord with thousands of queued jobs costs O(log n) per
+dispatch rather than a rescan.
+
+Each job kind names a function and an executor. "process" kinds run on a
+bounded process pool (CPU-bound work such as scoring a payment history).
+"thread" kinds run on a thread pool (blocking I/O clients). A kind can also
+have an async `prepare` step that gathers its input through `datastore` on
+the event loop, so only plain data crosses to the worker.
+
+Cancelling a queued job removes it immediately. Neither pool can interrupt a
+call in flight, so a running job is marked `cancelling` and its result is
+discarded when it returns. On start, jobs a dead process left `running` go
+back to `queued`.
+
+A job enqueued inside a `tracing` trace runs as a linked trace: same trace
+ID, the `job.enqueue` span as parent, with `job.prepare` and `job.execute`
+spans under it.
+
+Kinds registered with `public=False` are enqueued only by this service (the
+lease scheduler's deadlines); the jobs route rejects them. An enqueue that
+passes its own `job_id` is idempotent: the same ID again returns the job
+already stored.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import datetime as dt
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple
+
+import metrics
+import responses
+import tracing
+
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "rentchain-jobs.sqlite3"))
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+JOB_THREAD_WORKERS = int(os.getenv("JOB_THREAD_WORKERS", "8"))
+JOB_MAX_PER_LANDLORD = int(os.getenv("JOB_MAX_PER_LANDLORD", "2"))
+# Watchers re-read the row this often even without a local notification, which
+# covers jobs finished by another instance sharing the database file.
+WATCH_POLL_SECONDS = 15.0
+MIN_PRIORITY, MAX_PRIORITY = -10, 10
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+logger = logging.getLogger("rentchain.jobs")
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+class JobNotCancellable(ValueError):
+    pass
+
+
+class JobKind(NamedTuple):
+    name: str
+    # module-level function: process-pool kinds are pickled by reference
+    run: Callable[[dict[str, Any]], Any]
+    executor: str = "process"
+    # async, runs on the event loop; turns the job row into `run`'s input
+    prepare: Callable[[dict[str, Any]], Awaitable[dict[str, Any]]] | None = None
+    # False: only this service enqueues it, never a caller of the jobs route
+    public: bool = True
+
+
+KINDS: dict[str, JobKind] = {}
+
+
+def register(kind: JobKind) -> JobKind:
+    if kind.executor not in ("process", "thread"):
+        raise ValueError(f"unknown executor {kind.executor!r}")
+    KINDS[kind.name] = kind
+    return kind
+
+
+def _now() -> str:
+    return dt.datetime.now(dt.timezone.utc).isoformat()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    landlord_id TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+_COLUMNS = (
+    "seq", "id", "kind", "landlord_id", "priority", "status", "params", "result", "error",
+    "created_at", "started_at", "finished_at",
+)
+
+
+class JobStore:
+    """SQLite job table. One connection, serialized by a lock; callers run it off the loop."""
+
+    def __init__(self, path: str = JOBS_DB_PATH) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row(row: tuple | None) -> dict[str, Any] | None:
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def insert(self, job: dict[str, Any]) -> dict[str, Any]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (id, kind, landlord_id, priority, status, params, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job["id"], job["kind"], job["landlord_id"], job["priority"], job["status"],
+                    responses.dumps(job["params"]).decode(), job["created_at"],
+                ),
+            )
+        return {**job, "seq": cursor.lastrowid, "result": None, "error": None,
+                "started_at": None, "finished_at": None}
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def transition(self, job_id: str, from_statuses: tuple[str, ...], **fields: Any) -> bool:
+        """Update only if the job is still in one of `from_statuses`."""
+        if "result" in fields:
+            fields["result"] = responses.dumps(fields["result"]).decode()
+        marks = ", ".join("?" for _ in from_statuses)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status IN ({marks})",
+                (*fields.values(), job_id, *from_statuses),
+            )
+        return cursor.rowcount == 1
+
+    def recover(self) -> None:
+        """Requeue jobs a dead process left running; finish ones it was cancelling."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ?",
+                (CANCELLED, _now(), CANCELLING),
+            )
+
+    def queued(self) -> list[tuple[int, int, str, str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT priority, seq, id, landlord_id, kind FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# heap entries: (-priority, seq, job_id, landlord_id, executor)
+_Entry = tuple[int, int, str, str, str]
+
+
+class JobRunner:
+    def __init__(
+        self,
+        store_factory: Callable[[], JobStore] = JobStore,
+        process_workers: int = JOB_PROCESS_WORKERS,
+        thread_workers: int = JOB_THREAD_WORKERS,
+        max_per_landlord: int = JOB_MAX_PER_LANDLORD,
+        kinds: dict[str, JobKind] = KINDS,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self._store_factory = store_factory
+        self._store: JobStore | None = None
+        self.slots = {"process": process_workers, "thread": thread_workers}
+        self.max_per_landlord = max_per_landlord
+        self.kinds = kinds
+        self._pools: dict[str, concurrent.futures.Executor] = {}
+        self._heaps: dict[str, list[_Entry]] = {"process": [], "thread": []}
+        self._parked: dict[str, list[_Entry]] = collections.defaultdict(list)
+        self._busy = collections.Counter()
+        self._per_landlord = collections.Counter()
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._dropped: set[str] = set()
+        # job ID -> (trace, enqueue span ID) for jobs enqueued inside a trace
+        self._links: dict[str, tuple[tracing.Trace, str]] = {}
+        self._watchers: dict[str, set[asyncio.Event]] = collections.defaultdict(set)
+        self._wake: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self.duration = registry.histogram(
+            "job_duration_seconds",
+            "Job run time by kind and final status.",
+            labelnames=("kind", "status"),
+            buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+        )
+        registry.register_collector(
+            "jobs_running", "Jobs currently running.", "gauge",
+            lambda: [({"executor": name}, count) for name, count in self._busy.items()],
+        )
+        registry.register_collector(
+            "jobs_queued", "Jobs waiting for a slot in this process.", "gauge",
+            lambda: [({}, sum(map(len, self._heaps.values())) + sum(map(len, self._parked.values())))],
+        )
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = self._store_factory()
+        return self._store
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        await asyncio.to_thread(self.store.recover)
+        for priority, seq, job_id, landlord_id, kind in await asyncio.to_thread(self.store.queued):
+            executor = self.kinds[kind].executor if kind in self.kinds else "thread"
+            heapq.heappush(self._heaps[executor], (-priority, seq, job_id, landlord_id, executor))
+        self._wake = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="job-dispatcher")
+
+    async def stop(self) -> None:
+        """Stop dispatching. Jobs still running stay `running` and are requeued on next start."""
+        if self._dispatcher is None:
+            return
+        dispatcher, self._dispatcher = self._dispatcher, None
+        tasks = [dispatcher, *self._tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+        for heap in (*self._heaps.values(), *self._parked.values()):
+            heap.clear()
+        self._dropped.clear()
+        self._links.clear()
+        if self._store is not None:
+            store, self._store = self._store, None
+            await asyncio.to_thread(store.close)
+
+    async def enqueue(
+        self, kind: str, landlord_id: str, params: dict[str, Any] | None = None, priority: int = 0,
+        job_id: str | None = None,
+    ) -> dict[str, Any]:
+        if kind not in self.kinds:
+            raise UnknownJobKind(f"unknown job kind {kind!r}")
+        if job_id is not None:
+            existing = await self.get(job_id)
+            if existing is not None:
+                return existing
+        with tracing.span("job.enqueue", kind=kind) as enqueue_span:
+            job = await asyncio.to_thread(self.store.insert, {
+                "id": job_id or uuid.uuid4().hex,
+                "kind": kind,
+                "landlord_id": landlord_id,
+                "priority": priority,
+                "status": QUEUED,
+                "params": params or {},
+                "created_at": _now(),
+            })
+            if enqueue_span.span_id is not None:
+                enqueue_span.set(job_id=job["id"])
+                self._links[job["id"]] = (enqueue_span.trace, enqueue_span.span_id)
+        if self.running:
+            executor = self.kinds[kind].executor
+            heapq.heappush(self._heaps[executor], (-priority, job["seq"], job["id"], landlord_id, executor))
+            self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> dict[str, Any] | None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> dict[str, Any] | None:
+        store = self.store
+        finished = {"status": CANCELLED, "finished_at": _now()}
+        if await asyncio.to_thread(store.transition, job_id, (QUEUED,), **finished):
+            self._links.pop(job_id, None)
+            if self.running:
+                self._dropped.add(job_id)
+        elif not await asyncio.to_thread(store.transition, job_id, (RUNNING,), status=CANCELLING):
+            job = await self.get(job_id)
+            if job is not None and job["status"] != CANCELLING:
+                raise JobNotCancellable(f"job is already {job['status']}")
+            return job
+        self._notify(job_id)
+        return await self.get(job_id)
+
+    async def watch(self, job_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Yield the job now and after every status change, ending once it is terminal."""
+        event = asyncio.Event()
+        self._watchers[job_id].add(event)
+        try:
+            last = None
+            while True:
+                event.clear()
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if job["status"] != last:
+                    last = job["status"]
+                    yield job
+                if last in TERMINAL:
+                    return
+                try:
+                    async with asyncio.timeout(WATCH_POLL_SECONDS):
+                        await event.wait()
+                except TimeoutError:
+                    pass
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    def _notify(self, job_id: str) -> None:
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wake.clear()
+            for executor, heap in self._heaps.items():
+                while heap and self._busy[executor] < self.slots[executor]:
+                    entry = heapq.heappop(heap)
+                    job_id, landlord_id = entry[2], entry[3]
+                    if job_id in self._dropped:
+                        self._dropped.discard(job_id)
+                    elif self._per_landlord[landlord_id] >= self.max_per_landlord:
+                        heapq.heappush(self._parked[landlord_id], entry)
+                    else:
+                        self._launch(entry)
+            await self._wake.wait()
+
+    def _launch(self, entry: _Entry) -> None:
+        job_id, landlord_id, executor = entry[2], entry[3], entry[4]
+        self._busy[executor] += 1
+        self._per_landlord[landlord_id] += 1
+        task = asyncio.create_task(self._execute(job_id), name=f"job-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._release(job_id, landlord_id, executor))
+
+    def _release(self, job_id: str, landlord_id: str, executor: str) -> None:
+        self._tasks.pop(job_id, None)
+        self._busy[executor] -= 1
+        self._per_landlord[landlord_id] -= 1
+        if not self._per_landlord[landlord_id]:
+            del self._per_landlord[landlord_id]
+        parked = self._parked.get(landlord_id)
+        if parked:
+            entry = heapq.heappop(parked)
+            heapq.heappush(self._heaps[entry[4]], entry)
+        if parked is not None and not parked:
+            del self._parked[landlord_id]
+        if self._wake is not None:
+            self._wake.set()
+
+    def _pool(self, executor: str) -> concurrent.futures.Executor:
+        pool = self._pools.get(executor)
+        if pool is None:
+            if executor == "process":
+                # spawn, not fork: the parent has live threads (this pool's
+                # sibling, SQLite, the Firestore client)
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    self.slots["process"], mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(
+                    self.slots["thread"], thread_name_prefix="job-io"
+                )
+            self._pools[executor] = pool
+        return pool
+
+    async def _execute(self, job_id: str) -> None:
+        link = self._links.pop(job_id, None)
+        if link is None:
+            await self._run(job_id)
+            return
+        trace, parent_id = link
+        with tracing.start_trace(
+            "job", trace_id=trace.trace_id, parent_id=parent_id, exporter=trace.exporter, job_id=job_id
+        ):
+            await self._run(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        store = self.store
+        started_at = _now()
+        if not await asyncio.to_thread(
+            store.transition, job_id, (QUEUED,), status=RUNNING, started_at=started_at
+        ):
+            return  # cancelled between dispatch and start
+        self._notify(job_id)
+        job = await self.get(job_id)
+        kind = self.kinds.get(job["kind"])
+        started = time.perf_counter()
+        outcome: dict[str, Any]
+        try:
+            if kind is None:
+                raise UnknownJobKind(f"unknown job kind {job['kind']!r}")
+            if kind.prepare is not None:
+                with tracing.span("job.prepare", kind=job["kind"]):
+                    params = await kind.prepare(job)
+            else:
+                params = job["params"]
+            if (await self.get(job_id))["status"] == CANCELLING:
+                outcome = {"status": CANCELLED}
+            else:
+                loop = asyncio.get_running_loop()
+                with tracing.span("job.execute", kind=job["kind"], executor=kind.executor):
+                    result = await loop.run_in_executor(self._pool(kind.executor), kind.run, params)
+                outcome = {"status": SUCCEEDED, "result": result}
+        except BrokenProcessPool as exc:
+            # a worker died (OOM, segfault); the pool is unusable from here on
+            self._pools.pop("process", None)
+            outcome = {"status": FAILED, "error": f"worker process died: {exc}"}
+        except Exception as exc:
+            logger.warning("job %s (%s) failed", job_id, job["kind"], exc_info=True)
+            outcome = {"status": FAILED, "error": f"{type(exc).__name__}: {exc}"}
+        if outcome["status"] == SUCCEEDED and (await self.get(job_id))["status"] == CANCELLING:
+            outcome = {"status": CANCELLED}
+        await asyncio.to_thread(
+            store.transition, job_id, (RUNNING, CANCELLING), finished_at=_now(), **outcome
+        )
+        self.duration.observe(time.perf_counter() - started, (job["kind"], outcome["status"]))
+        self._notify(job_id)
+
+
+runner = JobRunner()
@@ -0,0 +1,395 @@
+"""
+Materialized dashboard KPIs, one `landlord_kpis` document per landlord.
+
+The KPI strip (occupancy, rent collected this month, arrears, open
+applications) is served from that document, so a read is one document fetch
+instead of a scan of units, leases, applications and the ledger.
+
+Writes made through this API keep the snapshot current with deltas: `record`
+takes the document before and after a lease, application or ledger write and
+applies the difference with `_apply`. A full recompute runs the same `_apply`
+over every document from scratch, so the two paths cannot disagree about what
+counts. Arrears need per-lease balances (an overpaid lease must not offset one
+in arrears). Those are not kept in the snapshot document, which would grow
+with the portfolio towards Firestore's 1 MiB document limit and be rewritten
+whole on every ledger write. They are spread over `KPI_BALANCE_SHARDS`
+documents in the snapshot's `lease_balances` subcollection, picked by a
+stable hash of the lease ID; a ledger delta reads and rewrites only the
+shard of the lease it touches, and the snapshot document holds the totals.
+A snapshot records the shard count it was written with, and one written with
+another count (or before sharding) is recomputed rather than updated. A
+recompute writes only the shards whose balances changed, and stores nothing
+for a landlord with nothing to count, so reading an unknown landlord's KPIs
+creates no documents.
+
+Writes made elsewhere (the Node API, the console, another instance) are not
+seen as deltas. A snapshot older than `KPI_RECOMPUTE_SECONDS` is recomputed
+in the background on its next read, which corrects that drift, and a
+snapshot from an earlier month is recomputed before it is served. `check`
+recomputes without writing and reports every field, and every balance shard,
+that disagrees.
+
+Deltas are serialized per landlord in this process, and property_routes
+patches a document under a per-document lock, so two patches of one document
+cannot both record the same before and after. A write that lands while a
+recompute is reading marks the landlord dirty, and the recompute runs again
+before it stores anything.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import os
+import zlib
+from typing import Any, Callable
+
+import arrears
+import datastore
+import ledger_export
+import metrics
+
+
+KPI_COLLECTION = "landlord_kpis"
+PROPERTIES = "properties"
+UNITS = "units"
+LEASES = "leases"
+APPLICATIONS = "applications"
+LEDGER = ledger_export.LEDGER_COLLECTION
+TRACKED = frozenset({LEASES, APPLICATIONS, LEDGER})
+ACTIVE_LEASE_STATUSES = frozenset({"active"})
+OPEN_APPLICATION_STATUSES = frozenset({"new", "submitted", "in_review", "screening"})
+RECOMPUTE_SECONDS = float(os.getenv("KPI_RECOMPUTE_SECONDS", "3600"))
+# a few hundred thousand leases before any one shard nears 1 MiB
+BALANCE_SHARDS = int(os.getenv("KPI_BALANCE_SHARDS", "64"))
+# recompute passes before a snapshot is stored despite writes still landing
+MAX_PASSES = 3
+# Firestore caps the values of an "in" filter
+IN_FILTER_LIMIT = 30
+COUNTERS = (
+    "units_total", "leases_active", "open_applications",
+    "rent_collected_cents", "arrears_cents", "leases_in_arrears",
+)
+
+logger = logging.getLogger("rentchain.kpis")
+
+
+def _month(value: Any) -> str | None:
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.strftime("%Y-%m")
+    if isinstance(value, str) and len(value) >= 7:
+        return value[:7]
+    return None
+
+
+def _status(document: dict[str, Any]) -> str:
+    return str(document.get("status") or "").lower()
+
+
+def empty_snapshot(landlord_id: str, period: str) -> dict[str, Any]:
+    return {
+        "landlord_id": landlord_id, "period": period, "balance_shards": BALANCE_SHARDS,
+        **dict.fromkeys(COUNTERS, 0), "lease_balances": {},
+    }
+
+
+def balance_collection(landlord_id: str) -> str:
+    return f"{KPI_COLLECTION}/{landlord_id}/lease_balances"
+
+
+def shard_of(lease_id: str) -> str:
+    # crc32 rather than hash(): the shard must be the same in every process
+    return f"{zlib.crc32(lease_id.encode()) % BALANCE_SHARDS:03d}"
+
+
+def shard_ids() -> list[str]:
+    return [f"{index:03d}" for index in range(BALANCE_SHARDS)]
+
+
+def shard_balances(balances: dict[str, int]) -> dict[str, dict[str, int]]:
+    """Every shard's balances, empty ones included, so comparing them finds old entries to clear."""
+    shards: dict[str, dict[str, int]] = {shard_id: {} for shard_id in shard_ids()}
+    for lease_id, balance in balances.items():
+        shards[shard_of(lease_id)][lease_id] = balance
+    return shards
+
+
+def _apply(snapshot: dict[str, Any], collection: str, document: dict[str, Any], sign: int) -> None:
+    """
+    Add (`sign` 1) or take back (`sign` -1) one document's contribution.
+    `snapshot["lease_balances"]` must hold the balance of any lease a ledger
+    entry names: all of them for a recompute, the loaded shards for a delta.
+    """
+    if collection == UNITS:
+        snapshot["units_total"] += sign
+    elif collection == LEASES:
+        if _status(document) in ACTIVE_LEASE_STATUSES:
+            snapshot["leases_active"] += sign
+    elif collection == APPLICATIONS:
+        if _status(document) in OPEN_APPLICATION_STATUSES:
+            snapshot["open_applications"] += sign
+    elif collection == LEDGER:
+        kind = arrears.KINDS.get(document.get("type"))
+        amount = document.get("amount_cents")
+        lease_id = document.get("lease_id")
+        if kind is None or not lease_id or not isinstance(amount, int):
+            return
+        if document.get("type") in ("payment_applied", "payment_reversal") and (
+            _month(document.get("effective_date")) == snapshot["period"]
+        ):
+            snapshot["rent_collected_cents"] += sign * (amount if kind == arrears.CREDIT else -amount)
+        balances = snapshot["lease_balances"]
+        old = balances.get(lease_id, 0)
+        new = old + sign * (-amount if kind == arrears.CREDIT else amount)
+        if new:
+            balances[lease_id] = new
+        else:
+            balances.pop(lease_id, None)
+        snapshot["arrears_cents"] += max(new, 0) - max(old, 0)
+        snapshot["leases_in_arrears"] += (new > 0) - (old > 0)
+
+
+def view(snapshot: dict[str, Any]) -> dict[str, Any]:
+    """The KPI strip as served: counters plus occupancy, without per-lease balances."""
+    units = snapshot["units_total"]
+    occupancy = min(snapshot["leases_active"] / units, 1.0) if units else 0.0
+    hidden = ("id", "lease_balances", "balance_shards")
+    shown = {key: value for key, value in snapshot.items() if key not in hidden}
+    return {**shown, "occupancy": round(occupancy, 4)}
+
+
+def _empty(snapshot: dict[str, Any]) -> bool:
+    return not any(snapshot[counter] for counter in COUNTERS) and not snapshot["lease_balances"]
+
+
+def _totals(snapshot: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in snapshot.items() if key != "lease_balances"}
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+class KpiSnapshots:
+    def __init__(
+        self,
+        recompute_seconds: float = RECOMPUTE_SECONDS,
+        clock: Callable[[], dt.datetime] = _utcnow,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self.recompute_seconds = recompute_seconds
+        self.clock = clock
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._recomputing: dict[str, asyncio.Task] = {}
+        self._dirty: set[str] = set()
+        self.recomputes = registry.counter(
+            "kpi_recomputes_total", "Full KPI snapshot recomputes, by reason.", labelnames=("reason",)
+        )
+        self.deltas = registry.counter("kpi_deltas_total", "Writes applied to KPI snapshots as deltas.")
+        self.drift = registry.counter(
+            "kpi_drift_total", "KPI fields a recompute found out of date.", labelnames=("field",)
+        )
+
+    def _lock(self, landlord_id: str) -> asyncio.Lock:
+        lock = self._locks.get(landlord_id)
+        if lock is None:
+            lock = self._locks[landlord_id] = asyncio.Lock()
+        return lock
+
+    def period(self) -> str:
+        return self.clock().strftime("%Y-%m")
+
+    def _current(self, snapshot: dict[str, Any]) -> bool:
+        """Written for this month, with the configured balance shards."""
+        return snapshot.get("period") == self.period() and snapshot.get("balance_shards") == BALANCE_SHARDS
+
+    async def _landlord_of(self, document: dict[str, Any]) -> str | None:
+        landlord_id = document.get("landlord_id")
+        if landlord_id or not document.get("rc_prop_id"):
+            return landlord_id
+        prop = await datastore.get_document(PROPERTIES, document["rc_prop_id"])
+        return prop.get("landlord_id") if prop is not None else None
+
+    async def record(
+        self, collection: str, before: dict[str, Any] | None, after: dict[str, Any] | None
+    ) -> None:
+        """Apply one write to the owning landlord's snapshot, if there is one to keep current."""
+        if collection not in TRACKED:
+            return
+        changes: dict[str, list[tuple[dict[str, Any], int]]] = {}
+        for document, sign in ((before, -1), (after, 1)):
+            if document is not None:
+                landlord_id = await self._landlord_of(document)
+                if landlord_id:
+                    changes.setdefault(landlord_id, []).append((document, sign))
+        for landlord_id, documents in changes.items():
+            async with self._lock(landlord_id):
+                if landlord_id in self._recomputing:
+                    self._dirty.add(landlord_id)
+                    continue
+                snapshot = await datastore.get_document(KPI_COLLECTION, landlord_id)
+                # nothing materialized yet, or a stale month or layout: the next read recomputes
+                if snapshot is None or not self._current(snapshot):
+                    continue
+                snapshot.pop("id", None)
+                touched = sorted({
+                    shard_of(document["lease_id"]) for document, _ in documents
+                    if collection == LEDGER and document.get("lease_id")
+                })
+                shards = await datastore.get_documents(balance_collection(landlord_id), touched)
+                snapshot["lease_balances"] = {
+                    lease_id: balance
+                    for shard in shards.values()
+                    for lease_id, balance in shard.get("balances", {}).items()
+                }
+                for document, sign in documents:
+                    _apply(snapshot, collection, document, sign)
+                if touched:
+                    balances = snapshot["lease_balances"]
+                    await datastore.set_documents(balance_collection(landlord_id), {
+                        shard_id: {"balances": {
+                            lease_id: balance for lease_id, balance in balances.items()
+                            if shard_of(lease_id) == shard_id
+                        }}
+                        for shard_id in touched
+                    })
+                snapshot["updated_at"] = self.clock()
+                await datastore.set_document(KPI_COLLECTION, landlord_id, _totals(snapshot))
+                self.deltas.inc()
+
+    async def _collect(self, collection: str, field: str, values: list[str]) -> list[datastore.Document]:
+        documents = []
+        for start in range(0, len(values), IN_FILTER_LIMIT):
+            chunk = values[start:start + IN_FILTER_LIMIT]
+            async for document in datastore.query_all(collection, filters=[(field, "in", chunk)]):
+                documents.append(document)
+        return documents
+
+    async def compute(self, landlord_id: str) -> dict[str, Any]:
+        """A snapshot built from scratch. Reads every source collection; writes nothing."""
+        snapshot = empty_snapshot(landlord_id, self.period())
+        prop_ids = [
+            prop["id"]
+            async for prop in datastore.query_all(PROPERTIES, filters=[("landlord_id", "==", landlord_id)])
+        ]
+        sources = await asyncio.gather(
+            *(self._collect(collection, "rc_prop_id", prop_ids) for collection in (UNITS, LEASES, APPLICATIONS))
+        )
+        for collection, documents in zip((UNITS, LEASES, APPLICATIONS), sources):
+            for document in documents:
+                _apply(snapshot, collection, document, 1)
+        async for entry in datastore.query_all(LEDGER, filters=[("landlord_id", "==", landlord_id)]):
+            _apply(snapshot, LEDGER, entry, 1)
+        return snapshot
+
+    async def _stored(self, landlord_id: str) -> tuple[dict[str, Any] | None, dict[str, dict[str, int]]]:
+        """The stored snapshot and the balance shards that exist (one batched read for all of them)."""
+        stored = await datastore.get_document(KPI_COLLECTION, landlord_id)
+        shards = await datastore.get_documents(balance_collection(landlord_id), shard_ids())
+        return stored, {shard_id: shard.get("balances", {}) for shard_id, shard in shards.items()}
+
+    def _compare(
+        self, stored: dict[str, Any] | None, shards: dict[str, dict[str, int]], fresh: dict[str, Any]
+    ) -> dict[str, dict[str, Any]]:
+        if stored is None:
+            return {}
+        fields = COUNTERS + ("period", "balance_shards")
+        drift = {
+            field: {"snapshot": stored.get(field), "recomputed": fresh[field]}
+            for field in fields
+            if stored.get(field) != fresh[field]
+        }
+        differing = [
+            shard_id for shard_id, balances in shard_balances(fresh["lease_balances"]).items()
+            if shards.get(shard_id, {}) != balances
+        ]
+        if differing:
+            drift["lease_balances"] = {
+                "snapshot": sum(len(balances) for balances in shards.values()),
+                "recomputed": len(fresh["lease_balances"]),
+                "shards": differing,
+            }
+        return drift
+
+    def _start(self, landlord_id: str, reason: str) -> asyncio.Task:
+        task = self._recomputing.get(landlord_id)
+        if task is None:
+            task = self._recomputing[landlord_id] = asyncio.create_task(
+                self._recompute(landlord_id, reason), name=f"kpi-recompute-{landlord_id}"
+            )
+            task.add_done_callback(lambda done: self._finished(landlord_id, done))
+        return task
+
+    def _finished(self, landlord_id: str, task: asyncio.Task) -> None:
+        if self._recomputing.get(landlord_id) is task:
+            del self._recomputing[landlord_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("KPI recompute failed for landlord %s", landlord_id, exc_info=task.exception())
+
+    async def recompute(self, landlord_id: str, reason: str = "scheduled") -> dict[str, Any]:
+        """Rebuild and store the snapshot. Concurrent callers for one landlord share the work."""
+        return await asyncio.shield(self._start(landlord_id, reason))
+
+    async def _recompute(self, landlord_id: str, reason: str) -> dict[str, Any]:
+        self.recomputes.inc((reason,))
+        passes = 0
+        while True:
+            passes += 1
+            self._dirty.discard(landlord_id)
+            fresh = await self.compute(landlord_id)
+            async with self._lock(landlord_id):
+                # a write landed mid-read; read again rather than store a half-seen state
+                if landlord_id in self._dirty and passes < MAX_PASSES:
+                    continue
+                stored, shards = await self._stored(landlord_id)
+                # nothing to count (an unknown landlord, say): store nothing, the next read looks again
+                if stored is None and _empty(fresh):
+                    return fresh
+                if stored is not None and self._current(stored):
+                    for field in self._compare(stored, shards, fresh):
+                        self.drift.inc((field,))
+                fresh["updated_at"] = fresh["recomputed_at"] = self.clock()
+                # only shards that differ; an empty shard is written only to clear one that exists
+                changed = {
+                    shard_id: {"balances": balances}
+                    for shard_id, balances in shard_balances(fresh["lease_balances"]).items()
+                    if shards.get(shard_id, {}) != balances
+                }
+                # shards first: a snapshot is never stored ahead of its balances
+                if changed:
+                    await datastore.set_documents(balance_collection(landlord_id), changed)
+                await datastore.set_document(KPI_COLLECTION, landlord_id, _totals(fresh))
+                return fresh
+
+    async def read(self, landlord_id: str) -> dict[str, Any]:
+        snapshot = await datastore.get_document(KPI_COLLECTION, landlord_id)
+        if snapshot is None:
+            return view(await self.recompute(landlord_id, reason="missing"))
+        if snapshot.get("period") != self.period():
+            return view(await self.recompute(landlord_id, reason="new_period"))
+        if snapshot.get("balance_shards") != BALANCE_SHARDS:
+            return view(await self.recompute(landlord_id, reason="layout"))
+        recomputed_at = snapshot.get("recomputed_at")
+        stale = recomputed_at is None or (
+            (self.clock() - recomputed_at).total_seconds() > self.recompute_seconds
+        )
+        if stale:
+            self._start(landlord_id, "scheduled")
+        return view(snapshot)
+
+    async def check(self, landlord_id: str) -> dict[str, Any]:
+        """Compare the stored snapshot against a full recompute, without writing either."""
+        stored, shards = await self._stored(landlord_id)
+        fresh = await self.compute(landlord_id)
+        drift = self._compare(stored, shards, fresh)
+        return {
+            "landlord_id": landlord_id,
+            "materialized": stored is not None,
+            "consistent": stored is not None and not drift,
+            "drift": drift,
+            "recomputed": view(fresh),
+        }
+
+
+snapshots = KpiSnapshots()
@@ -0,0 +1,433 @@
+"""
+Lease deadline scheduler: renewal reminders, notice deadlines and expiries.
+
+Each active lease has up to three deadlines, all derived from its end date:
+
+- `lease_renewal`: `LEASE_RENEWAL_LEAD_DAYS` before the end (the Node API's
+  default reminder window, 120 days);
+- `lease_notice`: the lease's own `nextNoticeDueAt` or `noticeLeadDays` when
+  the Node notice workflow has set them, else `LEASE_NOTICE_LEAD_DAYS`;
+- `lease_expiry`: the end date itself.
+
+Deadlines are kept in one min-heap of due times. A single task sleeps until
+the top of the heap is due; a write that adds an earlier deadline wakes it
+early. Nothing is scanned on a timer. A due deadline enqueues a job of the
+same kind on `jobs.runner` for the lease's landlord and appends a
+`<kind>_due` event to `event_log`, which the Node workflow reads to send the
+notice itself. The lease is then stamped `<kind>_dispatched_for: <end date>`
+so the deadline is not dispatched again, after a restart or by the next load;
+a new end date (a renewal) starts a new cycle. The job ID is derived from the
+lease, kind and end date, so a dispatch retried after a failed stamp finds
+the job it already enqueued rather than adding another. These job kinds are
+not public: the jobs route rejects them, and a job's lease must belong to
+the job's landlord.
+
+On start the heap is loaded with one bounded query: leases ordered by
+`end_date` between `LEASE_SCHEDULER_CATCHUP_DAYS` ago and
+`LEASE_SCHEDULER_HORIZON_DAYS` ahead, at most `LEASE_SCHEDULER_MAX_LEASES`.
+Deadlines missed while the service was down are dispatched at once; renewal
+and notice deadlines are dropped once the lease has ended. The load is
+repeated every `LEASE_SCHEDULER_REFRESH_SECONDS` (a heap entry like any
+other) to pick up leases written by the Node API, and sooner if the query was
+truncated. Lease patches through this API are applied with `track`.
+
+The Node API stores the end date as `leaseEndDate`; the query runs on
+`LEASE_SCHEDULER_END_FIELD` (`end_date`, as written by this API), and reads
+fall back to the Node field names. Every process that runs the scheduler
+dispatches, so enable it (`LEASE_SCHEDULER_ENABLED=true`) on one instance.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import heapq
+import itertools
+import logging
+import os
+import uuid
+from typing import Any, Callable
+
+import datastore
+import event_log
+import jobs
+import metrics
+
+
+LEASES = "leases"
+PROPERTIES = "properties"
+ENABLED = os.getenv("LEASE_SCHEDULER_ENABLED", "false").lower() == "true"
+END_FIELD = os.getenv("LEASE_SCHEDULER_END_FIELD", "end_date")
+RENEWAL_LEAD_DAYS = int(os.getenv("LEASE_RENEWAL_LEAD_DAYS", "120"))
+NOTICE_LEAD_DAYS = int(os.getenv("LEASE_NOTICE_LEAD_DAYS", "60"))
+HORIZON_DAYS = int(os.getenv("LEASE_SCHEDULER_HORIZON_DAYS", "180"))
+CATCHUP_DAYS = int(os.getenv("LEASE_SCHEDULER_CATCHUP_DAYS", "7"))
+MAX_LEASES = int(os.getenv("LEASE_SCHEDULER_MAX_LEASES", "20000"))
+REFRESH_SECONDS = float(os.getenv("LEASE_SCHEDULER_REFRESH_SECONDS", "86400"))
+RETRY_SECONDS = 60.0
+ACTIVE_STATUSES = frozenset({"active", "renewal_pending", "renewal_accepted"})
+END_FIELDS = ("leaseEndDate", "endDate", "leaseEnd")
+
+RENEWAL = "lease_renewal"
+NOTICE = "lease_notice"
+EXPIRY = "lease_expiry"
+REFRESH = "refresh"
+# compact the heap once it holds this many times more entries than are live
+COMPACT_RATIO = 2
+
+logger = logging.getLogger("rentchain.lease_scheduler")
+
+# (due, seq, lease_id, kind, end_date); seq keeps equal due times FIFO
+Entry = tuple[float, int, str, str, str]
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+def _date(value: Any) -> dt.date | None:
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return dt.date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def end_date(lease: dict[str, Any]) -> dt.date | None:
+    for field in (END_FIELD, *END_FIELDS):
+        day = _date(lease.get(field))
+        if day is not None:
+            return day
+    return None
+
+
+def _midnight(day: dt.date) -> float:
+    return dt.datetime(day.year, day.month, day.day, tzinfo=dt.timezone.utc).timestamp()
+
+
+def marker(kind: str) -> str:
+    return f"{kind}_dispatched_for"
+
+
+def job_id(lease_id: str, kind: str, end_iso: str) -> str:
+    """One job per deadline, however many times its dispatch is retried."""
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"rentchain:{kind}:{lease_id}:{end_iso}").hex
+
+
+async def landlord_of(lease: dict[str, Any]) -> str | None:
+    landlord_id = lease.get("landlord_id") or lease.get("landlordId")
+    if landlord_id or not lease.get("rc_prop_id"):
+        return landlord_id
+    prop = await datastore.get_document(PROPERTIES, lease["rc_prop_id"])
+    return prop.get("landlord_id") if prop is not None else None
+
+
+def deadlines(
+    lease: dict[str, Any],
+    today: dt.date,
+    renewal_lead_days: int = RENEWAL_LEAD_DAYS,
+    notice_lead_days: int = NOTICE_LEAD_DAYS,
+) -> list[tuple[float, str, str]]:
+    """`(due, kind, end_date)` for each deadline of `lease` not yet dispatched."""
+    if str(lease.get("status") or "").lower() not in ACTIVE_STATUSES:
+        return []
+    end = end_date(lease)
+    if end is None:
+        return []
+    end_iso = end.isoformat()
+    lead = lease.get("noticeLeadDays", lease.get("notice_lead_days"))
+    notice_due = lease.get("nextNoticeDueAt")
+    if isinstance(notice_due, (int, float)) and notice_due > 0:
+        notice = notice_due / 1000
+    else:
+        lead = lead if isinstance(lead, int) and lead >= 0 else notice_lead_days
+        notice = _midnight(end - dt.timedelta(days=lead))
+    due = {
+        RENEWAL: _midnight(end - dt.timedelta(days=renewal_lead_days)),
+        NOTICE: notice,
+        EXPIRY: _midnight(end),
+    }
+    found = []
+    for kind, when in due.items():
+        if lease.get(marker(kind)) == end_iso:
+            continue
+        # a renewal reminder or notice for a lease that has already ended is moot
+        if kind != EXPIRY and end < today:
+            continue
+        found.append((when, kind, end_iso))
+    return found
+
+
+class LeaseScheduler:
+    def __init__(
+        self,
+        renewal_lead_days: int = RENEWAL_LEAD_DAYS,
+        notice_lead_days: int = NOTICE_LEAD_DAYS,
+        horizon_days: int = HORIZON_DAYS,
+        catchup_days: int = CATCHUP_DAYS,
+        max_leases: int = MAX_LEASES,
+        refresh_seconds: float = REFRESH_SECONDS,
+        clock: Callable[[], dt.datetime] = _utcnow,
+        runner: jobs.JobRunner | None = None,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        if horizon_days <= max(renewal_lead_days, notice_lead_days):
+            raise ValueError("horizon_days must exceed the longest lead time")
+        if max_leases < 1:
+            raise ValueError("max_leases must be >= 1")
+        self.renewal_lead_days = renewal_lead_days
+        self.notice_lead_days = notice_lead_days
+        self.horizon_days = horizon_days
+        self.catchup_days = catchup_days
+        self.max_leases = max_leases
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self._runner = runner
+        self._heap: list[Entry] = []
+        # live entries per lease; anything else in the heap is stale
+        self._entries: dict[str, list[Entry]] = {}
+        self._seq = itertools.count()
+        # end dates past this were not loaded; `track` leaves them to the next load
+        self.loaded_until: dt.date | None = None
+        self.loads = 0
+        self._pending: list[dict[str, Any]] | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.dispatched = registry.counter(
+            "lease_deadlines_dispatched_total",
+            "Lease deadlines dispatched as jobs, by kind.",
+            labelnames=("kind",),
+        )
+        registry.register_collector(
+            "lease_deadlines_scheduled", "Lease deadlines waiting in the scheduler heap.", "gauge",
+            lambda: [({}, sum(map(len, self._entries.values())))],
+        )
+
+    @property
+    def runner(self) -> jobs.JobRunner:
+        return self._runner if self._runner is not None else jobs.runner
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def heap_size(self) -> int:
+        return len(self._heap)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for lease_id, entries in self._entries.items() if lease_id)
+
+    def next_due(self) -> float | None:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _live(self, entry: Entry) -> bool:
+        return entry in self._entries.get(entry[2], ())
+
+    def _drop_stale(self) -> None:
+        heap = self._heap
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+
+    def _push(self, due: float, lease_id: str, kind: str, end_iso: str) -> None:
+        entry = (due, next(self._seq), lease_id, kind, end_iso)
+        self._entries.setdefault(lease_id, []).append(entry)
+        heap = self._heap
+        heapq.heappush(heap, entry)
+        if self._wake is not None and heap[0] is entry:
+            self._wake.set()
+
+    def _schedule(self, lease: dict[str, Any]) -> None:
+        lease_id = lease.get("lease_id") or lease.get("id")
+        if not lease_id:
+            return
+        self._entries.pop(lease_id, None)
+        end = end_date(lease)
+        if end is None or (self.loaded_until is not None and end > self.loaded_until):
+            return
+        today = self.clock().date()
+        for due, kind, end_iso in deadlines(lease, today, self.renewal_lead_days, self.notice_lead_days):
+            self._push(due, lease_id, kind, end_iso)
+        if len(self._heap) > COMPACT_RATIO * len(self) + 64:
+            self._heap = [entry for entries in self._entries.values() for entry in entries]
+            heapq.heapify(self._heap)
+
+    def track(self, lease: dict[str, Any] | None, lease_id: str | None = None) -> None:
+        """Reschedule one lease after a write; `lease` is the document as written, None if deleted."""
+        if lease is None:
+            self._entries.pop(lease_id, None)
+            return
+        if self.loads:
+            self._schedule(lease)
+        if self._pending is not None:
+            self._pending.append(lease)
+
+    async def load(self) -> int:
+        """Replace the heap with one bounded query's worth of leases; returns how many were read."""
+        now = self.clock()
+        today = now.date()
+        low = (today - dt.timedelta(days=self.catchup_days)).isoformat()
+        high = today + dt.timedelta(days=self.horizon_days)
+        self._pending = []
+        try:
+            leases = await datastore.query_page(
+                LEASES,
+                filters=[(END_FIELD, ">=", low), (END_FIELD, "<=", high.isoformat())],
+                order_by=[END_FIELD],
+                limit=self.max_leases,
+            )
+            refresh = now.timestamp() + self.refresh_seconds
+            if len(leases) >= self.max_leases:
+                # the query was cut short: leases past the last one are read before they come due
+                high = end_date(leases[-1]) or high
+                longest = max(self.renewal_lead_days, self.notice_lead_days)
+                unread = _midnight(high - dt.timedelta(days=longest))
+                refresh = min(refresh, max(unread, now.timestamp() + RETRY_SECONDS))
+                logger.warning(
+                    "lease scheduler load truncated at %d leases (through %s); raise LEASE_SCHEDULER_MAX_LEASES",
+                    len(leases), high,
+                )
+            self._heap, self._entries, self.loaded_until = [], {}, high
+            self.loads += 1
+            for lease in leases:
+                self._schedule(lease)
+            for lease in self._pending:
+                self._schedule(lease)
+            self._push(refresh, "", REFRESH, "")
+            return len(leases)
+        finally:
+            self._pending = None
+
+    async def _dispatch(self, lease_id: str, kind: str, end_iso: str) -> dict[str, Any] | None:
+        # the heap can be a load behind; the lease as stored now decides
+        lease = await datastore.get_document(LEASES, lease_id)
+        if lease is None:
+            return None
+        today = self.clock().date()
+        due = deadlines(lease, today, self.renewal_lead_days, self.notice_lead_days)
+        if not any(item[1:] == (kind, end_iso) for item in due):
+            return None
+        landlord_id = await landlord_of(lease)
+        if not landlord_id:
+            logger.warning("lease %s has no landlord; %s deadline skipped", lease_id, kind)
+            return None
+        params = {"lease_id": lease_id, "end_date": end_iso}
+        job = await self.runner.enqueue(kind, landlord_id, params, job_id=job_id(lease_id, kind, end_iso))
+        await datastore.set_document(LEASES, lease_id, {marker(kind): end_iso}, merge=True)
+        await event_log.writer.append(
+            event_log.build_event(
+                f"{kind}_due", "lease", lease_id,
+                context={"landlord_id": landlord_id, "rc_prop_id": lease.get("rc_prop_id"),
+                         "tenantId": lease.get("tenant_id")},
+                payload={"endDate": end_iso, "jobId": job["id"]},
+            )
+        )
+        self.dispatched.inc((kind,))
+        return job
+
+    async def run_due(self) -> list[dict[str, Any]]:
+        """Dispatch every deadline that is due now; returns the jobs enqueued."""
+        now = self.clock().timestamp()
+        enqueued = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return enqueued
+            entry = heapq.heappop(self._heap)
+            due, _, lease_id, kind, end_iso = entry
+            self._entries[lease_id].remove(entry)
+            if not self._entries[lease_id]:
+                del self._entries[lease_id]
+            try:
+                if kind == REFRESH:
+                    await self.load()
+                    continue
+                job = await self._dispatch(lease_id, kind, end_iso)
+            except Exception:
+                logger.warning("lease %s %s dispatch failed; retrying", lease_id or "-", kind, exc_info=True)
+                self._push(now + RETRY_SECONDS, lease_id, kind, end_iso)
+                continue
+            if job is not None:
+                enqueued.append(job)
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_due()
+            self._wake.clear()
+            due = self.next_due()
+            delay = None if due is None else max(due - self.clock().timestamp(), 0.0)
+            try:
+                async with asyncio.timeout(delay):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        try:
+            await self.load()
+        except Exception:
+            # the loop retries the load rather than failing startup
+            logger.warning("lease scheduler load failed", exc_info=True)
+            self._push(self.clock().timestamp() + RETRY_SECONDS, "", REFRESH, "")
+        self._task = asyncio.create_task(self._run(), name="lease-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self._wake = None
+
+
+async def load_lease(job: dict[str, Any]) -> dict[str, Any]:
+    lease_id = job["params"].get("lease_id")
+    if not lease_id:
+        raise ValueError("lease_id is required")
+    lease = await datastore.get_document(LEASES, lease_id)
+    # another landlord's lease is reported as missing, not described
+    if lease is None or await landlord_of(lease) != job["landlord_id"]:
+        raise ValueError(f"lease {lease_id} not found")
+    return {
+        "kind": job["kind"],
+        "lease_id": lease_id,
+        "end_date": job["params"].get("end_date"),
+        "rc_prop_id": lease.get("rc_prop_id"),
+        "unit_id": lease.get("unit_id"),
+        "tenant_id": lease.get("tenant_id"),
+        "status": lease.get("status"),
+        "as_of": _utcnow().date().isoformat(),
+    }
+
+
+ACTIONS = {RENEWAL: "offer_renewal", NOTICE: "serve_notice", EXPIRY: "close_out"}
+
+
+def lease_deadline(params: dict[str, Any]) -> dict[str, Any]:
+    """The action a deadline asks of the landlord; delivery stays with the Node workflow."""
+    end = dt.date.fromisoformat(params["end_date"])
+    return {
+        "action": ACTIONS[params["kind"]],
+        "lease_id": params["lease_id"],
+        "rc_prop_id": params["rc_prop_id"],
+        "unit_id": params["unit_id"],
+        "tenant_id": params["tenant_id"],
+        "lease_status": params["status"],
+        "end_date": params["end_date"],
+        "days_until_end": (end - dt.date.fromisoformat(params["as_of"])).days,
+    }
+
+
+for _kind in (RENEWAL, NOTICE, EXPIRY):
+    jobs.register(jobs.JobKind(_kind, lease_deadline, executor="thread", prepare=load_lease, public=False))
+
+scheduler = LeaseScheduler()
@@ -0,0 +1,104 @@
+"""
+Streaming NDJSON export of a landlord's rent ledger.
+
+Entries are read one page at a time, ordered by `created_at` then document ID,
+and written to the response as they arrive, so memory stays at one page no
+matter how large the ledger is. Every line carries an opaque cursor for that
+entry; a client whose connection drops resumes by sending the cursor of the
+last line it received.
+
+With `fields`, the query selects only those fields (plus `created_at`, which
+the cursor needs) and each entry is pruned to them. With `packed`, each entry
+is one MessagePack object instead of a JSON line, same shape; the objects are
+concatenated, as `msgpack.Unpacker` reads them.
+
+Cursors only encode a position. The landlord filter is always applied from the
+route, so a forged cursor can at most skip within the caller's own ledger.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import json
+from typing import Any, AsyncIterator
+
+import datastore
+import projection
+import responses
+
+
+LEDGER_COLLECTION = "ledger_entries"
+ORDER_FIELD = "created_at"
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+NDJSON_MEDIA_TYPE = responses.NDJSON_MEDIA_TYPE
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(entry: datastore.Document) -> str:
+    value = entry.get(ORDER_FIELD)
+    if isinstance(value, dt.datetime):
+        position = {"ts": value.isoformat(), "id": entry["id"]}
+    else:
+        position = {"v": value, "id": entry["id"]}
+    raw = json.dumps(position, separators=(",", ":"), default=_json_default).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if "ts" in position:
+            value = dt.datetime.fromisoformat(position["ts"])
+        else:
+            value = position["v"]
+        doc_id = position["id"]
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor("invalid ledger cursor") from exc
+    if not isinstance(doc_id, str):
+        raise InvalidCursor("invalid ledger cursor")
+    return value, doc_id
+
+
+async def stream_ledger(
+    landlord_id: str,
+    cursor: str | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    fields: projection.Fields | None = None,
+    packed: bool = False,
+) -> AsyncIterator[bytes]:
+    """Yield NDJSON (or MessagePack), one chunk per page. Call `decode_cursor` first to validate."""
+    start_after = list(decode_cursor(cursor)) if cursor else None
+    select = None if fields is None else [*projection.top_level(fields), ORDER_FIELD]
+    while True:
+        page = await datastore.query_page(
+            LEDGER_COLLECTION,
+            filters=[("landlord_id", "==", landlord_id)],
+            order_by=[ORDER_FIELD],
+            start_after=start_after,
+            limit=page_size,
+            select=select,
+        )
+        if not page:
+            return
+        encode = responses.msgpack_dumps if packed else responses.dumps
+        records = [
+            encode({"cursor": encode_cursor(entry), "entry": projection.project(entry, fields)})
+            for entry in page
+        ]
+        yield b"".join(records) if packed else b"\n".join(records) + b"\n"
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        start_after = [last.get(ORDER_FIELD), last["id"]]
@@ -0,0 +1,99 @@
+"""
+Per-request batching document loaders (DataLoader pattern).
+
+`load(key)` queues the key and returns a future. Keys queued during the same
+event-loop tick are resolved together with one `datastore.get_documents`
+call per collection, so rendering N child documents costs one `get_all`
+instead of N reads. Keys are memoized for the life of the loader, which
+deduplicates them within a request. Create one `Loaders` per request (the
+FastAPI dependency does this) so nothing leaks between requests or landlords.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Iterable
+
+import datastore
+
+
+MAX_BATCH_SIZE = 300
+
+BatchFn = Callable[[str, list[str]], Awaitable[dict[str, datastore.Document]]]
+
+
+class DocumentLoader:
+    def __init__(
+        self,
+        collection: str,
+        batch_fn: BatchFn = datastore.get_documents,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ) -> None:
+        self.collection = collection
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._futures: dict[str, asyncio.Future] = {}
+        self._queue: list[str] = []
+        self._dispatch_scheduled = False
+        self.batches = 0
+
+    def prime(self, key: str, document: datastore.Document | None) -> None:
+        """Seed a document the request already has, e.g. from a query."""
+        if key not in self._futures:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(document)
+            self._futures[key] = future
+
+    def load(self, key: str) -> Awaitable[datastore.Document | None]:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._queue.append(key)
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                loop.call_soon(self._dispatch)
+        return asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[str]) -> list[datastore.Document | None]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self) -> None:
+        self._dispatch_scheduled = False
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self._max_batch_size):
+            asyncio.ensure_future(self._resolve(queue[start:start + self._max_batch_size]))
+
+    async def _resolve(self, keys: list[str]) -> None:
+        self.batches += 1
+        try:
+            documents = await self._batch_fn(self.collection, keys)
+        except Exception as exc:
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for key in keys:
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(documents.get(key))
+
+
+class Loaders:
+    """One DocumentLoader per collection, created on first use."""
+
+    def __init__(self, batch_fn: BatchFn = datastore.get_documents) -> None:
+        self._batch_fn = batch_fn
+        self._loaders: dict[str, DocumentLoader] = {}
+
+    def __getitem__(self, collection: str) -> DocumentLoader:
+        loader = self._loaders.get(collection)
+        if loader is None:
+            loader = self._loaders[collection] = DocumentLoader(collection, self._batch_fn)
+        return loader
+
+
+def request_loaders() -> Loaders:
+    """FastAPI dependency: a fresh set of loaders for each request."""
+    return Loaders()
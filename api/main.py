@@ -1,19 +1,198 @@
-from fastapi import FastAPI
+import contextlib
+import datetime as dt
+import os
+import uuid
+from typing import Any
 
-app = FastAPI(
-    title="Rentchain Landlord API",
-    version="0.1.0",
-    description="Backend for landlord dashboard, tenant data, and credit reporting."
-)
+from fastapi import APIRouter, Body, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-@app.get("/health")
+import arrears
+import datastore
+import db_health
+import event_log
+import event_stream
+import firestore_client
+import idempotency
+import identity_routes
+import invite_routes
+import job_routes
+import jobs
+import kpis
+import lease_scheduler
+import ledger_export
+import metrics
+import profiler
+import projection
+import property_routes
+import rate_limit
+import repository
+import responses
+import tracing
+
+# Route modules only import the stdlib and FastAPI. Heavy SDKs (google-cloud-
+# firestore, report/PDF tooling) are imported by their subsystem on first use,
+# or in the lifespan hook when warmup is requested.
+WARM_FIRESTORE_ON_STARTUP = os.getenv("WARM_FIRESTORE_ON_STARTUP", "false").lower() == "true"
+# Bodies smaller than this are sent uncompressed; gzip costs more than it saves.
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+router = APIRouter()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARM_FIRESTORE_ON_STARTUP and repository.BACKEND == "firestore":
+        async with firestore_client.get_pool().acquire():
+            pass
+    await event_log.writer.start()
+    await jobs.runner.start()
+    if lease_scheduler.ENABLED:
+        await lease_scheduler.scheduler.start()
+    yield
+    await lease_scheduler.scheduler.stop()
+    await jobs.runner.stop()
+    await event_stream.hub.stop()
+    await event_log.writer.stop()
+    await firestore_client.close_pool()
+    if tracing.default_exporter is not None:
+        tracing.default_exporter.close()
+
+
+@router.get("/health")
 def health_check():
     return {"status": "ok", "service": "rentchain-api"}
-@app.get("/health/db")
-def health_db():
-    # Placeholder for now – later we’ll actually ping Firestore here.
-    return {
-        "status": "ok",
-        "service": "rentchain-api",
-        "database": "firestore-configured"
+@router.get("/health/db")
+async def health_db():
+    result = await db_health.probe.check()
+    status_code = 200 if result["status"] == "ok" else 503
+    return JSONResponse(result, status_code=status_code)
+
+@router.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/landlords/{landlord_id}/ledger/export")
+def export_ledger(
+    landlord_id: str,
+    cursor: str | None = None,
+    page_size: int = Query(ledger_export.DEFAULT_PAGE_SIZE, ge=1, le=ledger_export.MAX_PAGE_SIZE),
+    fields: projection.Fields | None = Depends(projection.fields_param),
+):
+    if cursor:
+        try:
+            ledger_export.decode_cursor(cursor)
+        except ledger_export.InvalidCursor as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    packed = responses.wants_msgpack()
+    return StreamingResponse(
+        ledger_export.stream_ledger(landlord_id, cursor, page_size, fields, packed),
+        media_type=responses.MSGPACK_MEDIA_TYPE if packed else ledger_export.NDJSON_MEDIA_TYPE,
+    )
+
+
+@router.post("/landlords/{landlord_id}/ledger/entries", status_code=201)
+async def append_ledger_entry(landlord_id: str, entry: dict[str, Any] = Body(...)):
+    if entry.get("type") not in arrears.KINDS:
+        raise HTTPException(status_code=400, detail="unknown ledger entry type")
+    if not entry.get("lease_id"):
+        raise HTTPException(status_code=400, detail="lease_id is required")
+    amount = entry.get("amount_cents")
+    if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+        raise HTTPException(status_code=400, detail="amount_cents must be a positive integer")
+    entry_id = uuid.uuid4().hex
+    document = {
+        **entry,
+        "landlord_id": landlord_id,
+        ledger_export.ORDER_FIELD: dt.datetime.now(dt.timezone.utc),
     }
+    document.pop("id", None)
+    await datastore.set_document(ledger_export.LEDGER_COLLECTION, entry_id, document)
+    await event_log.writer.append(
+        event_log.build_event("ledger_entry.created", "ledger_entry", entry_id, context={"landlord_id": landlord_id})
+    )
+    await kpis.snapshots.record(ledger_export.LEDGER_COLLECTION, None, document)
+    return {"id": entry_id, **document}
+
+
+@router.get("/landlords/{landlord_id}/kpis")
+async def landlord_kpis(landlord_id: str):
+    return await kpis.snapshots.read(landlord_id)
+
+
+@router.get("/landlords/{landlord_id}/kpis/check")
+async def check_landlord_kpis(landlord_id: str):
+    return await kpis.snapshots.check(landlord_id)
+
+
+def _require_debug_token(request: Request) -> None:
+    # without a configured token the profiler's admin surface does not exist
+    if not profiler.DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.token_matches(request.headers.get(profiler.TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="invalid debug token")
+
+
+@router.get("/admin/profiles", include_in_schema=False)
+def list_profiles(request: Request):
+    _require_debug_token(request)
+    return {"profiles": profiler.recent.summaries()}
+
+
+@router.get("/admin/profiles/{profile_id}", include_in_schema=False)
+def download_profile(profile_id: int, request: Request):
+    _require_debug_token(request)
+    profile = profiler.recent.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return Response(
+        profile.collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={"content-disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
+
+@router.get("/landlords/{landlord_id}/events/stream")
+def stream_events(landlord_id: str, entity_type: str | None = None, entity_id: str | None = None):
+    if entity_id is not None and entity_type is None:
+        raise HTTPException(status_code=400, detail="entity_id requires entity_type")
+    return StreamingResponse(
+        event_stream.hub.stream(landlord_id, entity_type, entity_id),
+        media_type=event_stream.MEDIA_TYPE,
+        headers=event_stream.HEADERS,
+    )
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Rentchain Landlord API",
+        version="0.1.0",
+        description="Backend for landlord dashboard, tenant data, and credit reporting.",
+        lifespan=lifespan,
+        default_response_class=responses.FastJSONResponse,
+    )
+    app.add_middleware(idempotency.IdempotencyMiddleware)
+    app.add_middleware(rate_limit.RateLimitMiddleware)
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+    app.add_middleware(responses.NegotiationMiddleware)
+    app.add_middleware(profiler.ProfilerMiddleware)
+    app.add_middleware(tracing.TracingMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(router)
+    app.include_router(property_routes.router)
+    app.include_router(job_routes.router)
+    app.include_router(identity_routes.router)
+    app.include_router(invite_routes.router)
+    return app
+
+
+def __getattr__(name):
+    # `uvicorn main:app` and `main.app` keep working, but the app is only built
+    # when something asks for it. The container runs `--factory main:create_app`.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,257 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+`ProfilerMiddleware` profiles a random `PROFILER_SAMPLE_RATE` fraction of
+requests, plus any request whose `X-Debug-Profile` header matches
+`PROFILER_DEBUG_TOKEN`. Without a token the header is ignored; the sample
+rate defaults to 0. An unprofiled request costs a header scan and, with a
+non-zero rate, one `random()` call.
+
+While at least one request is being profiled, a daemon thread wakes every
+`PROFILER_INTERVAL_SECONDS` and looks at each profiled request:
+
+- if the request is on the CPU (its root frame is on the event loop
+  thread's stack), the stack from the root frame to the leaf is recorded
+- otherwise the request is suspended, and the stack is read by following
+  the coroutine chain (`cr_await`) down to what it is waiting on, recorded
+  with an `[await ...]` leaf
+
+so I/O waits show up next to CPU time. Work handed to a thread pool (sync
+routes, `run_in_executor`) is not followed. Each finished profile is kept in
+a bounded ring buffer as stack counts and served in collapsed-stack format
+(`frame;frame;frame count` per line, the input of flamegraph.pl and
+speedscope) by the admin routes in main.py, which take the same token in
+`X-Debug-Token`. Profiled responses carry `X-Profile-Id`.
+"""
+
+from __future__ import annotations
+
+import collections
+import datetime as dt
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable
+
+import metrics
+
+
+SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+DEBUG_TOKEN = os.getenv("PROFILER_DEBUG_TOKEN", "")
+INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.005"))
+BUFFER_SIZE = int(os.getenv("PROFILER_BUFFER_SIZE", "50"))
+PROFILE_HEADER = b"x-debug-profile"
+TOKEN_HEADER = "x-debug-token"
+MAX_STACK_DEPTH = 128
+
+Stack = tuple[str, ...]
+
+
+def token_matches(presented: str | bytes | None, token: str | None = None) -> bool:
+    token = token if token is not None else DEBUG_TOKEN
+    if not token or not presented:
+        return False
+    if isinstance(presented, str):
+        presented = presented.encode("latin-1")
+    return hmac.compare_digest(presented, token.encode("latin-1"))
+
+
+def _label(frame: Any) -> str:
+    code = frame.f_code
+    filename = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+
+
+def _running_stack(leaf: Any, root: Any) -> Stack | None:
+    """Frames from `root` to `leaf`, or None if `root` is not on this stack."""
+    frames = []
+    frame = leaf
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            # keep the root end, so deep stacks still merge in a flame graph
+            return tuple(_label(frame) for frame in reversed(frames[-MAX_STACK_DEPTH:]))
+        frame = frame.f_back
+    return None
+
+
+def _awaiting_stack(root: Any, coro: Any) -> Stack:
+    """Follow a suspended coroutine chain down to the object it is waiting on."""
+    labels = [_label(root)]
+    awaitable = coro
+    while awaitable is not None and len(labels) < MAX_STACK_DEPTH:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) if hasattr(awaitable, "cr_frame") else (
+            getattr(awaitable, "gi_yieldfrom", None)
+        )
+    waiting_on = type(awaitable).__name__ if awaitable is not None else "?"
+    labels.append(f"[await {waiting_on}]")
+    return tuple(labels)
+
+
+class Profile:
+    __slots__ = ("id", "method", "path", "route", "status", "reason", "started_at", "duration", "stacks",
+                 "samples", "_root", "_coro", "_thread_id")
+
+    def __init__(self, profile_id: int, method: str, path: str, reason: str) -> None:
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route: str | None = None
+        self.status: int | None = None
+        self.reason = reason
+        self.started_at = dt.datetime.now(dt.timezone.utc)
+        self.duration = 0.0
+        self.stacks: collections.Counter[Stack] = collections.Counter()
+        self.samples = 0
+        self._root: Any = None
+        self._coro: Any = None
+        self._thread_id = 0
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "route": self.route,
+            "status": self.status, "reason": self.reason, "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3), "samples": self.samples,
+        }
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Sampler:
+    """One daemon thread, running only while some request is being profiled."""
+
+    def __init__(self, interval: float = INTERVAL_SECONDS) -> None:
+        self.interval = interval
+        self._active: dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def begin(self, profile: Profile, root: Any, coro: Any) -> None:
+        profile._root, profile._coro, profile._thread_id = root, coro, threading.get_ident()
+        with self._lock:
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def end(self, profile: Profile) -> None:
+        with self._lock:
+            self._active.pop(profile.id, None)
+            profile._root = profile._coro = None
+
+    def sample_once(self) -> None:
+        # under the lock, so nothing touches a profile once `end` has returned
+        with self._lock:
+            frames = sys._current_frames()
+            for profile in self._active.values():
+                leaf = frames.get(profile._thread_id)
+                stack = _running_stack(leaf, profile._root) if leaf is not None else None
+                if stack is None:
+                    stack = _awaiting_stack(profile._root, profile._coro)
+                profile.stacks[stack] += 1
+                profile.samples += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+            self.sample_once()
+            time.sleep(self.interval)
+
+
+class ProfileBuffer:
+    def __init__(self, size: int = BUFFER_SIZE) -> None:
+        self._profiles: collections.deque[Profile] = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def new(self, method: str, path: str, reason: str) -> Profile:
+        return Profile(next(self._ids), method, path, reason)
+
+    def add(self, profile: Profile) -> None:
+        self._profiles.append(profile)
+
+    def get(self, profile_id: int) -> Profile | None:
+        return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def summaries(self) -> list[dict[str, Any]]:
+        return [profile.summary() for profile in reversed(self._profiles)]
+
+
+class ProfilerMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        sample_rate: float | None = None,
+        token: str | None = None,
+        profiles: ProfileBuffer | None = None,
+        sampler: Sampler | None = None,
+        rng: Callable[[], float] = random.random,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else SAMPLE_RATE
+        self.token = token if token is not None else DEBUG_TOKEN
+        self.profiles = profiles if profiles is not None else recent
+        self.sampler = sampler if sampler is not None else Sampler()
+        self.rng = rng
+        self.profiled = registry.counter(
+            "profiler_requests_total", "Requests profiled, by reason.", labelnames=("reason",)
+        )
+
+    def _reason(self, scope: dict[str, Any]) -> str | None:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    if token_matches(value, self.token):
+                        return "header"
+                    break
+        if self.sample_rate and self.rng() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiles.new(scope["method"], scope["path"], reason)
+        self.profiled.inc((reason,))
+
+        async def send_with_id(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        call = self.app(scope, receive, send_with_id)
+        started = time.perf_counter()
+        self.sampler.begin(profile, sys._getframe(), call)
+        try:
+            await call
+        finally:
+            self.sampler.end(profile)
+            profile.duration = time.perf_counter() - started
+            profile.route = getattr(scope.get("route"), "path", None)
+            self.profiles.add(profile)
+
+
+recent = ProfileBuffer()
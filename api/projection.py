@@ -0,0 +1,112 @@
+"""
+Sparse responses: the `fields=` query parameter.
+
+`fields` is a comma-separated list of field paths, dotted for nested values
+(`fields=rent,unit.unit_id`). A path into a list applies to every element,
+so `units.rent` keeps `rent` on each unit of a `units` list. A document's
+`id` is always kept. Without `fields` a route returns everything, as before.
+
+Routes push the projection down where the datastore can take it, with
+`datastore.query_page(..., select=...)`: Firestore then reads and sends only
+those fields. `subfields` extracts the part of a projection that applies to
+one section of a composite response, and tells a route when a section is not
+wanted at all, so it can skip that query. Whatever could not be pushed down
+is pruned by `project` before serialization.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+from fastapi import HTTPException, Query
+
+
+MAX_FIELDS = 50
+_PATH = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*")
+ALWAYS_KEPT = ("id",)
+
+Fields = tuple[str, ...]
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse(raw: str | None) -> Fields | None:
+    """Validated, de-duplicated paths; None for "everything"."""
+    if raw is None or not raw.strip():
+        return None
+    paths = [part.strip() for part in raw.split(",") if part.strip()]
+    if len(paths) > MAX_FIELDS:
+        raise InvalidFields(f"at most {MAX_FIELDS} fields")
+    for path in paths:
+        if not _PATH.fullmatch(path):
+            raise InvalidFields(f"invalid field path {path!r}")
+    # a path already covered by a shorter one adds nothing
+    paths = sorted(set(paths))
+    kept: list[str] = []
+    for path in paths:
+        if not any(path.startswith(f"{shorter}.") for shorter in kept):
+            kept.append(path)
+    return tuple(kept)
+
+
+def fields_param(
+    fields: str | None = Query(None, description="Comma-separated field paths to return, e.g. rent,unit.unit_id"),
+) -> Fields | None:
+    try:
+        return parse(fields)
+    except InvalidFields as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _tree(fields: Fields) -> dict[str, Any]:
+    root: dict[str, Any] = {}
+    for path in fields:
+        node = root
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = None  # None: keep the whole value
+    return root
+
+
+def _prune(value: Any, tree: dict[str, Any]) -> Any:
+    if isinstance(value, list):
+        return [_prune(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    pruned = {key: value[key] for key in ALWAYS_KEPT if key in value}
+    for key, subtree in tree.items():
+        if key in value:
+            pruned[key] = value[key] if subtree is None else _prune(value[key], subtree)
+    return pruned
+
+
+def project(value: Any, fields: Fields | None) -> Any:
+    """`value` restricted to `fields`; `value` itself when `fields` is None."""
+    if fields is None:
+        return value
+    return _prune(value, _tree(fields))
+
+
+def subfields(fields: Fields | None, section: str) -> Fields | None:
+    """
+    The paths of `fields` under `section`: None when the whole section is
+    wanted (or there is no projection), () when none of it is.
+    """
+    if fields is None or section in fields:
+        return None
+    prefix = f"{section}."
+    return tuple(path[len(prefix):] for path in fields if path.startswith(prefix))
+
+
+def top_level(fields: Fields) -> list[str]:
+    """First path segments, for a datastore `select` that nested paths can be pruned from."""
+    return sorted({path.split(".", 1)[0] for path in fields})
+
+
+def variant(fields: Fields | None) -> str:
+    """Distinguishes projected representations of one document in its ETag."""
+    return ",".join(fields) if fields is not None else ""
@@ -0,0 +1,233 @@
+"""
+Property and unit document routes.
+
+Documents are keyed by their canonical IDs (`rc_prop_id`, `unit_id`) as in
+.codex/docs/database.md. Canonical ID fields cannot be changed by a patch.
+Child documents referenced by ID are resolved through the per-request
+`loader.Loaders`, never one read per child. Address search is served from
+`address_index`, which property patches keep current. Lease and application
+patches are applied to the landlord's KPI snapshot (`kpis`) as deltas, one
+patch of a document at a time so each delta is taken from the document's own
+before and after, and lease patches reschedule the lease's deadlines (`lease_scheduler`).
+
+Reads take `fields=` (see projection.py). The overview pushes it down: a
+section that is not asked for is not queried, and unit and lease queries
+select only the requested fields.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
+
+import address_index
+import datastore
+import etag
+import event_log
+import kpis
+import lease_scheduler
+import loader
+import projection
+from responses import FastJSONResponse
+
+
+PROPERTIES = "properties"
+UNITS = "units"
+LEASES = "leases"
+TENANTS = "tenants"
+APPLICATIONS = "applications"
+
+router = APIRouter()
+
+# (collection, document ID) -> (lock, patches holding or waiting on it)
+_patching: dict[tuple[str, str], tuple[asyncio.Lock, int]] = {}
+
+
+async def _get_or_404(collection: str, doc_id: str, label: str) -> datastore.Document:
+    document = await datastore.get_document(collection, doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+    return document
+
+
+async def _conditional_get(
+    request: Request, collection: str, doc_id: str, label: str, fields: projection.Fields | None
+) -> Response:
+    variant = projection.variant(fields)
+    if request.headers.get("if-none-match"):
+        version = await datastore.get_version(collection, doc_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail=f"{label} not found")
+        tag = etag.for_version(collection, doc_id, version, variant)
+        if etag.matches(request, tag):
+            return etag.not_modified(tag)
+    # the body and the tag come from one read or one cache entry, never two
+    document, version = await datastore.get_versioned(collection, doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+    # the full document is cached, so a projection is pruned rather than selected
+    body = FastJSONResponse(projection.project(document, fields))
+    return etag.tagged(body, etag.for_version(collection, doc_id, version, variant))
+
+
+@contextlib.asynccontextmanager
+async def _patch_lock(collection: str, doc_id: str) -> AsyncIterator[None]:
+    """One patch of a document at a time in this process; the entry goes with its last user."""
+    key = (collection, doc_id)
+    lock, users = _patching.get(key, (None, 0))
+    lock = lock or asyncio.Lock()
+    _patching[key] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _patching[key]
+        if users == 1:
+            del _patching[key]
+        else:
+            _patching[key] = (lock, users - 1)
+
+
+async def _patch(
+    collection: str, doc_id: str, label: str, changes: dict[str, Any], locked: tuple[str, ...]
+) -> datastore.Document:
+    # the read, the write and the delta together, or two patches could record one transition twice
+    async with _patch_lock(collection, doc_id):
+        before = await _get_or_404(collection, doc_id, label)
+        blocked = sorted(field for field in changes if field in locked or field == "id")
+        if blocked:
+            raise HTTPException(status_code=400, detail=f"cannot change {', '.join(blocked)}")
+        await datastore.set_document(collection, doc_id, changes, merge=True)
+        await event_log.writer.append(
+            event_log.build_event(
+                f"{label}.updated", label, doc_id,
+                context={"landlord_id": await event_log.landlord_of(before)}, payload={"fields": sorted(changes)},
+            )
+        )
+        after = await _get_or_404(collection, doc_id, label)
+        await kpis.snapshots.record(collection, before, after)
+    if collection == LEASES:
+        lease_scheduler.scheduler.track(after)
+    return after
+
+
+@router.get("/properties/{rc_prop_id}")
+async def get_property(
+    rc_prop_id: str, request: Request, fields: projection.Fields | None = Depends(projection.fields_param)
+):
+    return await _conditional_get(request, PROPERTIES, rc_prop_id, "property", fields)
+
+
+@router.patch("/properties/{rc_prop_id}")
+async def patch_property(rc_prop_id: str, changes: dict[str, Any] = Body(...)):
+    document = await _patch(PROPERTIES, rc_prop_id, "property", changes, ("rc_prop_id",))
+    address_index.search.upsert(document)
+    return FastJSONResponse(document)
+
+
+@router.get("/landlords/{landlord_id}/properties/search")
+async def search_properties(
+    landlord_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(address_index.DEFAULT_LIMIT, ge=1, le=address_index.MAX_LIMIT),
+    fields: projection.Fields | None = Depends(projection.fields_param),
+):
+    index = await address_index.search.ready()
+    return FastJSONResponse({"results": projection.project(index.search(q, landlord_id, limit), fields)})
+
+
+@router.get("/units/{unit_id}")
+async def get_unit(
+    unit_id: str, request: Request, fields: projection.Fields | None = Depends(projection.fields_param)
+):
+    return await _conditional_get(request, UNITS, unit_id, "unit", fields)
+
+
+@router.patch("/units/{unit_id}")
+async def patch_unit(unit_id: str, changes: dict[str, Any] = Body(...)):
+    return FastJSONResponse(
+        await _patch(UNITS, unit_id, "unit", changes, ("unit_id", "rc_prop_id"))
+    )
+
+
+@router.patch("/leases/{lease_id}")
+async def patch_lease(lease_id: str, changes: dict[str, Any] = Body(...)):
+    return FastJSONResponse(
+        await _patch(LEASES, lease_id, "lease", changes, ("lease_id", "rc_prop_id"))
+    )
+
+
+@router.patch("/applications/{application_id}")
+async def patch_application(application_id: str, changes: dict[str, Any] = Body(...)):
+    return FastJSONResponse(
+        await _patch(APPLICATIONS, application_id, "application", changes, ("application_id", "rc_prop_id"))
+    )
+
+
+async def _load(loaders: loader.Loaders, collection: str, key: Any) -> datastore.Document | None:
+    return await loaders[collection].load(key) if key else None
+
+
+async def _collect(documents) -> list[datastore.Document]:
+    return [document async for document in documents]
+
+
+async def _none() -> list[datastore.Document]:
+    return []
+
+
+def _select(fields: projection.Fields | None, *needed: str) -> list[str] | None:
+    return None if fields is None else [*projection.top_level(fields), *needed]
+
+
+async def _embed(
+    lease: datastore.Document, loaders: loader.Loaders, embed: tuple[str, ...]
+) -> datastore.Document:
+    unit, tenant = await asyncio.gather(
+        _load(loaders, UNITS, lease.get("unit_id")) if "unit" in embed else _none(),
+        _load(loaders, TENANTS, lease.get("tenant_id")) if "tenant" in embed else _none(),
+    )
+    embedded = {**lease}
+    if "unit" in embed:
+        embedded["unit"] = unit
+    if "tenant" in embed:
+        embedded["tenant"] = tenant
+    return embedded
+
+
+@router.get("/properties/{rc_prop_id}/overview")
+async def get_property_overview(
+    rc_prop_id: str,
+    request: Request,
+    loaders: loader.Loaders = Depends(loader.request_loaders),
+    fields: projection.Fields | None = Depends(projection.fields_param),
+):
+    by_property = [("rc_prop_id", "==", rc_prop_id)]
+    unit_fields = projection.subfields(fields, "units")
+    lease_fields = projection.subfields(fields, "leases")
+    embed = tuple(
+        name for name in ("unit", "tenant")
+        if lease_fields is None or projection.subfields(lease_fields, name) != ()
+    )
+    # embedded documents are looked up by the lease's reference fields
+    lease_select = _select(
+        lease_fields and tuple(path for path in lease_fields if path.split(".")[0] not in embed),
+        *(f"{name}_id" for name in embed),
+    )
+    property_doc, units, leases = await asyncio.gather(
+        _get_or_404(PROPERTIES, rc_prop_id, "property"),
+        _collect(datastore.query_all(UNITS, filters=by_property, select=_select(unit_fields)))
+        if unit_fields != () else _none(),
+        _collect(datastore.query_all(LEASES, filters=by_property, select=lease_select))
+        if lease_fields != () else _none(),
+    )
+    if unit_fields is None:
+        for unit in units:
+            loaders[UNITS].prime(unit["id"], unit)
+    leases = await asyncio.gather(*(_embed(lease, loaders, embed) for lease in leases))
+    overview = {"property": property_doc, "units": units, "leases": list(leases)}
+    return etag.hashed_response(request, projection.project(overview, fields))
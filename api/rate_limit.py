@@ -0,0 +1,143 @@
+"""
+Token-bucket rate limiting per client IP.
+
+Each caller gets a bucket of `burst` tokens refilled at `rate` tokens per
+second; a request spends one token or gets a 429 with `Retry-After`. The
+decision is a handful of dict and float operations with no awaits, so it is
+atomic under asyncio without a lock.
+
+Buckets are `(tokens, updated_at)` tuples in an OrderedDict kept in
+last-seen order. A bucket idle long enough to have refilled completely is
+indistinguishable from a new one, so each request drops a few such buckets
+from the cold end; memory tracks active callers, with `max_keys` as a hard cap.
+
+Buckets are keyed on the client address only. Caller-supplied headers such
+as `X-API-Key` or `X-Landlord-Id` are not authenticated by this service, so
+keying on them would let a client pick a fresh bucket for every request.
+"""
+
+from __future__ import annotations
+
+import collections
+import math
+import os
+import time
+from typing import Any, Callable
+
+import metrics
+import responses
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Cloud Run's front end appends the real client address to X-Forwarded-For;
+# anything to the left of it was supplied by the client and can be forged.
+TRUSTED_PROXY_HOPS = int(os.getenv("RATE_LIMIT_TRUSTED_PROXY_HOPS", "1"))
+EXEMPT_PATHS = frozenset({"/health", "/health/db", "/metrics"})
+SWEEP_PER_REQUEST = 4
+MAX_KEY_LENGTH = 128
+
+
+class TokenBuckets:
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_RATE,
+        burst: float = RATE_LIMIT_BURST,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be > 0 and burst >= 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_after = burst / rate  # seconds for an empty bucket to refill
+        self._clock = clock
+        self._buckets: collections.OrderedDict[str, tuple[float, float]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str) -> float:
+        """Spend a token for `key`. Returns 0 if allowed, else seconds to wait."""
+        now = self._clock()
+        buckets = self._buckets
+        state = buckets.get(key)
+        if state is None:
+            tokens = self.burst
+        else:
+            tokens, updated_at = state
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            buckets.move_to_end(key)
+
+        if tokens >= 1:
+            buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            buckets[key] = (tokens, now)
+            wait = (1 - tokens) / self.rate
+
+        self._sweep(now)
+        return wait
+
+    def _sweep(self, now: float) -> None:
+        buckets = self._buckets
+        for _ in range(SWEEP_PER_REQUEST):
+            if not buckets:
+                return
+            key, (tokens, updated_at) = next(iter(buckets.items()))
+            if now - updated_at < self.idle_after and len(buckets) <= self.max_keys:
+                return
+            del buckets[key]
+
+
+def _header(scope: dict[str, Any], name: bytes) -> str | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope: dict[str, Any]) -> str:
+    forwarded = _header(scope, b"x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        return "ip:" + hops[max(0, len(hops) - TRUSTED_PROXY_HOPS)][:MAX_KEY_LENGTH]
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        buckets: TokenBuckets | None = None,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+    ) -> None:
+        self.app = app
+        self.buckets = buckets if buckets is not None else TokenBuckets()
+        self.enabled = enabled
+        self.limited = registry.counter("rate_limited_requests_total", "Requests rejected with 429.")
+        registry.register_collector(
+            "rate_limit_buckets", "Token buckets held in memory.", "gauge",
+            lambda: [({}, len(self.buckets))],
+        )
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if not self.enabled or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        wait = self.buckets.take(client_key(scope))
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+        self.limited.inc()
+        response = responses.FastJSONResponse(
+            {"detail": "rate limit exceeded"},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+        await response(scope, receive, send)
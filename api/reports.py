@@ -0,0 +1,138 @@
+"""
+Report job kinds.
+
+`arrears_aging` ages a landlord's whole ledger (see arrears.py): the ledger
+is read into columns on the event loop and aged on the process pool.
+
+`credit_report` summarizes one lease's payment history for credit reporting.
+Its `prepare` step reads the lease's ledger entries through `datastore` on
+the event loop and reduces them to `(type, amount_cents, day)` tuples. The
+scoring itself is a pure function of those tuples and runs on the job process
+pool. Payments are applied oldest charge first, and every charge is bucketed
+by how many days late it was paid off.
+
+Screening providers are integrated in the Node API; a screening kind
+registers here the same way once its data is reachable from this service.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from typing import Any
+
+import arrears
+import datastore
+import jobs
+import ledger_export
+
+
+CHARGE_TYPES = frozenset({"scheduled_rent_charge", "one_time_charge", "nsf_fee"})
+PAYMENT_TYPES = frozenset({"payment_applied", "credit"})
+REVERSAL_TYPES = frozenset({"payment_reversal"})
+LATE_BUCKETS = ((0, "on_time"), (30, "late_1_30"), (60, "late_31_60"))
+VERY_LATE = "late_61_plus"
+
+
+def _day(value: Any) -> str | None:
+    if isinstance(value, dt.datetime):
+        return value.date().isoformat()
+    if isinstance(value, dt.date):
+        return value.isoformat()
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def _bucket(days_late: int) -> str:
+    for limit, name in LATE_BUCKETS:
+        if days_late <= limit:
+            return name
+    return VERY_LATE
+
+
+def payment_history(params: dict[str, Any]) -> dict[str, Any]:
+    """Score `params["entries"]`, a list of (type, amount_cents, day) tuples."""
+    charges: list[list] = []  # [due_day, outstanding_cents]
+    payments: list[tuple[str, int]] = []
+    for entry_type, amount, day in params["entries"]:
+        if entry_type in CHARGE_TYPES:
+            charges.append([day, amount])
+        elif entry_type in PAYMENT_TYPES:
+            payments.append((day, amount))
+        elif entry_type in REVERSAL_TYPES:
+            payments.append((day, -amount))
+    charges.sort(key=lambda charge: charge[0])
+    payments.sort()
+
+    counts = {name: 0 for _, name in LATE_BUCKETS}
+    counts[VERY_LATE] = 0
+    index = 0
+    credit = 0
+    for day, amount in payments:
+        credit += amount
+        while index < len(charges) and credit > 0:
+            charge = charges[index]
+            applied = min(credit, charge[1])
+            charge[1] -= applied
+            credit -= applied
+            if charge[1]:
+                break
+            days_late = max(0, (dt.date.fromisoformat(day) - dt.date.fromisoformat(charge[0])).days)
+            counts[_bucket(days_late)] += 1
+            index += 1
+
+    unpaid = charges[index:]
+    as_of = params.get("as_of") or dt.date.today().isoformat()
+    overdue = [charge for charge in unpaid if charge[0] < as_of]
+    scored = sum(counts.values())
+    return {
+        "charges": len(charges),
+        **counts,
+        "unpaid": len(unpaid),
+        "overdue": len(overdue),
+        "outstanding_cents": sum(charge[1] for charge in unpaid),
+        "on_time_ratio": round(counts["on_time"] / scored, 4) if scored else None,
+        "months_reported": len({charge[0][:7] for charge in charges}),
+        "as_of": as_of,
+    }
+
+
+async def load_lease_ledger(job: dict[str, Any]) -> dict[str, Any]:
+    params = job["params"]
+    lease_id = params.get("lease_id")
+    if not lease_id:
+        raise ValueError("lease_id is required")
+    entries = []
+    async for entry in datastore.query_all(
+        ledger_export.LEDGER_COLLECTION,
+        filters=[("landlord_id", "==", job["landlord_id"]), ("lease_id", "==", lease_id)],
+    ):
+        day = _day(entry.get("due_date")) or _day(entry.get("effective_date")) or _day(
+            entry.get(ledger_export.ORDER_FIELD)
+        )
+        amount = entry.get("amount_cents")
+        if day is not None and isinstance(amount, int):
+            entries.append((entry.get("type"), amount, day))
+    return {"entries": entries, "as_of": params.get("as_of")}
+
+
+def arrears_aging(params: dict[str, Any]) -> dict[str, Any]:
+    ledger = arrears.Ledger.from_columns(params["columns"])
+    return arrears.compute(ledger, dt.date.fromisoformat(params["as_of"]))
+
+
+async def load_landlord_ledger(job: dict[str, Any]) -> dict[str, Any]:
+    entries = datastore.query_all(
+        ledger_export.LEDGER_COLLECTION, filters=[("landlord_id", "==", job["landlord_id"])]
+    )
+    ledger = arrears.Ledger.from_entries([entry async for entry in entries])
+    as_of = job["params"].get("as_of") or dt.date.today().isoformat()
+    return {"columns": ledger.columns(), "as_of": as_of}
+
+
+ARREARS_AGING = jobs.register(
+    jobs.JobKind("arrears_aging", arrears_aging, executor="process", prepare=load_landlord_ledger)
+)
+CREDIT_REPORT = jobs.register(
+    jobs.JobKind("credit_report", payment_history, executor="process", prepare=load_lease_ledger)
+)
@@ -0,0 +1,492 @@
+"""
+Storage backends behind `datastore`.
+
+`datastore` owns caching, coalescing and invalidation; a `Repository` owns the
+raw reads and writes. Two implement the same interface:
+
+- `FirestoreRepository` issues RPCs through the shared `firestore_client`
+  pool. This is the production backend.
+- `MemoryRepository` keeps every collection in process. Equality and `in`
+  filters on `rc_prop_id`, `lease_id` and `application_id` (the keys the
+  collections in `.codex/docs/database.md` are joined on) are answered from
+  hash indexes; anything else scans the collection. Ordering, cursors,
+  projections and version tokens follow Firestore's rules, so routes behave
+  the same on either backend.
+
+`update` is a conditional write: it applies only while the document is still
+at the version the caller read, and raises `Conflict` otherwise (a
+`last_update_time` precondition on Firestore), so a read-check-write cannot
+interleave with another writer's.
+
+`DATASTORE_BACKEND` selects one (`firestore`, the default, or `memory`). The
+memory backend makes dev and test environments work without network, and
+gives benchmarks a datastore with no latency to measure routes against.
+`DATASTORE_SEED_PATH` names a JSON file of `{collection: {doc_id: fields}}`
+to load into it at start.
+"""
+
+from __future__ import annotations
+
+import abc
+import datetime as dt
+import json
+import os
+import time
+from typing import Any, Callable, Iterable, Sequence
+
+import firestore_client
+
+
+BACKEND = os.getenv("DATASTORE_BACKEND", "firestore").lower()
+SEED_PATH = os.getenv("DATASTORE_SEED_PATH", "")
+INDEXED_FIELDS = ("rc_prop_id", "lease_id", "application_id")
+DOCUMENT_ID = "__name__"
+MAX_BATCH_WRITES = 500
+HEALTH_COLLECTION = "_health"
+HEALTH_DOCUMENT = "probe"
+# google.api_core exceptions a failed precondition surfaces as, matched by
+# name so this module never imports the SDK
+CONFLICT_ERRORS = frozenset({"FailedPrecondition", "NotFound"})
+
+Document = dict[str, Any]
+Filter = tuple[str, str, Any]
+
+
+class Conflict(Exception):
+    """A conditional write found the document changed or gone since its version was read."""
+
+
+class Repository(abc.ABC):
+    """Raw document storage. Documents carry their ID under "id"."""
+
+    name = "repository"
+
+    @abc.abstractmethod
+    async def get(
+        self, collection: str, doc_id: str, metadata_only: bool = False
+    ) -> tuple[Document | None, str | None]:
+        """The document and its version token; with `metadata_only`, the document has no fields."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_many(
+        self, collection: str, doc_ids: Sequence[str]
+    ) -> dict[str, tuple[Document, str | None]]:
+        """Each found document with its version token; missing IDs are left out."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set(self, collection: str, doc_id: str, data: dict[str, Any], merge: bool = False) -> None:
+        """Replace the document; with `merge`, nested maps are merged into it key by key."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update(self, collection: str, doc_id: str, data: dict[str, Any], version: str) -> None:
+        """Set the top-level fields in `data` if the document is still at `version`, else raise `Conflict`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set_many(self, collection: str, documents: Sequence[tuple[str, dict[str, Any]]]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def query(
+        self,
+        collection: str,
+        filters: Sequence[Filter],
+        order_by: Sequence[str],
+        start_after: Sequence[Any] | None,
+        limit: int,
+        select: Sequence[str] | None = None,
+    ) -> list[Document]:
+        """One page ordered by `order_by` plus document ID; see `datastore.query_page`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def ping(self) -> None:
+        """Raise if the backend cannot serve reads."""
+        raise NotImplementedError
+
+
+def _to_document(snapshot: Any) -> Document | None:
+    if not snapshot.exists:
+        return None
+    return {"id": snapshot.id, **(snapshot.to_dict() or {})}
+
+
+def _to_version(snapshot: Any) -> str | None:
+    update_time = getattr(snapshot, "update_time", None)
+    if not snapshot.exists or update_time is None:
+        return None
+    rfc3339 = getattr(update_time, "rfc3339", None)  # keeps nanoseconds
+    return rfc3339() if rfc3339 is not None else update_time.isoformat()
+
+
+def _to_update_time(version: str) -> dt.datetime:
+    # Firestore update times have microsecond precision, so nothing is lost
+    return dt.datetime.fromisoformat(version)
+
+
+class FirestoreRepository(Repository):
+    name = "firestore"
+
+    def __init__(
+        self, pool_getter: Callable[[], firestore_client.FirestorePool] = firestore_client.get_pool
+    ) -> None:
+        self._pool_getter = pool_getter
+
+    async def get(
+        self, collection: str, doc_id: str, metadata_only: bool = False
+    ) -> tuple[Document | None, str | None]:
+        # an empty field mask returns metadata (update_time) without the fields
+        options = {"field_paths": []} if metadata_only else {}
+        async with self._pool_getter().acquire() as client:
+            snapshot = await client.collection(collection).document(doc_id).get(**options)
+        return _to_document(snapshot), _to_version(snapshot)
+
+    async def get_many(
+        self, collection: str, doc_ids: Sequence[str]
+    ) -> dict[str, tuple[Document, str | None]]:
+        async with self._pool_getter().acquire() as client:
+            ref = client.collection(collection)
+            return {
+                snapshot.id: (document, _to_version(snapshot))
+                async for snapshot in client.get_all([ref.document(doc_id) for doc_id in doc_ids])
+                if (document := _to_document(snapshot)) is not None
+            }
+
+    async def set(self, collection: str, doc_id: str, data: dict[str, Any], merge: bool = False) -> None:
+        async with self._pool_getter().acquire() as client:
+            await client.collection(collection).document(doc_id).set(data, merge=merge)
+
+    async def update(self, collection: str, doc_id: str, data: dict[str, Any], version: str) -> None:
+        async with self._pool_getter().acquire() as client:
+            option = client.write_option(last_update_time=_to_update_time(version))
+            try:
+                await client.collection(collection).document(doc_id).update(data, option=option)
+            except Exception as exc:
+                if type(exc).__name__ in CONFLICT_ERRORS:
+                    raise Conflict(f"{collection}/{doc_id} changed since version {version}") from exc
+                raise
+
+    async def set_many(self, collection: str, documents: Sequence[tuple[str, dict[str, Any]]]) -> None:
+        # Firestore caps a batch at 500 writes
+        async with self._pool_getter().acquire() as client:
+            ref = client.collection(collection)
+            for start in range(0, len(documents), MAX_BATCH_WRITES):
+                batch = client.batch()
+                for doc_id, data in documents[start:start + MAX_BATCH_WRITES]:
+                    batch.set(ref.document(doc_id), data)
+                await batch.commit()
+
+    async def query(
+        self,
+        collection: str,
+        filters: Sequence[Filter],
+        order_by: Sequence[str],
+        start_after: Sequence[Any] | None,
+        limit: int,
+        select: Sequence[str] | None = None,
+    ) -> list[Document]:
+        async with self._pool_getter().acquire() as client:
+            ref = client.collection(collection)
+            query = ref
+            if select is not None:
+                query = query.select(list(select))
+            for field, op, value in filters:
+                query = query.where(field, op, value)
+            for field in order_by:
+                query = query.order_by(field)
+            query = query.order_by(DOCUMENT_ID)
+            if start_after is not None:
+                *values, last_id = start_after
+                cursor = dict(zip(order_by, values))
+                cursor[DOCUMENT_ID] = ref.document(last_id)
+                query = query.start_after(cursor)
+            query = query.limit(limit)
+            return [doc async for snapshot in query.stream() if (doc := _to_document(snapshot))]
+
+    async def ping(self) -> None:
+        async with self._pool_getter().acquire() as client:
+            await client.collection(HEALTH_COLLECTION).document(HEALTH_DOCUMENT).get()
+
+
+_MISSING = object()
+
+
+def _value(data: dict[str, Any], path: str) -> Any:
+    value: Any = data
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _rank(value: Any) -> tuple[int, Any]:
+    """Sort key in Firestore's cross-type order: null, bool, number, timestamp, string, array, map."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, dt.datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, (list, tuple)):
+        return (6, tuple(_rank(item) for item in value))
+    if isinstance(value, dict):
+        return (7, tuple(sorted((key, _rank(item)) for key, item in value.items())))
+    return (5, str(value))
+
+
+def _matches(value: Any, op: str, operand: Any) -> bool:
+    if value is _MISSING:
+        return False
+    if op == "==":
+        return value == operand
+    if op == "in":
+        return value in operand
+    if op == "!=":
+        return value != operand and value is not None
+    if op == "not-in":
+        return value not in operand and value is not None
+    if op in ("array-contains", "array_contains"):
+        return isinstance(value, list) and operand in value
+    if op == "array-contains-any":
+        return isinstance(value, list) and any(item in value for item in operand)
+    # range filters only match values of the operand's type
+    left, right = _rank(value), _rank(operand)
+    if left[0] != right[0]:
+        return False
+    if op == "<":
+        return left < right
+    if op == "<=":
+        return left <= right
+    if op == ">":
+        return left > right
+    if op == ">=":
+        return left >= right
+    raise ValueError(f"unsupported filter operator {op!r}")
+
+
+def _clone(value: Any) -> Any:
+    # documents are JSON-shaped trees; this is several times faster than copy.deepcopy
+    kind = type(value)
+    if kind is dict:
+        return {key: _clone(item) if type(item) in (dict, list) else item for key, item in value.items()}
+    if kind is list:
+        return [_clone(item) if type(item) in (dict, list) else item for item in value]
+    return value
+
+
+def copy_document(data: dict[str, Any]) -> dict[str, Any]:
+    """A copy down to the nested maps and lists, so no caller shares state with the store."""
+    return _clone(data)
+
+
+def _merge(existing: dict[str, Any], fields: dict[str, Any]) -> dict[str, Any]:
+    """Firestore's `set(merge=True)`: maps merge recursively, anything else replaces."""
+    merged = dict(existing)
+    for key, value in fields.items():
+        current = merged.get(key)
+        merged[key] = _merge(current, value) if type(value) is dict and type(current) is dict else value
+    return merged
+
+
+def _select(document: Document, field_paths: Sequence[str]) -> Document:
+    selected: Document = {"id": document["id"]}
+    for path in field_paths:
+        value = _value(document, path)
+        if value is _MISSING:
+            continue
+        *parents, leaf = path.split(".")
+        target = selected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = _clone(value)
+    return selected
+
+
+class MemoryRepository(Repository):
+    """
+    Every collection in process, with hash indexes on `indexed` fields.
+
+    `scans` counts queries that had to visit a whole collection; an indexed
+    `==` or `in` filter visits only the matching IDs.
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        data: dict[str, dict[str, dict[str, Any]]] | None = None,
+        indexed: Sequence[str] = INDEXED_FIELDS,
+    ) -> None:
+        self.indexed = tuple(indexed)
+        self._collections: dict[str, dict[str, dict[str, Any]]] = {}
+        self._versions: dict[tuple[str, str], str] = {}
+        # (collection, field) -> value -> document IDs
+        self._indexes: dict[tuple[str, str], dict[Any, set[str]]] = {}
+        self._last_micros = 0
+        self.scans = 0
+        for collection, documents in (data or {}).items():
+            for doc_id, fields in documents.items():
+                self._write(collection, doc_id, copy_document(fields), self._next_version())
+
+    @classmethod
+    def from_file(cls, path: str | os.PathLike, **options: Any) -> "MemoryRepository":
+        with open(path, encoding="utf-8") as handle:
+            return cls(json.load(handle), **options)
+
+    def __len__(self) -> int:
+        return sum(len(documents) for documents in self._collections.values())
+
+    def _next_version(self) -> str:
+        # strictly increasing, so every write gets a new version token
+        micros = max(time.time_ns() // 1000, self._last_micros + 1)
+        self._last_micros = micros
+        return dt.datetime.fromtimestamp(micros / 1_000_000, dt.timezone.utc).isoformat(timespec="microseconds")
+
+    def _index(self, collection: str, doc_id: str, fields: dict[str, Any], sign: int) -> None:
+        for field in self.indexed:
+            value = fields.get(field, _MISSING)
+            if value is _MISSING:
+                continue
+            try:
+                hash(value)
+            except TypeError:
+                continue
+            postings = self._indexes.setdefault((collection, field), {})
+            if sign > 0:
+                postings.setdefault(value, set()).add(doc_id)
+            else:
+                ids = postings.get(value)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del postings[value]
+
+    def _write(self, collection: str, doc_id: str, fields: dict[str, Any], version: str) -> None:
+        documents = self._collections.setdefault(collection, {})
+        previous = documents.get(doc_id)
+        if previous is not None:
+            self._index(collection, doc_id, previous, -1)
+        documents[doc_id] = fields
+        self._versions[(collection, doc_id)] = version
+        self._index(collection, doc_id, fields, 1)
+
+    async def get(
+        self, collection: str, doc_id: str, metadata_only: bool = False
+    ) -> tuple[Document | None, str | None]:
+        fields = self._collections.get(collection, {}).get(doc_id)
+        if fields is None:
+            return None, None
+        document = {"id": doc_id} if metadata_only else {"id": doc_id, **copy_document(fields)}
+        return document, self._versions[(collection, doc_id)]
+
+    async def get_many(
+        self, collection: str, doc_ids: Sequence[str]
+    ) -> dict[str, tuple[Document, str | None]]:
+        documents = self._collections.get(collection, {})
+        return {
+            doc_id: ({"id": doc_id, **copy_document(documents[doc_id])}, self._versions[(collection, doc_id)])
+            for doc_id in doc_ids
+            if doc_id in documents
+        }
+
+    async def set(self, collection: str, doc_id: str, data: dict[str, Any], merge: bool = False) -> None:
+        fields = copy_document(data)
+        existing = self._collections.get(collection, {}).get(doc_id)
+        if merge and existing is not None:
+            fields = _merge(existing, fields)
+        self._write(collection, doc_id, fields, self._next_version())
+
+    async def update(self, collection: str, doc_id: str, data: dict[str, Any], version: str) -> None:
+        existing = self._collections.get(collection, {}).get(doc_id)
+        if existing is None or self._versions[(collection, doc_id)] != version:
+            raise Conflict(f"{collection}/{doc_id} changed since version {version}")
+        self._write(collection, doc_id, {**existing, **copy_document(data)}, self._next_version())
+
+    async def set_many(self, collection: str, documents: Sequence[tuple[str, dict[str, Any]]]) -> None:
+        for doc_id, data in documents:
+            self._write(collection, doc_id, copy_document(data), self._next_version())
+
+    def _candidates(self, collection: str, filters: Sequence[Filter]) -> Iterable[str]:
+        """IDs that can match: the smallest index hit when a filter can use one, else every ID."""
+        best: set[str] | None = None
+        for field, op, value in filters:
+            if field not in self.indexed or op not in ("==", "in"):
+                continue
+            postings = self._indexes.get((collection, field), {})
+            values = [value] if op == "==" else value
+            hits: set[str] = set()
+            for item in values:
+                try:
+                    hits.update(postings.get(item, ()))
+                except TypeError:  # unhashable; no document holds it in the index
+                    continue
+            if best is None or len(hits) < len(best):
+                best = hits
+        if best is not None:
+            return best
+        self.scans += 1
+        return self._collections.get(collection, {}).keys()
+
+    async def query(
+        self,
+        collection: str,
+        filters: Sequence[Filter],
+        order_by: Sequence[str],
+        start_after: Sequence[Any] | None,
+        limit: int,
+        select: Sequence[str] | None = None,
+    ) -> list[Document]:
+        documents = self._collections.get(collection, {})
+        rows: list[tuple[tuple, str]] = []
+        for doc_id in self._candidates(collection, filters):
+            fields = documents[doc_id]
+            if not all(_matches(_value(fields, field), op, value) for field, op, value in filters):
+                continue
+            values = [_value(fields, field) for field in order_by]
+            # Firestore leaves out documents without an ordered field
+            if any(value is _MISSING for value in values):
+                continue
+            rows.append((tuple(_rank(value) for value in values) + ((4, doc_id),), doc_id))
+        rows.sort(key=lambda row: row[0])
+        if start_after is not None:
+            *values, last_id = start_after
+            bound = tuple(_rank(value) for value in values) + ((4, last_id),)
+            rows = [row for row in rows if row[0] > bound]
+        if select is not None:
+            return [_select({"id": doc_id, **documents[doc_id]}, select) for _, doc_id in rows[:limit]]
+        return [{"id": doc_id, **copy_document(documents[doc_id])} for _, doc_id in rows[:limit]]
+
+    async def ping(self) -> None:
+        pass
+
+
+def _configured() -> Repository:
+    if BACKEND == "memory":
+        return MemoryRepository.from_file(SEED_PATH) if SEED_PATH else MemoryRepository()
+    if BACKEND == "firestore":
+        return FirestoreRepository()
+    raise ValueError(f"unknown DATASTORE_BACKEND {BACKEND!r}; expected 'firestore' or 'memory'")
+
+
+_repository: Repository | None = None
+
+
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        _repository = _configured()
+    return _repository
+
+
+def set_repository(repository: Repository | None) -> None:
+    """Swap the backend (benchmarks, tests). None goes back to the configured one."""
+    global _repository
+    _repository = repository
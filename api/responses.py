@@ -0,0 +1,164 @@
+"""
+Response classes for the API.
+
+`FastJSONResponse` is the app's default response class. It encodes with orjson
+when it is installed and falls back to a compact stdlib `json.dumps`
+otherwise; both produce the same JSON for the types Firestore returns.
+
+FastAPI runs `jsonable_encoder` over plain dict/list return values before the
+response class ever sees them, which is the slow part for large lists. Routes
+that return big payloads should return `FastJSONResponse(content)` directly,
+which skips that pass.
+
+Clients that parse large lists (the sync workers) can ask for MessagePack
+with `Accept: application/msgpack` (or `application/x-msgpack`,
+`application/vnd.msgpack`). `NegotiationMiddleware` reads the header once per
+request into a contextvar, and `FastJSONResponse` then encodes the same
+content with msgpack instead, with the same type conversions as JSON. JSON
+stays the default: for no `Accept`, `*/*`, or a JSON type ranked at least as
+high. Streamed routes check `wants_msgpack()` themselves (the ledger export
+streams one msgpack object per entry instead of NDJSON lines). Error bodies
+from FastAPI's own handlers and the event streams are always JSON. Responses
+that can be negotiated carry `Vary: Accept`. Without the msgpack package
+installed every response is JSON.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import datetime as dt
+import decimal
+import json
+import uuid
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # optional speedup; see requirements.txt
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional; see requirements.txt
+    msgpack = None
+
+import tracing
+
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEGOTIATED_MEDIA_TYPES = (JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, NDJSON_MEDIA_TYPE)
+MSGPACK_MEDIA_TYPES = frozenset({b"application/msgpack", b"application/x-msgpack", b"application/vnd.msgpack"})
+
+_msgpack_wanted: contextvars.ContextVar[bool] = contextvars.ContextVar("msgpack_wanted", default=False)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def stdlib_dumps(content: Any) -> bytes:
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def orjson_dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+dumps = orjson_dumps if orjson is not None else stdlib_dumps
+
+
+def msgpack_dumps(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, use_bin_type=True, datetime=False)
+
+
+def _quality(params: bytes) -> float:
+    for param in params.split(b";"):
+        name, _, value = param.partition(b"=")
+        if name.strip().lower() == b"q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def prefers_msgpack(accept: bytes) -> bool:
+    """
+    True when `accept` ranks a MessagePack type above zero and at least as high
+    as `application/json`. Wildcards never select MessagePack on their own.
+    """
+    accept = accept.lower()
+    if msgpack is None or b"msgpack" not in accept:
+        return False
+    wanted = 0.0
+    json_quality = 0.0
+    for item in accept.split(b","):
+        media, _, params = item.partition(b";")
+        media = media.strip()
+        if media in MSGPACK_MEDIA_TYPES:
+            wanted = max(wanted, _quality(params))
+        elif media == b"application/json":
+            json_quality = max(json_quality, _quality(params))
+    return wanted > 0 and wanted >= json_quality
+
+
+def wants_msgpack() -> bool:
+    """Whether the current request negotiated MessagePack."""
+    return _msgpack_wanted.get()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        with tracing.span("response.render"):
+            if _msgpack_wanted.get():
+                # read by init_headers, which Response.__init__ calls after render
+                self.media_type = MSGPACK_MEDIA_TYPE
+                return msgpack_dumps(content)
+            return dumps(content)
+
+
+class NegotiationMiddleware:
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        wanted = False
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                wanted = prefers_msgpack(value)
+                break
+
+        async def send_with_vary(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                vary = [value.strip().lower() for value in headers.get("vary", "").split(",")]
+                # conditional routes set it themselves, on 304s too
+                if headers.get("content-type", "").startswith(NEGOTIATED_MEDIA_TYPES) and "accept" not in vary:
+                    headers.add_vary_header("Accept")
+            await send(message)
+
+        token = _msgpack_wanted.set(wanted)
+        try:
+            await self.app(scope, receive, send_with_vary)
+        finally:
+            _msgpack_wanted.reset(token)
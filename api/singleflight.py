@@ -0,0 +1,92 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+While a read for a key is in flight, later callers for the same key await the
+same task instead of issuing their own. The read runs as its own task, so a
+cancelled caller never cancels it for the others. `forget()` detaches a key
+after a write so callers arriving later start a fresh read instead of joining
+one that began before the write.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Hashable
+
+import metrics
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable key for a query from its collection and parameters."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    # followers may all be gone; don't let asyncio log "exception never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class _Flight:
+    __slots__ = ("task", "joined")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.joined = 0
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Run `fn` once per key at a time. Returns (result, shared), where
+        `shared` tells every caller, leader included, that the result object
+        was handed to more than one caller.
+        """
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._inflight[key] = flight
+            # registered before shield's callback, so the key is released
+            # before any caller resumes and `joined` is final by then
+            flight.task.add_done_callback(_consume_exception)
+            flight.task.add_done_callback(lambda done: self._release(key, flight))
+        else:
+            self.followers += 1
+            flight.joined += 1
+        result = await asyncio.shield(flight.task)
+        return result, flight.joined > 0
+
+    def _release(self, key: Hashable, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def forget(self, key: Hashable) -> None:
+        self._inflight.pop(key, None)
+
+
+flights = SingleFlight()
+
+metrics.REGISTRY.register_collector(
+    "singleflight_calls_total",
+    "Datastore reads that started a flight (leader) or joined one (shared).",
+    "counter",
+    lambda: [({"outcome": "leader"}, flights.leaders), ({"outcome": "shared"}, flights.followers)],
+)
+metrics.REGISTRY.register_collector(
+    "singleflight_inflight",
+    "Distinct datastore reads currently in flight.",
+    "gauge",
+    lambda: [({}, len(flights))],
+)
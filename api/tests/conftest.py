@@ -0,0 +1,15 @@
+import os
+import pathlib
+import sys
+
+# Tests import the app modules (api/) and the shared fakes (tests/) by name.
+TEST_DIR = pathlib.Path(__file__).resolve().parent
+for path in (TEST_DIR, TEST_DIR.parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# The suite drives one app from a single client address far faster than any
+# production rate limit allows; tests/test_rate_limit.py enables it explicitly.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# Lifespan tests start the job runner; keep its queue out of the shared tempdir.
+os.environ.setdefault("JOBS_DB_PATH", ":memory:")
@@ -0,0 +1,19 @@
+"""
+A settable clock for code that takes a `clock` callable.
+
+Tests construct it at whatever time the code under test reads (monotonic
+seconds, epoch milliseconds, an aware datetime) and move it by assigning to
+or adding to `now`.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+
+class FakeClock:
+    def __init__(self, now: Any = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> Any:
+        return self.now
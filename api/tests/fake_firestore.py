@@ -0,0 +1,262 @@
+"""
+In-memory stand-in for the google-cloud-firestore AsyncClient.
+
+Implements just the surface the API touches so tests run without the
+emulator. Every RPC is counted in `client.calls` so tests can assert on
+database traffic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime as dt
+import operator
+from typing import Any, AsyncIterator
+
+
+DOCUMENT_ID = "__name__"
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, options: value in options,
+    "array_contains": lambda value, item: item in (value or []),
+}
+
+
+def _select(data: dict[str, Any], field_paths: tuple) -> dict[str, Any]:
+    selected: dict[str, Any] = {}
+    for path in field_paths:
+        *parents, leaf = path.split(".")
+        source, target = data, selected
+        for part in parents:
+            source = source.get(part) if isinstance(source, dict) else None
+            target = target.setdefault(part, {})
+        if isinstance(source, dict) and leaf in source:
+            target[leaf] = source[leaf]
+    return selected
+
+
+SEED_UPDATE_TIME = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class FailedPrecondition(Exception):
+    """Named like google.api_core's, which the repository matches on."""
+
+
+class NotFound(Exception):
+    """Named like google.api_core's, which the repository matches on."""
+
+
+class FakeWriteOption:
+    def __init__(self, last_update_time: dt.datetime) -> None:
+        self.last_update_time = last_update_time
+
+
+def _merge(existing: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+    merged = dict(existing)
+    for key, value in data.items():
+        current = merged.get(key)
+        merged[key] = _merge(current, value) if isinstance(value, dict) and isinstance(current, dict) else value
+    return merged
+
+
+class FakeSnapshot:
+    def __init__(
+        self,
+        doc_id: str,
+        data: dict[str, Any] | None,
+        update_time: dt.datetime | None = None,
+    ) -> None:
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time if self.exists else None
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, client: "FakeAsyncClient", collection: str, doc_id: str) -> None:
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    async def get(self, field_paths: list[str] | None = None) -> FakeSnapshot:
+        # an empty field mask reads metadata only, as Firestore does
+        self._client.calls["get_metadata" if field_paths == [] else "get"] += 1
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        if self._client.fail_with is not None:
+            raise self._client.fail_with
+        data = self._client.data.get(self._collection, {}).get(self.id)
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return self._client.snapshot(self._collection, self.id, data)
+
+    async def set(self, data: dict[str, Any], merge: bool = False) -> None:
+        self._client.calls["set"] += 1
+        documents = self._client.data.setdefault(self._collection, {})
+        if merge and self.id in documents:
+            documents[self.id] = _merge(documents[self.id], data)
+        else:
+            documents[self.id] = dict(data)
+        self._client.touch(self._collection, self.id)
+
+    async def update(self, data: dict[str, Any], option: FakeWriteOption | None = None) -> None:
+        self._client.calls["update"] += 1
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        documents = self._client.data.get(self._collection, {})
+        if self.id not in documents:
+            raise NotFound(f"no document {self._collection}/{self.id}")
+        update_time = self._client.update_times.get((self._collection, self.id), SEED_UPDATE_TIME)
+        if option is not None and option.last_update_time != update_time:
+            raise FailedPrecondition(f"{self._collection}/{self.id} was updated at {update_time}")
+        documents[self.id] = {**documents[self.id], **data}
+        self._client.touch(self._collection, self.id)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        client: "FakeAsyncClient",
+        collection: str,
+        filters: tuple = (),
+        orders: tuple = (),
+        cursor: dict[str, Any] | None = None,
+        limit: int | None = None,
+        fields: tuple | None = None,
+    ) -> None:
+        self._client = client
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._cursor = cursor
+        self._limit = limit
+        self._fields = fields
+
+    def _copy(self, **changes: Any) -> "FakeQuery":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "cursor": self._cursor,
+            "limit": self._limit,
+            "fields": self._fields,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return self._copy(filters=self._filters + ((field, _OPERATORS[op], value),))
+
+    def order_by(self, field: str) -> "FakeQuery":
+        return self._copy(orders=self._orders + (field,))
+
+    def start_after(self, values: dict[str, Any]) -> "FakeQuery":
+        return self._copy(cursor=values)
+
+    def select(self, field_paths: list[str]) -> "FakeQuery":
+        return self._copy(fields=tuple(field_paths))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def _key(self, doc_id: str, data: dict[str, Any]) -> tuple:
+        return tuple(doc_id if field == DOCUMENT_ID else data.get(field) for field in self._orders)
+
+    async def stream(self) -> AsyncIterator[FakeSnapshot]:
+        self._client.calls["query"] += 1
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        rows = [
+            (doc_id, data)
+            for doc_id, data in self._client.data.get(self._collection, {}).items()
+            if all(check(data.get(field), value) for field, check, value in self._filters)
+        ]
+        if self._orders:
+            rows.sort(key=lambda row: self._key(*row))
+        if self._cursor is not None:
+            bound = tuple(
+                getattr(self._cursor[field], "id", self._cursor[field]) for field in self._orders
+            )
+            rows = [row for row in rows if self._key(*row) > bound]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        for doc_id, data in rows:
+            self._client.calls["documents_read"] += 1
+            if self._fields is not None:
+                data = _select(data, self._fields)
+            yield self._client.snapshot(self._collection, doc_id, data)
+
+
+class FakeCollectionRef(FakeQuery):
+    def __init__(self, client: "FakeAsyncClient", name: str) -> None:
+        super().__init__(client, name)
+
+    def document(self, doc_id: str) -> FakeDocumentRef:
+        return FakeDocumentRef(self._client, self._collection, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeAsyncClient") -> None:
+        self._client = client
+        self._writes: list[tuple[FakeDocumentRef, dict[str, Any]]] = []
+
+    def set(self, ref: FakeDocumentRef, data: dict[str, Any]) -> None:
+        self._writes.append((ref, dict(data)))
+
+    async def commit(self) -> None:
+        self._client.calls["commit"] += 1
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        if self._client.fail_with is not None:
+            raise self._client.fail_with
+        for ref, data in self._writes:
+            self._client.data.setdefault(ref._collection, {})[ref.id] = data
+            self._client.touch(ref._collection, ref.id)
+
+
+class FakeAsyncClient:
+    def __init__(self, data: dict[str, dict[str, dict[str, Any]]] | None = None) -> None:
+        self.data = data or {}
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.latency = 0.0
+        self.fail_with: Exception | None = None
+        self.closed = False
+        self.update_times: dict[tuple[str, str], dt.datetime] = {}
+        self._writes = 0
+
+    def touch(self, collection: str, doc_id: str) -> None:
+        self._writes += 1
+        self.update_times[(collection, doc_id)] = SEED_UPDATE_TIME + dt.timedelta(seconds=self._writes)
+
+    def snapshot(self, collection: str, doc_id: str, data: dict[str, Any] | None) -> FakeSnapshot:
+        update_time = self.update_times.get((collection, doc_id), SEED_UPDATE_TIME)
+        return FakeSnapshot(doc_id, data, update_time)
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self, name)
+
+    def write_option(self, last_update_time: dt.datetime) -> FakeWriteOption:
+        return FakeWriteOption(last_update_time)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    async def get_all(self, references: list[FakeDocumentRef]) -> AsyncIterator[FakeSnapshot]:
+        self.calls["get_all"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for ref in references:
+            self.calls["documents_read"] += 1
+            yield self.snapshot(ref._collection, ref.id, self.data.get(ref._collection, {}).get(ref.id))
+
+    def close(self) -> None:
+        self.closed = True
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import unittest
+
+from fastapi.testclient import TestClient
+
+import address_index
+import cache
+import firestore_client
+import main
+from fake_firestore import FakeAsyncClient
+
+
+def prop(doc_id: str, address: str, municipality: str = "Halifax", province: str = "NS",
+         landlord_id: str = "landlord-1") -> dict:
+    return {"id": doc_id, "rc_prop_id": doc_id, "address": address, "municipality": municipality,
+            "province": province, "landlord_id": landlord_id}
+
+
+class AddressIndexTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = address_index.AddressIndex()
+        for document in (
+            prop("p1", "12 Main Street"),
+            prop("p2", "12 Main Street, Unit 4"),
+            prop("p3", "400 Maple Avenue", "Dartmouth"),
+            prop("p4", "77 Rue Saint-Jérôme", "Montréal", "QC"),
+            prop("p5", "12 Main Street", landlord_id="landlord-2"),
+        ):
+            self.index.upsert(document)
+
+    def ids(self, query: str, **options) -> list[str]:
+        options.setdefault("landlord_id", "landlord-1")
+        return [result["rc_prop_id"] for result in self.index.search(query, **options)]
+
+    def test_normalize_folds_case_accents_and_punctuation(self) -> None:
+        self.assertEqual(address_index.normalize("Rue Saint-Jérôme, MONTRÉAL"), "rue saint jerome montreal")
+
+    def test_prefix_matches_the_word_being_typed(self) -> None:
+        self.assertEqual(self.ids("12 mai"), ["p1", "p2"])
+        self.assertEqual(self.ids("map"), ["p3"])
+        self.assertEqual(self.ids("12 m"), ["p1", "p2"])
+        self.assertEqual(self.ids("m"), [])
+
+    def test_typos_match_by_trigram(self) -> None:
+        self.assertEqual(self.ids("maple avnue"), ["p3"])
+        self.assertEqual(self.ids("jerome montral"), ["p4"])
+
+    def test_exact_and_shorter_addresses_rank_first(self) -> None:
+        results = self.index.search("12 main street", landlord_id="landlord-1")
+        self.assertEqual([result["rc_prop_id"] for result in results], ["p1", "p2"])
+        self.assertEqual(results[0]["score"], 1.0)
+
+    def test_every_query_token_must_match(self) -> None:
+        self.assertEqual(self.ids("12 main dartmouth"), [])
+        self.assertEqual(self.ids("   "), [])
+
+    def test_scoped_to_landlord(self) -> None:
+        self.assertEqual(self.ids("12 main", landlord_id="landlord-2"), ["p5"])
+
+    def test_incremental_update_and_remove(self) -> None:
+        self.index.upsert(prop("p3", "9 Birch Road", "Dartmouth"))
+        self.assertEqual(self.ids("maple"), [])
+        self.assertEqual(self.ids("birch"), ["p3"])
+        self.assertNotIn("maple", self.index._postings)
+        self.assertNotIn("maple", self.index._vocabulary)
+        self.index.remove("p3")
+        self.assertEqual(self.ids("birch"), [])
+        self.assertNotIn("birch", self.index._vocabulary)
+
+
+class SearchRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(data={"properties": {
+            "p1": {"rc_prop_id": "p1", "address": "12 Main Street", "municipality": "Halifax",
+                   "province": "NS", "landlord_id": "landlord-1"},
+        }})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        address_index.search.reset()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.addCleanup(address_index.search.reset)
+
+    def test_search_builds_once_and_follows_patches(self) -> None:
+        http = TestClient(main.create_app())
+        response = http.get("/landlords/landlord-1/properties/search", params={"q": "main"})
+        self.assertEqual([result["rc_prop_id"] for result in response.json()["results"]], ["p1"])
+        queries = self.client.calls["query"]
+
+        http.patch("/properties/p1", json={"address": "5 Harbour Road"})
+        response = http.get("/landlords/landlord-1/properties/search", params={"q": "harb"})
+        self.assertEqual([result["rc_prop_id"] for result in response.json()["results"]], ["p1"])
+        self.assertEqual(self.client.calls["query"], queries)
+        self.assertEqual(
+            http.get("/landlords/landlord-2/properties/search", params={"q": "harb"}).json(),
+            {"results": []},
+        )
+
+
+
+class RebuildBackoffTests(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_rebuild_is_not_retried_on_every_request(self) -> None:
+        lookup = address_index.PropertySearch(refresh_seconds=0, retry_seconds=60)
+        builds = []
+
+        async def build():
+            builds.append(len(builds))
+            if len(builds) > 1:
+                raise RuntimeError("datastore unavailable")
+            return address_index.AddressIndex()
+
+        lookup._build = build
+        first = await lookup.ready()
+        with self.assertLogs("rentchain.address_index", "WARNING"):
+            for _ in range(5):
+                self.assertIs(await lookup.ready(), first)
+                if lookup._refresh is not None:
+                    await lookup._refresh
+        self.assertEqual(len(builds), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
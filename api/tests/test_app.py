@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import pathlib
+import subprocess
+import sys
+import unittest
+
+from fastapi.testclient import TestClient
+
+import firestore_client
+import main
+from fake_firestore import FakeAsyncClient
+
+
+class AppFactoryTests(unittest.TestCase):
+    def test_import_does_not_build_app_or_load_firestore_sdk(self) -> None:
+        probe = (
+            "import sys, main; "
+            "print('app' in vars(main), 'google.cloud.firestore' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=pathlib.Path(__file__).resolve().parents[1],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.stdout.split(), ["False", "False"])
+
+    def test_create_app_returns_independent_apps(self) -> None:
+        first, second = main.create_app(), main.create_app()
+        self.assertIsNot(first, second)
+        paths = set(first.openapi()["paths"])
+        self.assertTrue({"/health", "/health/db", "/properties/{rc_prop_id}"} <= paths)
+
+    def test_module_app_is_built_once(self) -> None:
+        self.assertIs(main.app, main.app)
+
+    def test_lifespan_closes_firestore_pool(self) -> None:
+        client = FakeAsyncClient()
+        firestore_client.set_client_factory(lambda: client)
+        self.addCleanup(firestore_client.set_client_factory, None)
+        with TestClient(main.create_app()) as http:
+            http.get("/health/db")
+        self.assertTrue(client.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import datetime as dt
+import random
+import unittest
+
+import arrears
+import reports
+
+
+AS_OF = dt.date(2026, 4, 1)
+
+
+def entry(lease_id: str, entry_type: str, amount: int, day: str, prop: str = "prop-1") -> dict:
+    date_field = "due_date" if arrears.KINDS[entry_type] == arrears.CHARGE else "effective_date"
+    return {"lease_id": lease_id, "rc_prop_id": prop, "type": entry_type, "amount_cents": amount, date_field: day}
+
+
+def random_ledger(rng: random.Random, rows: int) -> arrears.Ledger:
+    ledger = arrears.Ledger()
+    start = dt.date(2025, 1, 1).toordinal()
+    for _ in range(rows):
+        lease = rng.randrange(40)
+        kind = rng.choice((arrears.CHARGE, arrears.CHARGE, arrears.CREDIT, arrears.REVERSAL))
+        ledger.add(f"lease-{lease}", f"prop-{lease % 7}", kind, rng.randrange(1, 200_000), start + rng.randrange(500))
+    return ledger
+
+
+class ArrearsTests(unittest.TestCase):
+    def engines(self) -> list[str]:
+        return ["python"] + (["numpy"] if arrears.numpy_available() else [])
+
+    def compute(self, entries: list[dict], engine: str) -> dict:
+        return arrears.compute(arrears.Ledger.from_entries(entries), AS_OF, engine=engine)
+
+    def test_payments_clear_oldest_charges_first(self) -> None:
+        entries = [
+            entry("lease-1", "scheduled_rent_charge", 100_000, "2025-12-01"),
+            entry("lease-1", "scheduled_rent_charge", 100_000, "2026-02-01"),
+            entry("lease-1", "scheduled_rent_charge", 100_000, "2026-03-01"),
+            entry("lease-1", "scheduled_rent_charge", 100_000, "2026-04-01"),
+            entry("lease-1", "payment_applied", 150_000, "2026-03-05"),
+        ]
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                [lease] = self.compute(entries, engine)["leases"]
+                self.assertEqual(lease["balance_cents"], 250_000)
+                self.assertEqual(lease["days_91_plus"], 0)
+                # March 1 is 31 days before April 1
+                self.assertEqual(lease["days_31_60"], 50_000 + 100_000)
+                self.assertEqual(lease["days_1_30"], 0)
+                self.assertEqual(lease["current"], 100_000)
+                self.assertEqual(lease["oldest_days_past_due"], 59)
+                # 5% of the two charges past the grace period
+                self.assertEqual(lease["late_fee_exposure_cents"], 2_500 + 5_000)
+
+    def test_reversal_reopens_and_overpayment_leaves_nothing_aged(self) -> None:
+        entries = [
+            entry("lease-1", "scheduled_rent_charge", 1_000, "2026-01-01"),
+            entry("lease-1", "payment_applied", 1_000, "2026-01-01"),
+            entry("lease-1", "payment_reversal", 1_000, "2026-01-09"),
+            entry("lease-2", "scheduled_rent_charge", 1_000, "2026-01-01"),
+            entry("lease-2", "payment_applied", 1_500, "2026-01-01"),
+        ]
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                reopened, overpaid = self.compute(entries, engine)["leases"]
+                self.assertEqual(reopened["days_61_90"], 1_000)
+                self.assertEqual(reopened["oldest_days_past_due"], 90)
+                self.assertEqual(overpaid["balance_cents"], -500)
+                self.assertEqual(sum(overpaid[name] for name in arrears.BUCKETS), 0)
+                self.assertEqual(overpaid["late_fee_exposure_cents"], 0)
+
+    def test_property_rollup_sums_leases(self) -> None:
+        entries = [
+            entry("lease-1", "scheduled_rent_charge", 1_000, "2026-03-01", prop="prop-1"),
+            entry("lease-2", "scheduled_rent_charge", 2_000, "2026-04-01", prop="prop-1"),
+            entry("lease-3", "scheduled_rent_charge", 4_000, "2026-03-01", prop="prop-2"),
+            entry("lease-3", "write_off", 4_000, "2026-03-20", prop="prop-2"),
+            {"lease_id": "lease-4", "type": "scheduled_rent_charge", "amount_cents": "12.00", "due_date": "2026-03-01"},
+        ]
+        result = self.compute(entries, "python")
+        first, second = result["properties"]
+        self.assertEqual((first["rc_prop_id"], first["leases"], first["leases_in_arrears"]), ("prop-1", 2, 1))
+        self.assertEqual((first["balance_cents"], first["days_31_60"], first["current"]), (3_000, 1_000, 2_000))
+        self.assertEqual((second["leases"], second["leases_in_arrears"], second["balance_cents"]), (1, 0, 0))
+
+    @unittest.skipIf(not arrears.numpy_available(), "numpy is not installed")
+    def test_engines_agree_on_random_ledgers(self) -> None:
+        rng = random.Random(3)
+        for rows in (0, 1, 50, 5_000):
+            ledger = random_ledger(rng, rows)
+            as_of = dt.date(2026, 1, 1)
+            python = arrears.compute(ledger, as_of, engine="python")
+            vectorized = arrears.compute(ledger, as_of, engine="numpy")
+            self.assertEqual(vectorized["leases"], python["leases"])
+            self.assertEqual(vectorized["properties"], python["properties"])
+
+    def test_columns_round_trip(self) -> None:
+        ledger = random_ledger(random.Random(5), 200)
+        copy = arrears.Ledger.from_columns(ledger.columns())
+        self.assertEqual(arrears.compute(copy, AS_OF, "python"), arrears.compute(ledger, AS_OF, "python"))
+
+    def test_job_kind_runs_on_columns(self) -> None:
+        ledger = arrears.Ledger.from_entries([entry("lease-1", "scheduled_rent_charge", 1_000, "2026-03-15")])
+        result = reports.arrears_aging({"columns": ledger.columns(), "as_of": "2026-04-01"})
+        self.assertEqual(result["leases"][0]["days_1_30"], 1_000)
+        self.assertIn("arrears_aging", reports.jobs.KINDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
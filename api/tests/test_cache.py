@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import datastore
+import firestore_client
+import main
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+class TTLCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.cache = cache.TTLCache("units", ttl=10, max_entries=2, clock=self.clock)
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.cache.set("c", 3)
+        self.assertIs(self.cache.get("b"), cache.MISSING)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self) -> None:
+        self.cache.set("a", 1)
+        self.clock.now = 10
+        self.assertIs(self.cache.get("a"), cache.MISSING)
+        self.assertEqual(self.cache.stats(), {
+            "size": 0, "hits": 0, "misses": 1, "evictions": 0, "expirations": 1,
+        })
+
+    async def test_byte_budget_evicts_least_recently_used(self) -> None:
+        weighed = cache.TTLCache("weighed", ttl=10, max_entries=100, clock=self.clock, max_bytes=10, weigh=len)
+        weighed.set("a", "xxxx")
+        weighed.set("b", "xxxx")
+        weighed.get("a")
+        weighed.set("c", "xxxx")
+        self.assertEqual((weighed.get("b"), weighed.bytes), (cache.MISSING, 8))
+        weighed.set("a", "x")
+        weighed.invalidate("c")
+        self.assertEqual((len(weighed), weighed.bytes), (1, 1))
+
+    async def test_read_through_loads_once(self) -> None:
+        loads = 0
+
+        async def load():
+            nonlocal loads
+            loads += 1
+            return {"id": "a"}
+
+        await self.cache.read_through("a", load)
+        await self.cache.read_through("a", load)
+        self.assertEqual(loads, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    async def test_invalidation_during_load_is_not_overwritten(self) -> None:
+        release = asyncio.Event()
+
+        async def slow_load():
+            await release.wait()
+            return {"version": "stale"}
+
+        task = asyncio.create_task(self.cache.read_through("a", slow_load))
+        await asyncio.sleep(0)
+        self.cache.invalidate("a")
+        release.set()
+        self.assertEqual(await task, {"version": "stale"})
+        self.assertIs(self.cache.get("a"), cache.MISSING)
+
+
+class CachedRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {"prop-1": {"rc_prop_id": "prop-1", "municipality": "Halifax"}},
+            "units": {"unit-1": {"unit_id": "unit-1", "rc_prop_id": "prop-1", "rent_amount": 1500}},
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.http = TestClient(main.app)
+
+    def test_repeated_reads_hit_the_cache(self) -> None:
+        for _ in range(3):
+            response = self.http.get("/properties/prop-1")
+            self.assertEqual(response.json()["municipality"], "Halifax")
+        self.assertEqual(self.client.calls["get"], 1)
+
+    def test_missing_documents_are_404(self) -> None:
+        self.assertEqual(self.http.get("/units/nope").status_code, 404)
+
+    def test_patch_invalidates_cached_copy(self) -> None:
+        self.assertEqual(self.http.get("/units/unit-1").json()["rent_amount"], 1500)
+        response = self.http.patch("/units/unit-1", json={"rent_amount": 1600})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["rent_amount"], 1600)
+        self.assertEqual(self.http.get("/units/unit-1").json()["rent_amount"], 1600)
+
+    def test_patch_cannot_change_canonical_ids(self) -> None:
+        response = self.http.patch("/units/unit-1", json={"rc_prop_id": "prop-2"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_counters_are_exposed_on_metrics(self) -> None:
+        self.http.get("/properties/prop-1")
+        self.http.get("/properties/prop-1")
+        text = self.http.get("/metrics").text
+        self.assertIn('cache_hits_total{collection="properties"} 1', text)
+        self.assertIn('cache_misses_total{collection="properties"} 1', text)
+        self.assertIn('cache_entries{collection="properties"} 1', text)
+
+
+
+class CachedCopyTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.client = FakeAsyncClient({"units": {"unit-1": {"unit_id": "unit-1", "rent": {"amount": 1500}}}})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    async def test_nested_maps_are_not_shared_with_the_cache(self) -> None:
+        (await datastore.get_document("units", "unit-1"))["rent"]["amount"] = 1
+        (await datastore.get_documents("units", ["unit-1"]))["unit-1"]["rent"]["amount"] = 2
+        self.assertEqual((await datastore.get_document("units", "unit-1"))["rent"], {"amount": 1500})
+        self.assertEqual(self.client.calls["get"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
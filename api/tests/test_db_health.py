@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+
+import db_health
+import firestore_client
+import main
+import repository
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+class FirestorePoolTests(unittest.IsolatedAsyncioTestCase):
+    async def test_clients_are_created_lazily_and_round_robin(self) -> None:
+        created: list[FakeAsyncClient] = []
+
+        def factory() -> FakeAsyncClient:
+            created.append(FakeAsyncClient())
+            return created[-1]
+
+        pool = firestore_client.FirestorePool(factory, size=2, max_inflight=4)
+        self.assertEqual(created, [])
+        seen = []
+        for _ in range(4):
+            async with pool.acquire() as client:
+                seen.append(client)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(seen, [created[0], created[1], created[0], created[1]])
+        await pool.close()
+        self.assertTrue(all(client.closed for client in created))
+
+    async def test_inflight_is_bounded(self) -> None:
+        pool = firestore_client.FirestorePool(FakeAsyncClient, size=1, max_inflight=2)
+        peak = 0
+
+        async def worker() -> None:
+            nonlocal peak
+            async with pool.acquire():
+                peak = max(peak, pool.inflight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(worker() for _ in range(8)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(pool.inflight, 0)
+
+
+class DbHealthProbeTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient()
+        self.pool = firestore_client.FirestorePool(lambda: self.client, size=1)
+        self.clock = FakeClock(100.0)
+        self.probe = db_health.DbHealthProbe(lambda: repository.FirestoreRepository(lambda: self.pool), ttl=5, timeout=1, clock=self.clock)
+
+    async def test_result_is_cached_for_ttl(self) -> None:
+        first = await self.probe.check()
+        second = await self.probe.check()
+        self.assertEqual(first["status"], "ok")
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(self.client.calls["get"], 1)
+
+        self.clock.now += 6
+        third = await self.probe.check()
+        self.assertFalse(third["cached"])
+        self.assertEqual(self.client.calls["get"], 2)
+        self.assertEqual(third["samples"], 2)
+        self.assertIn("p99", third["latency_ms"])
+
+    async def test_concurrent_checks_share_one_probe(self) -> None:
+        self.client.latency = 0.01
+        results = await asyncio.gather(*(self.probe.check() for _ in range(20)))
+        self.assertEqual(self.client.calls["get"], 1)
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+
+    async def test_failures_and_timeouts_report_error(self) -> None:
+        self.client.fail_with = RuntimeError("unavailable")
+        result = await self.probe.check()
+        self.assertEqual(result["status"], "error")
+        self.assertIn("unavailable", result["error"])
+        self.assertEqual(result["samples"], 0)
+
+        self.client.fail_with = None
+        self.client.latency = 0.05
+        self.probe.timeout = 0.001
+        self.clock.now += 10
+        result = await self.probe.check()
+        self.assertEqual(result["status"], "error")
+        self.assertIn("TimeoutError", result["error"])
+
+    async def test_exhausted_pool_times_out(self) -> None:
+        pool = firestore_client.FirestorePool(lambda: self.client, size=1, max_inflight=1)
+        probe = db_health.DbHealthProbe(
+            lambda: repository.FirestoreRepository(lambda: pool), ttl=5, timeout=0.01, clock=self.clock
+        )
+        async with pool.acquire():
+            result = await probe.check()
+        self.assertEqual(result["status"], "error")
+        self.assertIn("TimeoutError", result["error"])
+        self.assertEqual(self.client.calls["get"], 0)
+
+
+class HealthRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient()
+        firestore_client.set_client_factory(lambda: self.client)
+        db_health.probe = db_health.DbHealthProbe()
+        self.addCleanup(firestore_client.set_client_factory, None)
+
+    def test_health_db_reads_firestore(self) -> None:
+        with TestClient(main.app) as http:
+            response = http.get("/health/db")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["database"], "firestore")
+        self.assertEqual(self.client.calls["get"], 1)
+
+    def test_health_db_returns_503_when_unreachable(self) -> None:
+        self.client.fail_with = ConnectionError("refused")
+        with TestClient(main.app) as http:
+            response = http.get("/health/db")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "error")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import cache
+import datastore
+import etag
+import firestore_client
+import main
+import responses
+from fake_firestore import FakeAsyncClient
+
+
+def request_with(if_none_match: str) -> Request:
+    return Request({"type": "http", "headers": [(b"if-none-match", if_none_match.encode())]})
+
+
+class MatchingTests(unittest.TestCase):
+    def test_weak_comparison_and_lists(self) -> None:
+        tag = etag.for_version("units", "u1", "v1")
+        self.assertTrue(etag.matches(request_with(tag), tag))
+        self.assertTrue(etag.matches(request_with(tag[2:]), tag))
+        self.assertTrue(etag.matches(request_with(f'"other", {tag}'), tag))
+        self.assertTrue(etag.matches(request_with("*"), tag))
+        self.assertFalse(etag.matches(request_with('"other"'), tag))
+
+    def test_tags_depend_on_identity_and_version(self) -> None:
+        tags = {
+            etag.for_version("units", "u1", "v1"),
+            etag.for_version("units", "u1", "v2"),
+            etag.for_version("units", "u2", "v1"),
+            etag.for_version("properties", "u1", "v1"),
+        }
+        self.assertEqual(len(tags), 4)
+
+
+class ConditionalGetTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {"prop-1": {"rc_prop_id": "prop-1"}},
+            "units": {"unit-1": {"unit_id": "unit-1", "rc_prop_id": "prop-1", "rent_amount": 1500}},
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.http = TestClient(main.app)
+
+    def test_unchanged_document_returns_304_without_loading_it(self) -> None:
+        first = self.http.get("/units/unit-1")
+        tag = first.headers["etag"]
+        self.assertEqual(self.client.calls["get"], 1)
+        self.assertEqual(self.client.calls["get_metadata"], 0)
+
+        cache.caches["units"].clear()  # document gone from cache, version too
+        cache.versions["units"].clear()
+        second = self.http.get("/units/unit-1", headers={"If-None-Match": tag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second.headers["etag"], tag)
+        self.assertEqual(self.client.calls["get"], 1)
+        self.assertEqual(self.client.calls["get_metadata"], 1)
+
+        third = self.http.get("/units/unit-1", headers={"If-None-Match": tag})
+        self.assertEqual(third.status_code, 304)
+        self.assertEqual(self.client.calls["get_metadata"], 1)
+
+    def test_write_changes_the_etag(self) -> None:
+        tag = self.http.get("/units/unit-1").headers["etag"]
+        self.http.patch("/units/unit-1", json={"rent_amount": 1600})
+        response = self.http.get("/units/unit-1", headers={"If-None-Match": tag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["rent_amount"], 1600)
+        self.assertNotEqual(response.headers["etag"], tag)
+
+    def test_batched_read_tags_the_body_it_returned(self) -> None:
+        asyncio.run(datastore.get_documents("units", ["unit-1"]))
+        # written elsewhere after the batched read cached the document
+        self.client.data["units"]["unit-1"]["rent_amount"] = 1800
+        self.client.touch("units", "unit-1")
+        first = self.http.get("/units/unit-1")
+        self.assertEqual(first.json()["rent_amount"], 1500)
+        self.assertEqual(self.client.calls["get"], 0)
+
+        cache.clear_all()
+        second = self.http.get("/units/unit-1", headers={"If-None-Match": first.headers["etag"]})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["rent_amount"], 1800)
+
+    def test_conditional_get_of_missing_document_is_404(self) -> None:
+        response = self.http.get("/units/nope", headers={"If-None-Match": '"x"'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_overview_uses_body_hash(self) -> None:
+        first = self.http.get("/properties/prop-1/overview")
+        tag = first.headers["etag"]
+        second = self.http.get("/properties/prop-1/overview", headers={"If-None-Match": tag})
+        self.assertEqual(second.status_code, 304)
+        self.http.patch("/units/unit-1", json={"rent_amount": 1700})
+        third = self.http.get("/properties/prop-1/overview", headers={"If-None-Match": tag})
+        self.assertEqual(third.status_code, 200)
+
+
+    def test_responses_vary_on_accept_including_304s(self) -> None:
+        first = self.http.get("/units/unit-1")
+        second = self.http.get("/units/unit-1", headers={"If-None-Match": first.headers["etag"]})
+        self.assertEqual(second.status_code, 304)
+        for response in (first, second):
+            self.assertEqual(response.headers["vary"].split(", ").count("Accept"), 1)
+
+    @unittest.skipIf(responses.msgpack is None, "msgpack is not installed")
+    def test_msgpack_and_json_bodies_have_different_tags(self) -> None:
+        msgpack = {"Accept": responses.MSGPACK_MEDIA_TYPE}
+        as_json = self.http.get("/units/unit-1").headers["etag"]
+        packed = self.http.get("/units/unit-1", headers=msgpack)
+        self.assertEqual(packed.headers["content-type"], responses.MSGPACK_MEDIA_TYPE)
+        self.assertNotEqual(packed.headers["etag"], as_json)
+        # a JSON tag never turns a MessagePack request into a 304, nor the reverse
+        self.assertEqual(self.http.get("/units/unit-1", headers={**msgpack, "If-None-Match": as_json}).status_code, 200)
+        self.assertEqual(
+            self.http.get("/units/unit-1", headers={"If-None-Match": packed.headers["etag"]}).status_code, 200
+        )
+        self.assertEqual(
+            self.http.get("/units/unit-1", headers={**msgpack, "If-None-Match": packed.headers["etag"]}).status_code,
+            304,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
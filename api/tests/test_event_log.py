@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import event_log
+import firestore_client
+import main
+import metrics
+from fake_firestore import FakeAsyncClient
+
+
+class RecordingSink:
+    def __init__(self) -> None:
+        self.batches: list[dict] = []
+        self.fail_next = 0
+        self.gate: asyncio.Event | None = None
+
+    async def __call__(self, events: dict) -> None:
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail_next:
+            self.fail_next -= 1
+            raise ConnectionError("unavailable")
+        self.batches.append(dict(events))
+
+    @property
+    def total(self) -> int:
+        return sum(len(batch) for batch in self.batches)
+
+
+async def eventually(condition, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.001)
+
+
+def event(index: int) -> dict:
+    return event_log.build_event("unit.updated", "unit", f"unit-{index}")
+
+
+class EventLogWriterTests(unittest.IsolatedAsyncioTestCase):
+    def make_writer(self, **options) -> event_log.EventLogWriter:
+        self.sink = RecordingSink()
+        options.setdefault("registry", metrics.MetricsRegistry())
+        return event_log.EventLogWriter(self.sink, **options)
+
+    async def test_flushes_when_batch_is_full(self) -> None:
+        writer = self.make_writer(max_batch_size=10, flush_interval=60)
+        await writer.start()
+        for index in range(25):
+            await writer.append(event(index))
+        await eventually(lambda: self.sink.total == 20)
+        self.assertEqual([len(batch) for batch in self.sink.batches], [10, 10])
+        await writer.stop()
+        self.assertEqual([len(batch) for batch in self.sink.batches], [10, 10, 5])
+
+    async def test_flushes_partial_batch_after_interval(self) -> None:
+        writer = self.make_writer(max_batch_size=100, flush_interval=0.02)
+        await writer.start()
+        await writer.append(event(1))
+        await eventually(lambda: self.sink.total == 1)
+        self.assertTrue(writer.running)
+        await writer.stop()
+
+    async def test_full_queue_applies_backpressure(self) -> None:
+        writer = self.make_writer(max_batch_size=2, flush_interval=0, max_queued=3)
+        self.sink.gate = asyncio.Event()
+        await writer.start()
+        # interval 0 flushes whatever is there: one event is held by the
+        # blocked commit and three fill the queue
+        for index in range(4):
+            await writer.append(event(index))
+        await eventually(lambda: writer.depth == 3)
+        blocked = asyncio.create_task(writer.append(event(99)))
+        await asyncio.sleep(0.01)
+        self.assertFalse(blocked.done())
+        self.sink.gate.set()
+        await blocked
+        await writer.stop()
+        self.assertEqual(self.sink.total, 5)
+
+    async def test_failed_flush_is_retried_with_same_ids(self) -> None:
+        writer = self.make_writer(max_batch_size=5, flush_interval=0)
+        self.sink.fail_next = 1
+        event_log.RETRY_BACKOFF_SECONDS, saved = (0.001,), event_log.RETRY_BACKOFF_SECONDS
+        self.addCleanup(setattr, event_log, "RETRY_BACKOFF_SECONDS", saved)
+        await writer.start()
+        event_id = await writer.append(event(1))
+        await eventually(lambda: self.sink.total == 1)
+        await writer.stop()
+        self.assertEqual(self.sink.batches, [{event_id: self.sink.batches[0][event_id]}])
+        self.assertEqual(writer.failures.values[()], 1)
+
+    async def test_stop_flushes_batch_interrupted_mid_commit(self) -> None:
+        writer = self.make_writer(max_batch_size=2, flush_interval=0)
+        self.sink.gate = asyncio.Event()
+        await writer.start()
+        await writer.append(event(1))
+        await writer.append(event(2))
+        await asyncio.sleep(0)
+        stopping = asyncio.create_task(writer.stop())
+        await asyncio.sleep(0)
+        self.sink.gate.set()
+        await stopping
+        self.assertEqual(self.sink.total, 2)
+
+    async def test_append_writes_through_when_not_running(self) -> None:
+        writer = self.make_writer()
+        await writer.append(event(1))
+        self.assertEqual(self.sink.total, 1)
+
+
+class EventLogRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({"units": {"unit-1": {"unit_id": "unit-1", "rent_amount": 1}}})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    def test_patch_events_are_committed_by_shutdown(self) -> None:
+        with TestClient(main.create_app()) as http:
+            for amount in (2, 3, 4):
+                self.assertEqual(http.patch("/units/unit-1", json={"rent_amount": amount}).status_code, 200)
+        events = list(self.client.data[event_log.EVENT_LOG_COLLECTION].values())
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]["event_type"], "unit.updated")
+        self.assertEqual(events[0]["entity_id"], "unit-1")
+        self.assertEqual(events[0]["payload"], {"fields": ["rent_amount"]})
+        self.assertLessEqual(self.client.calls["commit"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
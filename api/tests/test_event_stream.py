@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import datetime as dt
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import event_log
+import event_stream
+import firestore_client
+import main
+import metrics
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+def event(
+    entity_id: str, event_type: str = "unit.updated", entity_type: str = "unit", landlord_id: str = "l1", **extra
+) -> dict:
+    return {"id": f"{entity_id}-{event_type}", "event_type": event_type, "entity_type": entity_type,
+            "entity_id": entity_id, "context": {"landlord_id": landlord_id}, **extra}
+
+
+class SubscriberTests(unittest.TestCase):
+    def test_same_key_coalesces_to_latest(self) -> None:
+        subscriber = event_stream.Subscriber("l1", None, None, buffer=10)
+        key = ("unit", "u1", "unit.updated")
+        self.assertIsNone(subscriber.offer(key, b"v1"))
+        self.assertEqual(subscriber.offer(key, b"v2"), "coalesced")
+        frames, dropped = subscriber.take()
+        self.assertEqual(frames, [b"v2"])
+        self.assertEqual(dropped, 0)
+
+    def test_overflow_drops_oldest_and_counts(self) -> None:
+        subscriber = event_stream.Subscriber("l1", None, None, buffer=2)
+        for index in range(5):
+            subscriber.offer(("unit", f"u{index}", "unit.updated"), f"u{index}".encode())
+        frames, dropped = subscriber.take()
+        self.assertEqual(frames, [b"u3", b"u4"])
+        self.assertEqual(dropped, 3)
+        self.assertFalse(subscriber.ready.is_set())
+
+
+class EventHubTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(data={"event_log": {}})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.clock = FakeClock(dt.datetime(2026, 3, 15, 12, tzinfo=dt.timezone.utc))
+        self.hub = event_stream.EventHub(
+            poll_interval=3600, buffer=8, settle=dt.timedelta(seconds=3), clock=self.clock,
+            registry=metrics.MetricsRegistry(),
+        )
+        self.addAsyncCleanup(self.hub.stop)
+
+    async def test_publish_routes_by_filter(self) -> None:
+        exact = self.hub.subscribe("l1", "unit", "u1")
+        by_type = self.hub.subscribe("l1", "unit")
+        landlord = self.hub.subscribe("l1")
+        other = self.hub.subscribe("l1", "property", "p1")
+        self.hub.publish(event("u1"))
+        self.hub.publish(event("u2"))
+        self.assertEqual(len(exact.take()[0]), 1)
+        self.assertEqual(len(by_type.take()[0]), 2)
+        self.assertEqual(len(landlord.take()[0]), 2)
+        self.assertEqual(other.take()[0], [])
+
+    async def test_events_only_reach_their_landlord(self) -> None:
+        mine, theirs = self.hub.subscribe("l1"), self.hub.subscribe("l2", "unit", "u1")
+        self.hub.publish(event("u1", landlord_id="l1"))
+        self.hub.publish(event("u1", landlord_id=None))
+        self.assertEqual(len(mine.take()[0]), 1)
+        self.assertEqual(theirs.take()[0], [])
+
+    async def test_unsubscribe_cleans_indexes_and_stops_poller(self) -> None:
+        subscribers = [self.hub.subscribe("l1", "unit", "u1"), self.hub.subscribe("l1", "unit"),
+                       self.hub.subscribe("l1")]
+        self.assertIsNotNone(self.hub._task)
+        for subscriber in subscribers:
+            self.hub.unsubscribe(subscriber)
+            self.hub.unsubscribe(subscriber)
+        self.assertEqual(len(self.hub), 0)
+        tables = (self.hub._by_entity, self.hub._by_type, self.hub._by_landlord)
+        self.assertEqual([dict(table) for table in tables], [{}, {}, {}])
+        self.assertIsNone(self.hub._task)
+
+    async def test_poll_reads_each_entry_once_after_it_settles(self) -> None:
+        subscriber = event_stream.Subscriber("l1", None, None, buffer=8)
+        self.hub._by_landlord["l1"].add(subscriber)  # without starting the poller
+        start = self.clock.now
+        self.assertEqual(await self.hub.poll_once(), 0)  # from now on, not history
+        entries = self.client.data["event_log"]
+
+        def write(event_id: str, seconds: float) -> None:
+            entries[event_id] = event_log.build_event("unit.updated", "unit", event_id, context={"landlord_id": "l1"})
+            entries[event_id]["created_at"] = start + dt.timedelta(seconds=seconds)
+
+        write("a", 2)
+        self.clock.now += dt.timedelta(seconds=5)
+        # written behind: lands after "a" was created, but is older than it
+        write("b", 1)
+        self.assertEqual(await self.hub.poll_once(), 2)
+        write("c", 3.5)  # not settled yet: read by the next poll, not this one
+        self.assertEqual(await self.hub.poll_once(), 0)
+        self.clock.now += dt.timedelta(seconds=4)
+        self.assertEqual(await self.hub.poll_once(), 1)
+        self.assertEqual(await self.hub.poll_once(), 0)
+        frames = subscriber.take()[0]
+        self.assertEqual([frame.split(b"\n")[0] for frame in frames], [b"id: b", b"id: a", b"id: c"])
+        self.assertEqual(self.client.calls["documents_read"], 3)
+
+    async def test_resubscribing_after_idle_does_not_replay_history(self) -> None:
+        windows = []
+
+        async def fetch(since: dt.datetime, until: dt.datetime):
+            windows.append((since, until))
+            return
+            yield
+
+        self.hub._fetch = fetch
+        first = self.hub.subscribe("l1")
+        await self.hub.poll_once()
+        self.hub.unsubscribe(first)
+        self.clock.now += dt.timedelta(days=2)
+        self.hub.subscribe("l1")
+        self.assertEqual(await self.hub.poll_once(), 0)
+        self.clock.now += dt.timedelta(seconds=1)
+        await self.hub.poll_once()
+        (since, until), = windows
+        self.assertEqual(until - since, dt.timedelta(seconds=1))
+
+    async def test_stream_formats_events_and_drop_notice(self) -> None:
+        stream = self.hub.stream("l1", "unit", heartbeat=0.01)
+        self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+        self.assertEqual(await anext(stream), b": keepalive\n\n")
+        for index in range(10):
+            self.hub.publish(event(f"u{index}"))
+        chunk = await anext(stream)
+        self.assertTrue(chunk.startswith(b'event: dropped\ndata: {"count":2}\n\n'))
+        self.assertEqual(chunk.count(b"event: unit.updated\n"), 8)
+        await stream.aclose()
+        self.assertEqual(len(self.hub), 0)
+
+    async def test_fields_cannot_inject_lines(self) -> None:
+        chunk = event_stream.format_event({"id": "x\nevent: admin", "event_type": "a\r\nb"})
+        self.assertEqual(chunk.count(b"\n"), 4)
+
+
+class EventStreamRouteTests(unittest.TestCase):
+    def test_entity_id_requires_entity_type(self) -> None:
+        http = TestClient(main.create_app())
+        self.assertEqual(http.get("/landlords/l1/events/stream", params={"entity_id": "u1"}).status_code, 400)
+
+    def test_stream_requires_a_landlord(self) -> None:
+        http = TestClient(main.create_app())
+        self.assertEqual(http.get("/events/stream").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi import Body, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import idempotency
+import main
+import metrics
+import responses
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+def make_app(store: cache.TTLCache) -> tuple[FastAPI, dict]:
+    state = {"calls": 0, "gate": None}
+    app = FastAPI()
+    app.add_middleware(idempotency.IdempotencyMiddleware, store=store, registry=metrics.MetricsRegistry())
+
+    @app.post("/payments")
+    async def create_payment(payload: dict = Body(...)):
+        state["calls"] += 1
+        if state["gate"] is not None:
+            await state["gate"].wait()
+        if payload.get("fail"):
+            raise HTTPException(status_code=503, detail="processor unavailable")
+        return {"payment": state["calls"], "amount": payload["amount"]}
+
+    return app, state
+
+
+class IdempotencyTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.store = cache.TTLCache("idempotency", ttl=60, max_entries=100, clock=self.clock)
+        self.app, self.state = make_app(self.store)
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://test")
+
+    async def asyncTearDown(self) -> None:
+        await self.http.aclose()
+
+    async def post(self, key: str | None, payload: dict) -> httpx.Response:
+        headers = {"Idempotency-Key": key} if key is not None else {}
+        return await self.http.post("/payments", json=payload, headers=headers)
+
+    async def test_retry_replays_stored_response(self) -> None:
+        first = await self.post("k1", {"amount": 100})
+        second = await self.post("k1", {"amount": 100})
+        self.assertEqual(self.state["calls"], 1)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers["idempotent-replayed"], "true")
+        self.assertNotIn("idempotent-replayed", first.headers)
+
+    async def test_without_key_every_request_runs(self) -> None:
+        await self.post(None, {"amount": 100})
+        await self.post(None, {"amount": 100})
+        self.assertEqual(self.state["calls"], 2)
+
+    async def test_key_reused_for_different_body_is_rejected(self) -> None:
+        await self.post("k1", {"amount": 100})
+        response = await self.post("k1", {"amount": 999})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.state["calls"], 1)
+
+    async def test_concurrent_duplicates_run_once(self) -> None:
+        self.state["gate"] = asyncio.Event()
+        requests = [asyncio.create_task(self.post("k1", {"amount": 100})) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        self.state["gate"].set()
+        replies = await asyncio.gather(*requests)
+        self.assertEqual(self.state["calls"], 1)
+        self.assertEqual({response.json()["payment"] for response in replies}, {1})
+        self.assertEqual(sum("idempotent-replayed" in response.headers for response in replies), 4)
+
+    async def test_server_errors_are_not_stored(self) -> None:
+        self.assertEqual((await self.post("k1", {"amount": 1, "fail": True})).status_code, 503)
+        self.assertEqual((await self.post("k1", {"amount": 1, "fail": True})).status_code, 503)
+        self.assertEqual(self.state["calls"], 2)
+
+    async def test_entries_expire(self) -> None:
+        await self.post("k1", {"amount": 100})
+        self.clock.now += 61
+        await self.post("k1", {"amount": 100})
+        self.assertEqual(self.state["calls"], 2)
+
+    @unittest.skipIf(responses.msgpack is None, "msgpack not installed")
+    async def test_key_reused_with_another_media_type_is_rejected(self) -> None:
+        await self.post("k1", {"amount": 100})
+        response = await self.http.post(
+            "/payments", json={"amount": 100},
+            headers={"Idempotency-Key": "k1", "Accept": "application/msgpack"},
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.state["calls"], 1)
+
+    async def test_store_is_held_to_its_byte_budget(self) -> None:
+        store = cache.TTLCache("idempotency", 60, 100, max_bytes=1000, weigh=idempotency._Stored.size)
+        app, state = make_app(store)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            for index in range(10):
+                await http.post("/payments", json={"amount": index}, headers={"Idempotency-Key": f"k{index}"})
+            self.assertLessEqual(store.bytes, 1000)
+            self.assertLess(len(store), 10)
+            # the most recent response is still replayed
+            replay = await http.post("/payments", json={"amount": 9}, headers={"Idempotency-Key": "k9"})
+        self.assertEqual(replay.headers["idempotent-replayed"], "true")
+        self.assertEqual(state["calls"], 10)
+
+    async def test_retry_from_another_address_is_replayed(self) -> None:
+        moved = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app, client=("198.51.100.7", 443)), base_url="http://test"
+        )
+        self.addAsyncCleanup(moved.aclose)
+        first = await self.post("k1", {"amount": 100})
+        retry = await moved.post("/payments", json={"amount": 100}, headers={"Idempotency-Key": "k1"})
+        self.assertEqual((retry.json(), retry.headers["idempotent-replayed"]), (first.json(), "true"))
+        self.assertEqual(self.state["calls"], 1)
+
+    async def test_oversized_body_is_rejected(self) -> None:
+        with mock.patch.object(idempotency, "MAX_REQUEST_BODY", 64):
+            response = await self.post("k1", {"amount": 100, "memo": "x" * 100})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.state["calls"], 0)
+
+    async def test_oversized_key_is_rejected(self) -> None:
+        response = await self.post("k" * 300, {"amount": 100})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.state["calls"], 0)
+
+
+class IdempotentPatchTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(data={"properties": {"prop-1": {"rc_prop_id": "prop-1", "name": "A"}}})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    def test_replayed_patch_skips_the_database(self) -> None:
+        http = TestClient(main.create_app())
+        headers = {"Idempotency-Key": "patch-1"}
+        first = http.patch("/properties/prop-1", json={"name": "B"}, headers=headers)
+        calls = dict(self.client.calls)
+        second = http.patch("/properties/prop-1", json={"name": "B"}, headers=headers)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(dict(self.client.calls), calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
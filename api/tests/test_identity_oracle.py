@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import identity_oracle
+import identity_routes
+import main
+import metrics
+from fake_firestore import FakeAsyncClient
+
+
+TOKEN = "job-token"
+URL = "/internal/identity-oracle/normalize"
+
+
+class NormalizationTests(unittest.TestCase):
+    def test_namespaces_follow_the_node_syntax_adapters(self) -> None:
+        ontario = identity_oracle.NAMESPACES["ON"]
+        self.assertEqual(ontario.normalize("12345-6789"), ("valid", None, "123456789"))
+        self.assertEqual(ontario.normalize("1234"), ("invalid", "ontario_pin_must_have_9_digits", None))
+        self.assertEqual(ontario.normalize("n/a"), ("invalid", "identifier_required", None))
+        self.assertEqual(identity_oracle.NAMESPACES["NS"].normalize("0012 3456"), ("valid", None, "00123456"))
+
+    def test_select_namespace(self) -> None:
+        self.assertEqual(identity_oracle.select_namespace("NS", "PID").key, "ca-ns:pid")
+        self.assertEqual(identity_oracle.normalize_province(" ontario "), "ON")
+        for province, identifier_type, error in (
+            ("BC", None, "province_not_supported"),
+            ("ON", "pid", "identifier_type_not_supported_for_province"),
+            ("ON", "roll", "identifier_type_not_supported"),
+        ):
+            with self.subTest(province=province, identifier_type=identifier_type):
+                with self.assertRaisesRegex(identity_oracle.InvalidIdentifier, error):
+                    identity_oracle.select_namespace(province, identifier_type)
+
+    def test_memo_is_a_bounded_lru_per_namespace(self) -> None:
+        registry = metrics.MetricsRegistry()
+        memo = identity_oracle.NormalizationMemo(max_entries=2, registry=registry)
+        ontario, nova_scotia = identity_oracle.NAMESPACES["ON"], identity_oracle.NAMESPACES["NS"]
+        for identifier in ("111111111", "222222222", "111111111", "333333333", "111111111", "222222222"):
+            # 333333333 evicts 222222222, the least recently used
+            self.assertEqual(memo.normalize(ontario, identifier), ("valid", None, identifier))
+        memo.normalize(nova_scotia, "11111111")
+        self.assertEqual(len(memo), 3)
+        rendered = registry.render()
+        self.assertIn('identity_memo_lookups_total{namespace="ca-on:pin",result="hit"} 2', rendered)
+        self.assertIn('identity_memo_lookups_total{namespace="ca-on:pin",result="miss"} 4', rendered)
+
+
+class BatchRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {
+                "p-on": {"rc_prop_id": "p-on", "province": "Ontario", "city": "Toronto"},
+                "p-ns": {"rc_prop_id": "p-ns", "province": "NS", "municipality": "Halifax"},
+                "p-bc": {"rc_prop_id": "p-bc", "province": "BC"},
+            },
+            "property_identity_profiles": {
+                "p-ns": {"propertyId": "p-ns", "identifiers": {"ca-ns:pid": {"lastRunId": "old"}}, "owner": "kept"},
+            },
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.addCleanup(setattr, identity_oracle, "memos", identity_oracle.memos)
+        identity_oracle.memos = identity_oracle.NormalizationMemo(registry=metrics.MetricsRegistry())
+        patcher = mock.patch.object(identity_routes, "INTERNAL_JOB_TOKEN", TOKEN)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.http = TestClient(main.create_app())
+
+    def post(self, body: dict, token: str = TOKEN):
+        return self.http.post(URL, json=body, headers={"X-Internal-Job-Token": token})
+
+    def test_batch_dedupes_and_writes_in_bulk(self) -> None:
+        items = [
+            {"propertyId": "p-on", "identifier": "123-456-789"},
+            {"propertyId": "p-ns", "identifier": "4012 3456", "identifierType": "pid"},
+            {"propertyId": "p-on", "identifier": "123-456-789"},
+            {"propertyId": "p-on", "identifier": "12"},
+            {"propertyId": "p-bc", "identifier": "999"},
+            {"propertyId": "missing", "identifier": "123456789"},
+        ]
+        response = self.post({"items": items, "actorId": "ops-1"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["received"], body["unique"], body["runsWritten"]), (6, 5, 3))
+        self.assertEqual((body["profilesWritten"], body["errors"]), (2, 2))
+
+        first, ns, repeat, short, bc, missing = body["results"]
+        self.assertEqual(first["normalizedIdentifier"], "123456789")
+        self.assertEqual((repeat["runId"], repeat["duplicate"]), (first["runId"], True))
+        self.assertEqual(ns["namespaceKey"], "ca-ns:pid")
+        self.assertEqual((short["syntaxStatus"], short["reason"]), ("invalid", "ontario_pin_must_have_9_digits"))
+        self.assertEqual(bc["error"], "province_not_supported")
+        self.assertEqual(missing["error"], "property_not_found")
+
+        # one read for properties, one for profiles, one commit each for runs and profiles
+        self.assertEqual(self.client.calls["get_all"], 2)
+        self.assertEqual(self.client.calls["commit"], 2)
+        self.assertEqual(self.client.calls["set"], 0)
+
+        run = self.client.data["identity_oracle_runs"][first["runId"]]
+        self.assertEqual(run["namespaceKey"], "ca-on:pin")
+        self.assertEqual(run["municipality"], "Toronto")
+        self.assertEqual(run["verificationStatus"], "SYNTAX_ONLY")
+        self.assertEqual(run["createdBy"], "ops-1")
+
+        profile = self.client.data["property_identity_profiles"]["p-on"]
+        self.assertEqual(profile["latestRunId"], short["runId"])
+        self.assertEqual(profile["identifiers"]["ca-on:pin"]["syntaxStatus"], "invalid")
+        merged = self.client.data["property_identity_profiles"]["p-ns"]
+        self.assertEqual(merged["owner"], "kept")
+        self.assertEqual(merged["identifiers"]["ca-ns:pid"]["lastRunId"], ns["runId"])
+
+    def test_token_and_batch_size_are_enforced(self) -> None:
+        self.assertEqual(self.post({"items": [{"propertyId": "p-on"}]}, token="wrong").status_code, 401)
+        with mock.patch.object(identity_routes, "INTERNAL_JOB_TOKEN", ""):
+            self.assertEqual(self.post({"items": [{"propertyId": "p-on"}]}, token="").status_code, 401)
+        self.assertEqual(self.post({"items": []}).status_code, 400)
+        with mock.patch.object(identity_oracle, "MAX_BATCH_SIZE", 2):
+            self.assertEqual(self.post({"items": [{}] * 3}).status_code, 413)
+        self.assertNotIn("identity_oracle_runs", self.client.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
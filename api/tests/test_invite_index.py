@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi.testclient import TestClient
+
+import cache
+import datastore
+import firestore_client
+import invite_index
+import invite_routes
+import main
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+def invite(expires: float | None, status: str = "pending", **fields) -> dict:
+    return {"status": status, "expires_at": expires, **fields}
+
+
+class InviteIndexTests(unittest.TestCase):
+    def test_expired_invites_are_never_served_and_leave_lazily(self) -> None:
+        index = invite_index.InviteIndex()
+        index.apply("a", invite(100), now=0)
+        index.apply("b", invite(200), now=0)
+        index.apply("c", invite(None), now=0)
+        self.assertIsNotNone(index.get("a", now=99))
+        self.assertIsNone(index.get("a", now=100))
+        self.assertEqual((len(index), index.evicted), (2, 1))
+        self.assertIsNotNone(index.get("c", now=10**15))
+        self.assertEqual(len(index), 1)
+
+    def test_closed_invites_are_dropped_and_the_heap_compacts(self) -> None:
+        index = invite_index.InviteIndex()
+        index.apply("a", invite(100), now=0)
+        index.apply("a", invite(100, status="redeemed"), now=0)
+        self.assertIsNone(index.get("a", now=0))
+        index.apply("b", invite(50), now=0)
+        index.apply("b", invite(500), now=0)  # re-dated: the old heap entry is stale
+        self.assertIsNotNone(index.get("b", now=60))
+        for round_ in range(200):
+            index.apply("c", invite(1000 + round_), now=0)
+        self.assertEqual(len(index), 2)
+        self.assertLessEqual(index.heap_size, invite_index.COMPACT_RATIO * len(index) + 64)
+
+    def test_memory_is_bounded_by_dropping_the_soonest_expiry(self) -> None:
+        index = invite_index.InviteIndex(max_entries=2)
+        index.apply("late", invite(300), now=0)
+        index.apply("soon", invite(100), now=0)
+        index.apply("mid", invite(200), now=0)
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.get("soon", now=0))
+        self.assertIsNotNone(index.get("mid", now=0))
+
+
+class InviteRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock(1_000_000.0)
+        self.tokens = {"open": "tok-open", "used": "tok-used", "stale": "tok-stale", "later": "tok-later"}
+        hashed = {name: invite_index.hash_token(token) for name, token in self.tokens.items()}
+        self.hashes = hashed
+        self.client = FakeAsyncClient({
+            "tenancy_invites": {
+                hashed["open"]: invite(self.clock.now + 60_000, rc_prop_id="p1", property_id="p1",
+                                       invited_email="ten@example.com", invited_name="Ten"),
+                hashed["used"]: invite(self.clock.now + 60_000, status="redeemed"),
+                hashed["stale"]: invite(self.clock.now + 1_000),
+            },
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.addCleanup(setattr, invite_index, "invites", invite_index.invites)
+        invite_index.invites = invite_index.InviteLookup(clock=self.clock)
+        self.http = TestClient(main.create_app())
+
+    def check(self, name: str):
+        return self.http.post("/tenancy-invites/check", json={"token": self.tokens.get(name, name)})
+
+    def test_hash_matches_the_node_api(self) -> None:
+        self.assertEqual(invite_index.hash_token(" abc "), hashlib.sha256(b"abc").hexdigest())
+
+    def test_open_invites_are_checked_without_datastore_reads(self) -> None:
+        first = self.check("open")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["invite"]["property_id"], "p1")
+        self.assertNotIn("invited_email", first.json()["invite"])
+        reads = dict(self.client.calls)
+        for _ in range(5):
+            self.assertEqual(self.check("open").status_code, 200)
+        self.assertEqual(dict(self.client.calls), reads)
+        self.assertEqual(invite_index.invites.hits, 6)  # the first build indexed it
+
+    def test_invalid_tokens(self) -> None:
+        self.assertEqual(self.check("used").json()["detail"], "invite_used")
+        self.assertEqual(self.check("nope").status_code, 404)
+        self.assertEqual(self.check("stale").status_code, 200)
+        self.clock.now += 1_000
+        self.assertEqual(self.check("stale").status_code, 410)
+
+    def test_invites_written_elsewhere_are_found_on_first_use(self) -> None:
+        self.check("open")
+        self.client.data["tenancy_invites"][self.hashes["later"]] = invite(self.clock.now + 5_000)
+        self.assertEqual(self.check("later").status_code, 200)
+        self.assertEqual(invite_index.invites.misses, 1)
+        self.assertEqual(len(invite_index.invites.index), 3)
+
+    def test_redeem_once(self) -> None:
+        body = {"token": self.tokens["open"], "redeemed_by_uid": "uid-1", "redeemed_by_email": "TEN@example.com"}
+        mismatch = {**body, "redeemed_by_email": "other@example.com"}
+        self.assertEqual(self.http.post("/tenancy-invites/redeem", json=mismatch).status_code, 403)
+        response = self.http.post("/tenancy-invites/redeem", json=body)
+        self.assertEqual(response.status_code, 200)
+        stored = self.client.data["tenancy_invites"][self.hashes["open"]]
+        self.assertEqual((stored["status"], stored["redeemed_by_uid"]), ("redeemed", "uid-1"))
+
+        gets = self.client.calls["get"]
+        again = self.http.post("/tenancy-invites/redeem", json=body)
+        self.assertEqual(again.json()["detail"], "invite_used")
+        self.assertEqual(self.client.calls["get"], gets + 1)  # dropped from the index, read once
+
+    def test_redeem_rechecks_the_document(self) -> None:
+        self.check("open")
+        # redeemed by the Node API after it was indexed
+        self.client.data["tenancy_invites"][self.hashes["open"]]["status"] = "redeemed"
+        body = {"token": self.tokens["open"], "redeemed_by_uid": "uid-2"}
+        self.assertEqual(self.http.post("/tenancy-invites/redeem", json=body).status_code, 409)
+        self.assertEqual(len(invite_index.invites.index), 1)
+
+
+
+class InviteRedeemRaceTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.clock = FakeClock(1_000_000.0)
+        self.token = "tok-race"
+        self.hash = invite_index.hash_token(self.token)
+        self.client = FakeAsyncClient({"tenancy_invites": {self.hash: invite(self.clock.now + 60_000)}})
+        self.client.latency = 0.001  # lets concurrent redemptions interleave at every RPC
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.addCleanup(setattr, invite_index, "invites", invite_index.invites)
+        invite_index.invites = invite_index.InviteLookup(clock=self.clock)
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.create_app()), base_url="http://test")
+
+    async def asyncTearDown(self) -> None:
+        await self.http.aclose()
+
+    def redeem(self, uid: str):
+        return self.http.post("/tenancy-invites/redeem", json={"token": self.token, "redeemed_by_uid": uid})
+
+    def redeemed_events(self) -> list[dict]:
+        events = self.client.data.get("event_log", {}).values()
+        return [event for event in events if event["event_type"] == "tenant_invite_redeemed"]
+
+    async def test_concurrent_redemptions_redeem_once(self) -> None:
+        replies = await asyncio.gather(*(self.redeem(f"uid-{index}") for index in range(3)))
+        self.assertEqual(sorted(reply.status_code for reply in replies), [200, 409, 409])
+        self.assertEqual(len(self.redeemed_events()), 1)
+        winner = next(reply for reply in replies if reply.status_code == 200)
+        stored = self.client.data["tenancy_invites"][self.hash]
+        self.assertEqual(stored["redeemed_by_uid"], json.loads(winner.request.content)["redeemed_by_uid"])
+        self.assertEqual(invite_routes._redeeming, {})
+
+    async def test_redemption_written_elsewhere_after_the_read_conflicts(self) -> None:
+        get_versioned = datastore.get_versioned
+
+        async def read_then_lose_the_race(collection: str, doc_id: str):
+            pair = await get_versioned(collection, doc_id)
+            # another instance redeems between this read and the write
+            self.client.data[collection][doc_id]["status"] = "redeemed"
+            self.client.touch(collection, doc_id)
+            return pair
+
+        with mock.patch.object(datastore, "get_versioned", read_then_lose_the_race):
+            reply = await self.redeem("uid-1")
+        self.assertEqual((reply.status_code, reply.json()["detail"]), (409, "invite_used"))
+        self.assertEqual(self.redeemed_events(), [])
+
+
+
+class RebuildBackoffTests(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_rebuild_is_not_retried_on_every_request(self) -> None:
+        lookup = invite_index.InviteLookup(refresh_seconds=0, retry_seconds=60)
+        builds = []
+
+        async def build():
+            builds.append(len(builds))
+            if len(builds) > 1:
+                raise RuntimeError("datastore unavailable")
+            return invite_index.InviteIndex()
+
+        lookup._build = build
+        first = await lookup.ready()
+        with self.assertLogs("rentchain.invite_index", "WARNING"):
+            for _ in range(5):
+                self.assertIs(await lookup.ready(), first)
+                if lookup._refresh is not None:
+                    await lookup._refresh
+        self.assertEqual(len(builds), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import jobs
+import main
+import metrics
+import reports
+from fake_firestore import FakeAsyncClient
+
+
+async def eventually(condition, timeout: float = 5.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not await condition():
+        if loop.time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.005)
+
+
+class Gate:
+    """Thread-pool job body that blocks until released and records run order."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started: list[str] = []
+
+    def __call__(self, params: dict) -> dict:
+        self.started.append(params["name"])
+        self.release.wait(5)
+        if params.get("fail"):
+            raise RuntimeError("report provider unavailable")
+        return {"name": params["name"]}
+
+
+class JobRunnerTests(unittest.IsolatedAsyncioTestCase):
+    def make_runner(self, path: str = ":memory:", **options) -> jobs.JobRunner:
+        self.gate = Gate()
+        kinds = {"gate": jobs.JobKind("gate", self.gate, executor="thread")}
+        options.setdefault("registry", metrics.MetricsRegistry())
+        options.setdefault("thread_workers", 1)
+        runner = jobs.JobRunner(lambda: jobs.JobStore(path), kinds=kinds, **options)
+        self.addAsyncCleanup(runner.stop)
+        return runner
+
+    async def status(self, runner: jobs.JobRunner, job_id: str) -> str:
+        return (await runner.get(job_id))["status"]
+
+    async def test_job_runs_and_stores_result(self) -> None:
+        runner = self.make_runner()
+        await runner.start()
+        job = await runner.enqueue("gate", "landlord-1", {"name": "a"})
+        self.assertEqual(job["status"], jobs.QUEUED)
+        self.gate.release.set()
+
+        async def done():
+            return await self.status(runner, job["id"]) == jobs.SUCCEEDED
+
+        await eventually(done)
+        stored = await runner.get(job["id"])
+        self.assertEqual(stored["result"], {"name": "a"})
+        self.assertIsNotNone(stored["started_at"])
+        self.assertIsNotNone(stored["finished_at"])
+
+    async def test_failure_is_recorded(self) -> None:
+        runner = self.make_runner()
+        await runner.start()
+        self.gate.release.set()
+        job = await runner.enqueue("gate", "landlord-1", {"name": "a", "fail": True})
+
+        async def done():
+            return await self.status(runner, job["id"]) == jobs.FAILED
+
+        await eventually(done)
+        self.assertIn("report provider unavailable", (await runner.get(job["id"]))["error"])
+
+    async def test_unknown_kind_is_rejected(self) -> None:
+        runner = self.make_runner()
+        with self.assertRaises(jobs.UnknownJobKind):
+            await runner.enqueue("nope", "landlord-1")
+
+    async def test_enqueue_with_a_job_id_is_idempotent(self) -> None:
+        runner = self.make_runner()
+        first = await runner.enqueue("gate", "landlord-1", {"name": "a"}, job_id="deadline-1")
+        again = await runner.enqueue("gate", "landlord-1", {"name": "a"}, job_id="deadline-1")
+        self.assertEqual((first["id"], again["id"]), ("deadline-1", "deadline-1"))
+        self.assertEqual(again["seq"], first["seq"])
+        self.assertEqual(len(runner.store.queued()), 1)
+
+    async def test_higher_priority_runs_first(self) -> None:
+        runner = self.make_runner()
+        await runner.start()
+        await runner.enqueue("gate", "l1", {"name": "first"})
+        await eventually(lambda: asyncio.sleep(0, bool(self.gate.started)))
+        await runner.enqueue("gate", "l2", {"name": "low"}, priority=-5)
+        await runner.enqueue("gate", "l3", {"name": "normal"})
+        await runner.enqueue("gate", "l4", {"name": "high"}, priority=5)
+        self.gate.release.set()
+        await eventually(lambda: asyncio.sleep(0, len(self.gate.started) == 4))
+        self.assertEqual(self.gate.started, ["first", "high", "normal", "low"])
+
+    async def test_per_landlord_cap(self) -> None:
+        runner = self.make_runner(thread_workers=4, max_per_landlord=1)
+        await runner.start()
+        for index in range(3):
+            await runner.enqueue("gate", "busy", {"name": f"busy-{index}"})
+        await runner.enqueue("gate", "other", {"name": "other"})
+        await eventually(lambda: asyncio.sleep(0, len(self.gate.started) == 2))
+        await asyncio.sleep(0.05)
+        self.assertEqual(sorted(self.gate.started), ["busy-0", "other"])
+        self.gate.release.set()
+        await eventually(lambda: asyncio.sleep(0, len(self.gate.started) == 4))
+        self.assertEqual([name for name in self.gate.started if name.startswith("busy")],
+                         ["busy-0", "busy-1", "busy-2"])
+
+    async def test_cancel_queued_and_running(self) -> None:
+        runner = self.make_runner()
+        await runner.start()
+        running = await runner.enqueue("gate", "l1", {"name": "running"})
+        queued = await runner.enqueue("gate", "l1", {"name": "queued"})
+
+        async def started():
+            return await self.status(runner, running["id"]) == jobs.RUNNING
+
+        await eventually(started)
+        self.assertEqual((await runner.cancel(queued["id"]))["status"], jobs.CANCELLED)
+        self.assertEqual((await runner.cancel(running["id"]))["status"], jobs.CANCELLING)
+        self.gate.release.set()
+
+        async def cancelled():
+            return await self.status(runner, running["id"]) == jobs.CANCELLED
+
+        await eventually(cancelled)
+        self.assertIsNone((await runner.get(running["id"]))["result"])
+        self.assertEqual(self.gate.started, ["running"])
+        with self.assertRaises(jobs.JobNotCancellable):
+            await runner.cancel(running["id"])
+
+    async def test_watch_yields_each_status_change(self) -> None:
+        runner = self.make_runner()
+        await runner.start()
+        job = await runner.enqueue("gate", "l1", {"name": "a"})
+        seen = []
+
+        async def collect():
+            async for update in runner.watch(job["id"]):
+                seen.append(update["status"])
+
+        watcher = asyncio.create_task(collect())
+        await eventually(lambda: asyncio.sleep(0, bool(self.gate.started)))
+        self.gate.release.set()
+        async with asyncio.timeout(5):
+            await watcher
+        self.assertEqual(seen[-1], jobs.SUCCEEDED)
+        self.assertIn(jobs.RUNNING, seen)
+
+    async def test_queue_survives_restart(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = str(pathlib.Path(directory.name) / "jobs.sqlite3")
+        first = self.make_runner(path)
+        await first.start()
+        interrupted = await first.enqueue("gate", "l1", {"name": "interrupted"})
+        await eventually(lambda: asyncio.sleep(0, bool(self.gate.started)))
+        waiting = await first.enqueue("gate", "l1", {"name": "waiting"})
+        await first.stop()
+        self.gate.release.set()  # the abandoned worker thread
+
+        second = self.make_runner(path)
+        self.gate.release.set()
+        await second.start()
+
+        async def both_done():
+            statuses = {await self.status(second, job["id"]) for job in (interrupted, waiting)}
+            return statuses == {jobs.SUCCEEDED}
+
+        await eventually(both_done)
+
+
+class PaymentHistoryTests(unittest.TestCase):
+    def test_payments_apply_to_oldest_charge_first(self) -> None:
+        entries = [
+            ("scheduled_rent_charge", 1000, "2026-01-01"),
+            ("scheduled_rent_charge", 1000, "2026-02-01"),
+            ("scheduled_rent_charge", 1000, "2026-03-01"),
+            ("payment_applied", 1000, "2026-01-01"),
+            ("payment_applied", 1000, "2026-03-20"),
+            ("payment_applied", 400, "2026-03-25"),
+        ]
+        report = reports.payment_history({"entries": entries, "as_of": "2026-04-01"})
+        self.assertEqual(report["charges"], 3)
+        self.assertEqual(report["on_time"], 1)
+        self.assertEqual(report["late_31_60"], 1)
+        self.assertEqual(report["unpaid"], 1)
+        self.assertEqual(report["overdue"], 1)
+        self.assertEqual(report["outstanding_cents"], 600)
+        self.assertEqual(report["months_reported"], 3)
+        self.assertEqual(report["on_time_ratio"], 0.5)
+
+    def test_reversal_reopens_credit(self) -> None:
+        entries = [
+            ("scheduled_rent_charge", 1000, "2026-01-01"),
+            ("payment_applied", 500, "2026-01-01"),
+            ("payment_reversal", 500, "2026-01-02"),
+        ]
+        report = reports.payment_history({"entries": entries, "as_of": "2026-01-10"})
+        self.assertEqual(report["outstanding_cents"], 500)
+        self.assertIsNone(report["on_time_ratio"])
+
+
+class JobRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(data={
+            "ledger_entries": {
+                "e1": {"landlord_id": "landlord-1", "lease_id": "lease-1", "type": "scheduled_rent_charge",
+                       "amount_cents": 150000, "due_date": "2026-01-01"},
+                "e2": {"landlord_id": "landlord-1", "lease_id": "lease-1", "type": "payment_applied",
+                       "amount_cents": 150000, "effective_date": "2026-01-03"},
+            }
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    def test_credit_report_job_round_trip(self) -> None:
+        with TestClient(main.create_app()) as http:
+            response = http.post(
+                "/landlords/landlord-1/jobs",
+                json={"kind": "credit_report", "params": {"lease_id": "lease-1", "as_of": "2026-02-01"}},
+            )
+            self.assertEqual(response.status_code, 202)
+            location = response.headers["location"]
+            job_id = response.json()["id"]
+
+            lines = http.get(f"{location}/stream").text.splitlines()
+            self.assertEqual(lines[-1].count('"succeeded"'), 1)
+
+            job = http.get(location).json()
+            self.assertEqual(job["status"], "succeeded")
+            self.assertEqual(job["result"]["late_1_30"], 1)
+            self.assertEqual(http.get(f"/landlords/landlord-2/jobs/{job_id}").status_code, 404)
+            self.assertEqual(http.delete(location).status_code, 409)
+
+    def test_unknown_kind_and_priority_bounds(self) -> None:
+        with TestClient(main.create_app()) as http:
+            self.assertEqual(http.post("/landlords/l1/jobs", json={"kind": "nope"}).status_code, 400)
+            # scheduler-only kinds are not enqueued from outside
+            response = http.post("/landlords/l1/jobs", json={"kind": "lease_notice", "params": {"lease_id": "x"}})
+            self.assertEqual(response.status_code, 400)
+            response = http.post("/landlords/l1/jobs", json={"kind": "credit_report", "priority": 99})
+            self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import kpis
+import main
+import metrics
+import property_routes
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+def seed() -> dict:
+    def charge(lease_id: str, amount: int, due: str) -> dict:
+        return {"landlord_id": "l1", "lease_id": lease_id, "type": "scheduled_rent_charge",
+                "amount_cents": amount, "due_date": due}
+
+    def payment(lease_id: str, amount: int, paid: str) -> dict:
+        return {"landlord_id": "l1", "lease_id": lease_id, "type": "payment_applied",
+                "amount_cents": amount, "effective_date": paid}
+
+    return {
+        "properties": {
+            "p1": {"rc_prop_id": "p1", "landlord_id": "l1"},
+            "p2": {"rc_prop_id": "p2", "landlord_id": "l1"},
+            "p3": {"rc_prop_id": "p3", "landlord_id": "l2"},
+        },
+        "units": {
+            "u1": {"unit_id": "u1", "rc_prop_id": "p1"},
+            "u2": {"unit_id": "u2", "rc_prop_id": "p1"},
+            "u3": {"unit_id": "u3", "rc_prop_id": "p2"},
+            "u4": {"unit_id": "u4", "rc_prop_id": "p2"},
+            "u9": {"unit_id": "u9", "rc_prop_id": "p3"},
+        },
+        "leases": {
+            "a": {"lease_id": "a", "rc_prop_id": "p1", "status": "active"},
+            "b": {"lease_id": "b", "rc_prop_id": "p2", "status": "Active"},
+            "c": {"lease_id": "c", "rc_prop_id": "p2", "status": "ended"},
+            "z": {"lease_id": "z", "rc_prop_id": "p3", "status": "active"},
+        },
+        "applications": {
+            "app1": {"application_id": "app1", "rc_prop_id": "p1", "status": "submitted"},
+            "app2": {"application_id": "app2", "rc_prop_id": "p2", "status": "approved"},
+        },
+        "ledger_entries": {
+            "e1": charge("a", 100_000, "2026-02-01"),
+            "e2": charge("a", 100_000, "2026-03-01"),
+            "e3": payment("a", 100_000, "2026-02-03"),
+            "e4": charge("b", 150_000, "2026-03-01"),
+            "e5": payment("b", 200_000, "2026-03-02"),
+        },
+    }
+
+
+class KpiRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(data=seed())
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.clock = FakeClock(dt.datetime(2026, 3, 15, tzinfo=dt.timezone.utc))
+        self.addCleanup(setattr, kpis, "snapshots", kpis.snapshots)
+        kpis.snapshots = kpis.KpiSnapshots(clock=self.clock, registry=metrics.MetricsRegistry())
+        self.http = TestClient(main.create_app())
+
+    def test_first_read_recomputes_then_reads_one_document(self) -> None:
+        first = self.http.get("/landlords/l1/kpis").json()
+        self.assertEqual(first["period"], "2026-03")
+        self.assertEqual((first["units_total"], first["leases_active"], first["occupancy"]), (4, 2, 0.5))
+        self.assertEqual(first["open_applications"], 1)
+        self.assertEqual(first["rent_collected_cents"], 200_000)
+        self.assertEqual((first["arrears_cents"], first["leases_in_arrears"]), (100_000, 1))
+        self.assertNotIn("lease_balances", first)
+
+        calls = dict(self.client.calls)
+        self.assertEqual(self.http.get("/landlords/l1/kpis").json()["arrears_cents"], 100_000)
+        self.assertEqual(self.client.calls["query"], calls["query"])
+        self.assertEqual(self.client.calls["get"], calls["get"] + 1)
+
+    def test_writes_apply_deltas_that_match_a_recompute(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        self.http.patch("/leases/c", json={"status": "active"})
+        self.http.patch("/leases/a", json={"status": "ended"})
+        self.http.patch("/applications/app2", json={"status": "in_review"})
+        response = self.http.post(
+            "/landlords/l1/ledger/entries",
+            json={"lease_id": "a", "type": "payment_applied", "amount_cents": 60_000, "effective_date": "2026-03-10"},
+        )
+        self.assertEqual(response.status_code, 201)
+
+        calls = self.client.calls["query"]
+        snapshot = self.http.get("/landlords/l1/kpis").json()
+        self.assertEqual(self.client.calls["query"], calls)
+        self.assertEqual(snapshot["leases_active"], 2)
+        self.assertEqual(snapshot["open_applications"], 2)
+        self.assertEqual(snapshot["rent_collected_cents"], 260_000)
+        self.assertEqual(snapshot["arrears_cents"], 40_000)
+
+        check = self.http.get("/landlords/l1/kpis/check").json()
+        self.assertTrue(check["consistent"], check["drift"])
+
+    def test_ledger_entry_validation(self) -> None:
+        bad = [
+            {"lease_id": "a", "type": "bribe", "amount_cents": 1},
+            {"type": "payment_applied", "amount_cents": 1},
+            {"lease_id": "a", "type": "payment_applied", "amount_cents": "10.00"},
+        ]
+        for body in bad:
+            with self.subTest(body=body):
+                self.assertEqual(self.http.post("/landlords/l1/ledger/entries", json=body).status_code, 400)
+
+    def test_check_reports_drift_from_writes_made_elsewhere(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        self.client.data["ledger_entries"]["node-1"] = {
+            "landlord_id": "l1", "lease_id": "b", "type": "nsf_fee", "amount_cents": 80_000, "due_date": "2026-03-05",
+        }
+        check = self.http.get("/landlords/l1/kpis/check").json()
+        self.assertFalse(check["consistent"])
+        self.assertEqual(check["drift"]["arrears_cents"], {"snapshot": 100_000, "recomputed": 130_000})
+        self.assertEqual(check["drift"]["leases_in_arrears"], {"snapshot": 1, "recomputed": 2})
+        # checking never writes
+        self.assertEqual(self.http.get("/landlords/l1/kpis").json()["arrears_cents"], 100_000)
+
+    def test_balances_live_in_shards_outside_the_snapshot(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        self.assertNotIn("lease_balances", self.client.data["landlord_kpis"]["l1"])
+        shards = self.client.data[kpis.balance_collection("l1")]
+        # empty shards are not written
+        self.assertEqual(set(shards), {kpis.shard_of("a"), kpis.shard_of("b")})
+        self.assertEqual(shards[kpis.shard_of("a")]["balances"]["a"], 100_000)
+
+        # a shard no delta touches is never rewritten, so the marker survives
+        untouched = kpis.shard_of("b")
+        shards[untouched]["marker"] = True
+        sets = self.client.calls["set"]
+        self.http.post(
+            "/landlords/l1/ledger/entries",
+            json={"lease_id": "a", "type": "payment_applied", "amount_cents": 60_000, "effective_date": "2026-03-10"},
+        )
+        self.assertEqual(shards[kpis.shard_of("a")]["balances"]["a"], 40_000)
+        self.assertTrue(shards[untouched]["marker"])
+        # the entry and the totals; the shard goes in a batch
+        self.assertEqual(self.client.calls["set"], sets + 2)
+
+    def test_check_compares_balances_shard_by_shard(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        shard = self.client.data[kpis.balance_collection("l1")][kpis.shard_of("b")]
+        shard["balances"]["b"] = 0
+        check = self.http.get("/landlords/l1/kpis/check").json()
+        self.assertFalse(check["consistent"])
+        self.assertEqual(check["drift"]["lease_balances"]["shards"], [kpis.shard_of("b")])
+
+    def test_snapshot_without_shards_is_recomputed(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        legacy = self.client.data["landlord_kpis"]["l1"]
+        del legacy["balance_shards"]
+        legacy["lease_balances"] = {"a": 100_000, "b": -50_000}
+        self.assertEqual(self.http.get("/landlords/l1/kpis").json()["arrears_cents"], 100_000)
+        self.assertNotIn("lease_balances", self.client.data["landlord_kpis"]["l1"])
+        self.assertEqual(self.client.data["landlord_kpis"]["l1"]["balance_shards"], kpis.BALANCE_SHARDS)
+
+    def test_unknown_landlord_is_not_materialized(self) -> None:
+        sets, commits = self.client.calls["set"], self.client.calls["commit"]
+        snapshot = self.http.get("/landlords/nonexistent-123/kpis").json()
+        self.assertEqual((snapshot["units_total"], snapshot["arrears_cents"]), (0, 0))
+        self.assertEqual((self.client.calls["set"], self.client.calls["commit"]), (sets, commits))
+        self.assertNotIn("nonexistent-123", self.client.data.get("landlord_kpis", {}))
+
+    def test_new_month_recomputes_before_serving(self) -> None:
+        self.http.get("/landlords/l1/kpis")
+        self.clock.now = dt.datetime(2026, 4, 1, tzinfo=dt.timezone.utc)
+        snapshot = self.http.get("/landlords/l1/kpis").json()
+        self.assertEqual(snapshot["period"], "2026-04")
+        self.assertEqual(snapshot["rent_collected_cents"], 0)
+
+
+class KpiSnapshotTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.client = FakeAsyncClient(data=seed())
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.clock = FakeClock(dt.datetime(2026, 3, 15, tzinfo=dt.timezone.utc))
+        self.registry = metrics.MetricsRegistry()
+        self.snapshots = kpis.KpiSnapshots(recompute_seconds=60, clock=self.clock, registry=self.registry)
+
+    async def test_stale_snapshot_is_corrected_in_the_background(self) -> None:
+        await self.snapshots.read("l1")
+        self.client.data["leases"]["c"]["status"] = "active"
+        self.clock.now += dt.timedelta(seconds=61)
+        stale = await self.snapshots.read("l1")
+        self.assertEqual(stale["leases_active"], 2)
+        await self.snapshots._recomputing["l1"]
+        self.assertEqual((await self.snapshots.read("l1"))["leases_active"], 3)
+        self.assertIn('kpi_drift_total{field="leases_active"} 1', self.registry.render())
+
+    async def test_recompute_rewrites_only_changed_shards(self) -> None:
+        await self.snapshots.recompute("l1")
+        commits = self.client.calls["commit"]
+        await self.snapshots.recompute("l1")
+        self.assertEqual(self.client.calls["commit"], commits)
+
+        # a lease paid off clears its shard rather than leaving the old balance behind
+        self.client.data["ledger_entries"]["e6"] = {
+            "landlord_id": "l1", "lease_id": "b", "type": "scheduled_rent_charge",
+            "amount_cents": 50_000, "due_date": "2026-03-15",
+        }
+        await self.snapshots.recompute("l1")
+        self.assertEqual(self.client.calls["commit"], commits + 1)
+        shards = self.client.data[kpis.balance_collection("l1")]
+        self.assertEqual(shards[kpis.shard_of("b")]["balances"], {})
+
+    async def test_concurrent_patches_record_one_transition_once(self) -> None:
+        self.addCleanup(setattr, kpis, "snapshots", kpis.snapshots)
+        kpis.snapshots = self.snapshots
+        await self.snapshots.recompute("l1")
+        self.client.latency = 0.01
+        await asyncio.gather(*(
+            property_routes._patch("leases", "c", "lease", {"status": "active"}, ("lease_id", "rc_prop_id"))
+            for _ in range(2)
+        ))
+        self.assertEqual((await self.snapshots.read("l1"))["leases_active"], 3)
+        self.assertEqual(property_routes._patching, {})
+
+    async def test_concurrent_recomputes_share_one_pass(self) -> None:
+        first, second = await asyncio.gather(self.snapshots.recompute("l1"), self.snapshots.recompute("l1"))
+        self.assertEqual(first, second)
+        self.assertIn('kpi_recomputes_total{reason="scheduled"} 1', self.registry.render())
+
+    async def test_write_during_recompute_triggers_another_pass(self) -> None:
+        await self.snapshots.recompute("l1")
+        compute = self.snapshots.compute
+        passes = []
+
+        async def compute_with_write(landlord_id: str) -> dict:
+            passes.append(landlord_id)
+            if len(passes) == 1:
+                self.client.data["leases"]["c"]["status"] = "active"
+                await self.snapshots.record("leases", {**self.client.data["leases"]["c"], "status": "ended"},
+                                            self.client.data["leases"]["c"])
+            return await compute(landlord_id)
+
+        self.snapshots.compute = compute_with_write
+        snapshot = await self.snapshots.recompute("l1")
+        self.assertEqual(len(passes), 2)
+        self.assertEqual(snapshot["leases_active"], 3)
+
+    async def test_deltas_wait_for_a_materialized_snapshot(self) -> None:
+        await self.snapshots.record("ledger_entries", None, {
+            "landlord_id": "l1", "lease_id": "a", "type": "nsf_fee", "amount_cents": 100, "due_date": "2026-03-01",
+        })
+        self.assertNotIn("landlord_kpis", self.client.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import jobs
+import lease_scheduler
+import main
+import metrics
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+class FakeRunner:
+    def __init__(self) -> None:
+        self.jobs: list[dict] = []
+
+    async def enqueue(
+        self, kind: str, landlord_id: str, params: dict | None = None, priority: int = 0, job_id: str | None = None
+    ) -> dict:
+        for job in self.jobs:
+            if job_id is not None and job["id"] == job_id:
+                return job
+        job = {"id": job_id or f"job-{len(self.jobs)}", "kind": kind, "landlord_id": landlord_id, "params": params}
+        self.jobs.append(job)
+        return job
+
+
+def lease(lease_id: str, end: str, status: str = "active", **fields) -> dict:
+    return {"lease_id": lease_id, "rc_prop_id": "p1", "tenant_id": "t1", "status": status, "end_date": end, **fields}
+
+
+class SchedulerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock(dt.datetime(2026, 3, 15, tzinfo=dt.timezone.utc))
+        self.client = FakeAsyncClient({
+            "properties": {"p1": {"rc_prop_id": "p1", "landlord_id": "landlord-1"}},
+            "leases": {
+                "soon": lease("soon", "2026-05-14"),  # notice due 60 days before: today
+                "summer": lease("summer", "2026-07-01"),  # renewal reminder due 2026-03-03
+                "custom": lease("custom", "2026-07-01", noticeLeadDays=90),
+                "ended": lease("ended", "2026-03-10"),
+                "old": lease("old", "2025-01-31"),
+                "far": lease("far", "2027-12-31"),
+                "closed": lease("closed", "2026-04-30", status="terminated"),
+            },
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.runner = FakeRunner()
+
+    def make_scheduler(self, **options) -> lease_scheduler.LeaseScheduler:
+        options.setdefault("registry", metrics.MetricsRegistry())
+        scheduler = lease_scheduler.LeaseScheduler(clock=self.clock, runner=self.runner, **options)
+        self.addAsyncCleanup(scheduler.stop)
+        return scheduler
+
+    def dispatched(self) -> list[tuple[str, str]]:
+        return sorted((job["params"]["lease_id"], job["kind"]) for job in self.runner.jobs)
+
+
+class LeaseSchedulerTests(SchedulerTestCase):
+    async def test_load_is_one_bounded_query(self) -> None:
+        scheduler = self.make_scheduler()
+        self.assertEqual(await scheduler.load(), 5)  # "old" and "far" are outside the window
+        self.assertEqual(self.client.calls["query"], 1)
+        self.assertEqual(len(scheduler), 10)  # "ended" keeps only its expiry; "closed" has none
+        self.assertEqual(scheduler.loaded_until, dt.date(2026, 9, 11))
+
+    async def test_due_deadlines_are_dispatched_once(self) -> None:
+        scheduler = self.make_scheduler()
+        await scheduler.load()
+        jobs_ = await scheduler.run_due()
+        self.assertEqual(
+            self.dispatched(),
+            [("custom", "lease_renewal"), ("ended", "lease_expiry"), ("soon", "lease_notice"),
+             ("soon", "lease_renewal"), ("summer", "lease_renewal")],
+        )
+        self.assertEqual({job["landlord_id"] for job in jobs_}, {"landlord-1"})
+        stored = self.client.data["leases"]["soon"]
+        self.assertEqual(stored["lease_notice_dispatched_for"], "2026-05-14")
+        events = [event["event_type"] for event in self.client.data["event_log"].values()]
+        self.assertEqual(events.count("lease_renewal_due"), 3)
+
+        # a restart reloads the window and finds the stamps
+        restarted = self.make_scheduler()
+        await restarted.load()
+        self.assertEqual(await restarted.run_due(), [])
+        self.assertEqual(len(self.runner.jobs), 5)
+
+    async def test_a_failed_stamp_does_not_enqueue_twice(self) -> None:
+        scheduler = self.make_scheduler()
+        await scheduler.load()
+        set_document = lease_scheduler.datastore.set_document
+        failures = []
+
+        async def fail_once(*args, **kwargs):
+            if not failures:
+                failures.append(args)
+                raise RuntimeError("write failed")
+            return await set_document(*args, **kwargs)
+
+        with mock.patch.object(lease_scheduler.datastore, "set_document", fail_once):
+            await scheduler.run_due()
+            self.assertEqual(len(self.runner.jobs), 5)
+            self.clock.now += dt.timedelta(seconds=lease_scheduler.RETRY_SECONDS)
+            await scheduler.run_due()
+        self.assertEqual(len(self.runner.jobs), 5)
+        lease_id = failures[0][1]
+        self.assertTrue(any(key.endswith("_dispatched_for") for key in self.client.data["leases"][lease_id]))
+
+    async def test_wakes_only_at_the_next_due_time(self) -> None:
+        scheduler = self.make_scheduler(refresh_seconds=30 * 86400)
+        await scheduler.load()
+        await scheduler.run_due()
+        # the next deadline is the 90-day notice on "custom", due 2026-04-02
+        self.assertEqual(scheduler.next_due(), dt.datetime(2026, 4, 2, tzinfo=dt.timezone.utc).timestamp())
+        self.clock.now = dt.datetime(2026, 4, 1, 23, tzinfo=dt.timezone.utc)
+        self.assertEqual(await scheduler.run_due(), [])
+        self.clock.now += dt.timedelta(hours=1)
+        self.assertEqual([job["kind"] for job in await scheduler.run_due()], ["lease_notice"])
+
+    async def test_tracked_writes_reschedule_and_stale_entries_are_skipped(self) -> None:
+        scheduler = self.make_scheduler(refresh_seconds=365 * 86400)
+        await scheduler.load()
+        await scheduler.run_due()
+        # renewed: the new end date is past the loaded window, left to the next load
+        renewed = lease("summer", "2027-07-31")
+        self.client.data["leases"]["summer"] = renewed
+        scheduler.track(renewed)
+        self.clock.now = dt.datetime(2026, 8, 1, tzinfo=dt.timezone.utc)
+        await scheduler.run_due()
+        self.assertIn(("custom", "lease_expiry"), self.dispatched())
+        self.assertNotIn(("summer", "lease_expiry"), self.dispatched())
+
+    async def test_the_stored_lease_decides_at_dispatch(self) -> None:
+        scheduler = self.make_scheduler()
+        await scheduler.load()
+        # ended early elsewhere (the Node API) after the load
+        self.client.data["leases"]["soon"]["status"] = "terminated"
+        await scheduler.run_due()
+        self.assertNotIn("soon", {lease_id for lease_id, _ in self.dispatched()})
+
+    async def test_truncated_load_is_retried_soon(self) -> None:
+        scheduler = self.make_scheduler(max_leases=3)
+        await scheduler.load()
+        self.assertEqual(scheduler.loaded_until, dt.date(2026, 5, 14))
+        scheduler.track(lease("summer", "2026-07-01", rent=1))  # past the loaded window
+        self.assertNotIn("summer", scheduler._entries)
+        await scheduler.run_due()
+        self.assertEqual(self.dispatched(), [("ended", "lease_expiry"), ("soon", "lease_notice"),
+                                             ("soon", "lease_renewal")])
+        # unread leases may already be due: the reload is not left for a day
+        self.assertEqual(scheduler.next_due(), self.clock.now.timestamp() + lease_scheduler.RETRY_SECONDS)
+
+    async def test_an_earlier_deadline_wakes_the_loop(self) -> None:
+        scheduler = self.make_scheduler()
+        del self.client.data["leases"]["soon"], self.client.data["leases"]["custom"]
+        del self.client.data["leases"]["ended"], self.client.data["leases"]["summer"]
+        await scheduler.start()
+        self.assertGreater(scheduler.next_due(), self.clock.now.timestamp())
+        new = lease("new", "2026-04-01")
+        self.client.data["leases"]["new"] = new
+        scheduler.track(new)
+        for _ in range(200):
+            if self.runner.jobs:
+                break
+            await asyncio.sleep(0.005)
+        self.assertEqual(self.dispatched(), [("new", "lease_notice"), ("new", "lease_renewal")])
+
+    async def test_lease_deadline_job(self) -> None:
+        runner = jobs.JobRunner(lambda: jobs.JobStore(":memory:"), registry=metrics.MetricsRegistry())
+        self.addAsyncCleanup(runner.stop)
+        await runner.start()
+        job = await runner.enqueue("lease_notice", "landlord-1", {"lease_id": "soon", "end_date": "2026-05-14"})
+        for _ in range(400):
+            stored = await runner.get(job["id"])
+            if stored["status"] in jobs.TERMINAL:
+                break
+            await asyncio.sleep(0.005)
+        self.assertEqual(stored["status"], jobs.SUCCEEDED)
+        self.assertEqual(stored["result"]["action"], "serve_notice")
+        self.assertEqual(stored["result"]["tenant_id"], "t1")
+
+        # a lease is only described to its own landlord
+        job = await runner.enqueue("lease_notice", "landlord-2", {"lease_id": "soon", "end_date": "2026-05-14"})
+        for _ in range(400):
+            stored = await runner.get(job["id"])
+            if stored["status"] in jobs.TERMINAL:
+                break
+            await asyncio.sleep(0.005)
+        self.assertEqual(stored["status"], jobs.FAILED)
+        self.assertIsNone(stored["result"])
+
+
+class LeasePatchTests(SchedulerTestCase):
+    def test_lease_patch_reschedules(self) -> None:
+        self.addCleanup(setattr, lease_scheduler, "scheduler", lease_scheduler.scheduler)
+        scheduler = lease_scheduler.scheduler = self.make_scheduler()
+        asyncio.run(scheduler.load())
+        http = TestClient(main.create_app())
+        response = http.patch("/leases/summer", json={"end_date": "2026-05-20"})
+        self.assertEqual(response.status_code, 200)
+        due = {entry[3]: entry[0] for entry in scheduler._entries["summer"]}
+        self.assertEqual(due["lease_expiry"], dt.datetime(2026, 5, 20, tzinfo=dt.timezone.utc).timestamp())
+
+
+if __name__ == "__main__":
+    unittest.main()
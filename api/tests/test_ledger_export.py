@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import unittest
+
+from fastapi.testclient import TestClient
+
+import firestore_client
+import ledger_export
+import main
+import responses
+from fake_firestore import FakeAsyncClient
+
+
+def ledger_data(count: int, landlord_id: str = "landlord-1") -> dict:
+    start = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+    entries = {}
+    for index in range(count):
+        # pairs of entries share a timestamp so ordering relies on the ID tiebreak
+        created_at = start + dt.timedelta(minutes=index // 2)
+        entries[f"entry-{index:05d}"] = {
+            "landlord_id": landlord_id,
+            "created_at": created_at,
+            "amount_cents": 100 * index,
+        }
+    entries["other-landlord"] = {"landlord_id": "landlord-2", "created_at": start, "amount_cents": 1}
+    return {ledger_export.LEDGER_COLLECTION: entries}
+
+
+class CursorTests(unittest.TestCase):
+    def test_round_trip_keeps_datetime_and_id(self) -> None:
+        created_at = dt.datetime(2026, 3, 1, 12, 30, tzinfo=dt.timezone.utc)
+        cursor = ledger_export.encode_cursor({"id": "e1", "created_at": created_at})
+        self.assertEqual(ledger_export.decode_cursor(cursor), (created_at, "e1"))
+
+    def test_garbage_is_rejected(self) -> None:
+        for cursor in ("not-base64!!", "e30", "W10"):
+            with self.assertRaises(ledger_export.InvalidCursor):
+                ledger_export.decode_cursor(cursor)
+
+
+class LedgerExportRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient(ledger_data(25))
+        firestore_client.set_client_factory(lambda: self.client)
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.http = TestClient(main.app)
+
+    def export(self, **params) -> list[dict]:
+        response = self.http.get("/landlords/landlord-1/ledger/export", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], ledger_export.NDJSON_MEDIA_TYPE)
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_streams_every_entry_in_order_across_pages(self) -> None:
+        lines = self.export(page_size=10)
+        ids = [line["entry"]["id"] for line in lines]
+        self.assertEqual(ids, [f"entry-{index:05d}" for index in range(25)])
+        self.assertEqual(self.client.calls["query"], 3)
+        self.assertEqual(self.client.calls["documents_read"], 25)
+
+    def test_resumes_after_cursor(self) -> None:
+        first = self.export(page_size=10)
+        resumed = self.export(page_size=10, cursor=first[12]["cursor"])
+        self.assertEqual(
+            [line["entry"]["id"] for line in resumed],
+            [f"entry-{index:05d}" for index in range(13, 25)],
+        )
+
+    @unittest.skipIf(responses.msgpack is None, "msgpack not installed")
+    def test_msgpack_stream_matches_ndjson(self) -> None:
+        lines = self.export(page_size=10)
+        response = self.http.get(
+            "/landlords/landlord-1/ledger/export", params={"page_size": 10},
+            headers={"Accept": "application/msgpack"},
+        )
+        self.assertEqual(response.headers["content-type"], responses.MSGPACK_MEDIA_TYPE)
+        self.assertIn("Accept", response.headers["vary"].split(", "))
+        unpacker = responses.msgpack.Unpacker()
+        unpacker.feed(response.content)
+        self.assertEqual(list(unpacker), lines)
+
+    def test_invalid_cursor_is_400(self) -> None:
+        response = self.http.get("/landlords/landlord-1/ledger/export", params={"cursor": "bogus"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_size_is_bounded(self) -> None:
+        response = self.http.get(
+            "/landlords/landlord-1/ledger/export",
+            params={"page_size": ledger_export.MAX_PAGE_SIZE + 1},
+        )
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
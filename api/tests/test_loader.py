@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import datastore
+import firestore_client
+import loader
+import main
+from fake_firestore import FakeAsyncClient
+
+
+class RecordingBatch:
+    def __init__(self, documents: dict[str, dict]) -> None:
+        self.documents = documents
+        self.batches: list[list[str]] = []
+
+    async def __call__(self, collection: str, keys: list[str]) -> dict[str, dict]:
+        self.batches.append(list(keys))
+        await asyncio.sleep(0)
+        return {key: self.documents[key] for key in keys if key in self.documents}
+
+
+class DocumentLoaderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_keys_from_one_tick_share_a_batch_and_are_deduplicated(self) -> None:
+        batch = RecordingBatch({"a": {"id": "a"}, "b": {"id": "b"}})
+        units = loader.DocumentLoader("units", batch)
+        results = await asyncio.gather(units.load("a"), units.load("b"), units.load("a"), units.load("x"))
+        self.assertEqual(results, [{"id": "a"}, {"id": "b"}, {"id": "a"}, None])
+        self.assertEqual(batch.batches, [["a", "b", "x"]])
+
+        self.assertEqual(await units.load("a"), {"id": "a"})
+        self.assertEqual(len(batch.batches), 1)
+
+    async def test_batches_are_split_at_max_size(self) -> None:
+        batch = RecordingBatch({})
+        units = loader.DocumentLoader("units", batch, max_batch_size=2)
+        await units.load_many(["a", "b", "c"])
+        self.assertEqual(batch.batches, [["a", "b"], ["c"]])
+
+    async def test_primed_keys_are_not_fetched(self) -> None:
+        batch = RecordingBatch({})
+        units = loader.DocumentLoader("units", batch)
+        units.prime("a", {"id": "a"})
+        self.assertEqual(await units.load("a"), {"id": "a"})
+        self.assertEqual(batch.batches, [])
+
+    async def test_failures_reject_the_batch_and_allow_retry(self) -> None:
+        attempts = 0
+
+        async def flaky(collection: str, keys: list[str]) -> dict:
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise ConnectionError("reset")
+            return {key: {"id": key} for key in keys}
+
+        units = loader.DocumentLoader("units", flaky)
+        results = await asyncio.gather(units.load("a"), units.load("b"), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(await units.load("a"), {"id": "a"})
+
+
+class GetDocumentsTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({"units": {"u1": {"rent_amount": 1}, "u2": {"rent_amount": 2}}})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    async def test_uses_cache_and_one_get_all_for_misses(self) -> None:
+        await datastore.get_document("units", "u1")
+        documents = await datastore.get_documents("units", ["u1", "u2", "u2", "missing"])
+        self.assertEqual(sorted(documents), ["u1", "u2"])
+        self.assertEqual(self.client.calls["get_all"], 1)
+        self.assertEqual(self.client.calls["documents_read"], 2)
+
+        await datastore.get_documents("units", ["u2", "missing"])
+        self.assertEqual(self.client.calls["get_all"], 1)
+
+
+class PropertyOverviewTests(unittest.TestCase):
+    def setUp(self) -> None:
+        units = {f"unit-{i}": {"unit_id": f"unit-{i}", "rc_prop_id": "prop-1"} for i in range(50)}
+        leases = {
+            f"lease-{i}": {
+                "lease_id": f"lease-{i}",
+                "rc_prop_id": "prop-1",
+                "unit_id": f"unit-{i}",
+                "tenant_id": f"tenant-{i % 40}",
+            }
+            for i in range(50)
+        }
+        tenants = {f"tenant-{i}": {"display_name": f"Tenant {i}"} for i in range(40)}
+        self.client = FakeAsyncClient({
+            "properties": {"prop-1": {"rc_prop_id": "prop-1"}},
+            "units": units,
+            "leases": leases,
+            "tenants": tenants,
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    def test_overview_batches_child_reads(self) -> None:
+        with TestClient(main.app) as http:
+            response = http.get("/properties/prop-1/overview")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body["units"]), 50)
+        self.assertEqual(len(body["leases"]), 50)
+        lease = next(lease for lease in body["leases"] if lease["id"] == "lease-45")
+        self.assertEqual(lease["unit"]["unit_id"], "unit-45")
+        self.assertEqual(lease["tenant"]["display_name"], "Tenant 5")
+        # units come from the query; 40 distinct tenants come from one get_all
+        self.assertEqual(self.client.calls["get_all"], 1)
+        self.assertEqual(self.client.calls["get"], 1)
+
+    def test_unknown_property_is_404(self) -> None:
+        with TestClient(main.app) as http:
+            self.assertEqual(http.get("/properties/nope/overview").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
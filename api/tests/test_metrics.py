@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+
+
+class RegistryTests(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self) -> None:
+        registry = metrics.MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, ("/a",))
+        text = registry.render()
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{route="/a"} 4', text)
+        self.assertIn("# TYPE latency_seconds histogram", text)
+
+    def test_label_values_are_escaped(self) -> None:
+        registry = metrics.MetricsRegistry()
+        registry.counter("things_total", "Things.", ("name",)).inc(('a"b\\c',))
+        self.assertIn('things_total{name="a\\"b\\\\c"} 1', registry.render())
+
+    def test_collectors_are_evaluated_at_scrape_time(self) -> None:
+        registry = metrics.MetricsRegistry()
+        state = {"depth": 3}
+        registry.register_collector("queue_depth", "Depth.", "gauge", lambda: [({}, state["depth"])])
+        self.assertIn("queue_depth 3", registry.render())
+        state["depth"] = 7
+        self.assertIn("queue_depth 7", registry.render())
+
+    def test_reregistering_returns_existing_metric(self) -> None:
+        registry = metrics.MetricsRegistry()
+        first = registry.counter("hits_total", "Hits.")
+        self.assertIs(registry.counter("hits_total", "Hits."), first)
+        with self.assertRaises(ValueError):
+            registry.gauge("hits_total", "Hits.")
+
+
+class MiddlewareTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = metrics.MetricsRegistry()
+        app = FastAPI()
+        app.add_middleware(metrics.MetricsMiddleware, registry=self.registry)
+
+        @app.get("/landlords/{landlord_id}")
+        def landlord(landlord_id: str):
+            return {"id": landlord_id}
+
+        @app.get("/boom")
+        def boom():
+            raise RuntimeError("boom")
+
+        self.http = TestClient(app, raise_server_exceptions=False)
+
+    def test_requests_are_labelled_by_route_template(self) -> None:
+        self.http.get("/landlords/a")
+        self.http.get("/landlords/b")
+        self.http.get("/nowhere")
+        requests = self.registry.get("http_requests_total").values
+        self.assertEqual(requests[("GET", "/landlords/{landlord_id}", "200")], 2)
+        self.assertEqual(requests[("GET", metrics.UNMATCHED_ROUTE, "404")], 1)
+        latency = self.registry.get("http_request_duration_seconds").series
+        self.assertEqual(latency[("GET", "/landlords/{landlord_id}")][-1], 2)
+        self.assertEqual(self.registry.get("http_requests_in_flight").values[("GET",)], 0)
+
+    def test_unhandled_errors_count_as_500(self) -> None:
+        self.http.get("/boom")
+        requests = self.registry.get("http_requests_total").values
+        self.assertEqual(requests[("GET", "/boom", "500")], 1)
+
+
+class MetricsRouteTests(unittest.TestCase):
+    def test_metrics_endpoint_exposes_prometheus_text(self) -> None:
+        with TestClient(main.app) as http:
+            http.get("/health")
+            response = http.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"}', response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+import profiler
+
+
+def spin(seconds: float) -> int:
+    deadline = time.perf_counter() + seconds
+    turns = 0
+    while time.perf_counter() < deadline:
+        turns += 1
+    return turns
+
+
+def make_app(**options) -> tuple[FastAPI, profiler.ProfileBuffer]:
+    profiles = profiler.ProfileBuffer(size=3)
+    app = FastAPI()
+    app.add_middleware(
+        profiler.ProfilerMiddleware,
+        profiles=profiles,
+        sampler=profiler.Sampler(interval=0.001),
+        registry=metrics.MetricsRegistry(),
+        **options,
+    )
+
+    @app.get("/busy")
+    async def busy():
+        return {"turns": spin(0.05)}
+
+    @app.get("/waiting")
+    async def waiting():
+        await asyncio.sleep(0.05)
+        return {}
+
+    return app, profiles
+
+
+class ProfilerMiddlewareTests(unittest.TestCase):
+    def test_unprofiled_requests_are_left_alone(self) -> None:
+        app, profiles = make_app(token="secret", sample_rate=0)
+        http = TestClient(app)
+        response = http.get("/busy", headers={"X-Debug-Profile": "wrong"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("x-profile-id", response.headers)
+        self.assertEqual(len(profiles), 0)
+
+    def test_debug_header_profiles_cpu_time(self) -> None:
+        app, profiles = make_app(token="secret")
+        response = TestClient(app).get("/busy", headers={"X-Debug-Profile": "secret"})
+        profile = profiles.get(int(response.headers["x-profile-id"]))
+        self.assertEqual((profile.reason, profile.status, profile.route), ("header", 200, "/busy"))
+        self.assertGreater(profile.samples, 5)
+        heaviest = profile.collapsed().splitlines()[0]
+        self.assertTrue(heaviest.startswith("ProfilerMiddleware.__call__"), heaviest)
+        self.assertIn("spin (tests/test_profiler.py", heaviest)
+
+    def test_suspended_requests_are_sampled_where_they_wait(self) -> None:
+        app, profiles = make_app(sample_rate=1.0)
+        response = TestClient(app).get("/waiting")
+        profile = profiles.get(int(response.headers["x-profile-id"]))
+        self.assertEqual(profile.reason, "sampled")
+        self.assertIn("waiting (tests/test_profiler.py", profile.collapsed())
+        self.assertIn("sleep (asyncio/tasks.py", profile.collapsed())
+        self.assertIn("[await Future", profile.collapsed())
+
+    def test_sample_rate_and_ring_buffer_bound(self) -> None:
+        draws = iter([0.9, 0.1, 0.1, 0.1, 0.1])
+        app, profiles = make_app(sample_rate=0.5, rng=lambda: next(draws))
+        http = TestClient(app)
+        ids = [http.get("/waiting").headers.get("x-profile-id") for _ in range(5)]
+        self.assertIsNone(ids[0])
+        self.assertEqual(len(profiles), 3)
+        self.assertEqual([summary["id"] for summary in profiles.summaries()], [4, 3, 2])
+        self.assertIsNone(profiles.get(1))
+
+
+class ProfileRouteTests(unittest.TestCase):
+    def test_admin_routes_need_the_token(self) -> None:
+        with mock.patch.object(profiler, "DEBUG_TOKEN", ""):
+            self.assertEqual(TestClient(main.create_app()).get("/admin/profiles").status_code, 404)
+        with mock.patch.object(profiler, "DEBUG_TOKEN", "secret"):
+            http = TestClient(main.create_app())
+            self.assertEqual(http.get("/admin/profiles", headers={"X-Debug-Token": "nope"}).status_code, 403)
+
+            response = http.get("/health", headers={"X-Debug-Profile": "secret"})
+            profile_id = response.headers["x-profile-id"]
+            admin = {"X-Debug-Token": "secret"}
+            listed = http.get("/admin/profiles", headers=admin).json()["profiles"]
+            self.assertIn(int(profile_id), [summary["id"] for summary in listed])
+            download = http.get(f"/admin/profiles/{profile_id}", headers=admin)
+            self.assertEqual(download.status_code, 200)
+            self.assertIn("attachment", download.headers["content-disposition"])
+            self.assertEqual(http.get("/admin/profiles/999999", headers=admin).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import cache
+import datastore
+import firestore_client
+import main
+import projection
+from fake_firestore import FakeAsyncClient
+
+
+class ProjectionTests(unittest.TestCase):
+    def test_parse_validates_and_collapses_covered_paths(self) -> None:
+        self.assertIsNone(projection.parse(None))
+        self.assertIsNone(projection.parse(" "))
+        self.assertEqual(projection.parse("rent, unit.unit_id,unit,rent,"), ("rent", "unit"))
+        for raw in ("a..b", "1st", "a b", ",".join(f"f{i}" for i in range(51))):
+            with self.subTest(raw=raw):
+                with self.assertRaises(projection.InvalidFields):
+                    projection.parse(raw)
+
+    def test_project_prunes_nested_values_and_lists(self) -> None:
+        overview = {
+            "property": {"id": "p1", "address": "1 Main St", "photos": ["a.jpg"]},
+            "units": [{"id": "u1", "rent": 1, "notes": "x"}, {"id": "u2", "rent": 2}],
+        }
+        self.assertEqual(
+            projection.project(overview, ("property.address", "units.rent")),
+            {
+                "property": {"id": "p1", "address": "1 Main St"},
+                "units": [{"id": "u1", "rent": 1}, {"id": "u2", "rent": 2}],
+            },
+        )
+        self.assertIs(projection.project(overview, None), overview)
+
+    def test_subfields(self) -> None:
+        fields = ("units.rent", "units.unit_id", "property")
+        self.assertEqual(projection.subfields(fields, "units"), ("rent", "unit_id"))
+        self.assertIsNone(projection.subfields(fields, "property"))
+        self.assertEqual(projection.subfields(fields, "leases"), ())
+        self.assertIsNone(projection.subfields(None, "leases"))
+
+
+class SparseRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {"prop-1": {"rc_prop_id": "prop-1", "address": "1 Main St", "notes": "n" * 500}},
+            "units": {
+                f"u{i}": {"unit_id": f"u{i}", "rc_prop_id": "prop-1", "rent": 1000 + i, "photos": ["x"] * 20}
+                for i in range(3)
+            },
+            "leases": {
+                "l1": {"lease_id": "l1", "rc_prop_id": "prop-1", "unit_id": "u1", "tenant_id": "t1", "terms": "long"},
+            },
+            "tenants": {"t1": {"display_name": "Tenant 1", "email": "t1@example.com"}},
+            "ledger_entries": {
+                f"e{i}": {"landlord_id": "l1", "created_at": i, "amount_cents": i * 100, "memo": "m" * 100}
+                for i in range(5)
+            },
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.http = TestClient(main.create_app())
+        self.selects: list = []
+        query_page = datastore.query_page
+
+        async def recording_query_page(collection, **options):
+            self.selects.append((collection, options.get("select")))
+            return await query_page(collection, **options)
+
+        patcher = mock.patch.object(datastore, "query_page", recording_query_page)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_document_projection_has_its_own_etag(self) -> None:
+        full = self.http.get("/properties/prop-1")
+        sparse = self.http.get("/properties/prop-1", params={"fields": "address"})
+        self.assertEqual(sparse.json(), {"id": "prop-1", "address": "1 Main St"})
+        self.assertNotEqual(sparse.headers["etag"], full.headers["etag"])
+        again = self.http.get(
+            "/properties/prop-1", params={"fields": "address"}, headers={"If-None-Match": sparse.headers["etag"]}
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.http.get("/properties/prop-1", params={"fields": "a..b"}).status_code, 400)
+
+    def test_overview_pushes_projection_down_and_skips_unwanted_sections(self) -> None:
+        response = self.http.get("/properties/prop-1/overview", params={"fields": "units.rent"})
+        self.assertEqual(set(response.json()), {"units"})
+        self.assertEqual(response.json()["units"][0], {"id": "u0", "rent": 1000})
+        self.assertEqual(self.selects, [("units", ["rent"])])
+
+    def test_overview_embeds_only_requested_children(self) -> None:
+        fields = "leases.terms,leases.tenant.display_name"
+        body = self.http.get("/properties/prop-1/overview", params={"fields": fields}).json()
+        tenant = {"id": "t1", "display_name": "Tenant 1"}
+        self.assertEqual(body, {"leases": [{"id": "l1", "terms": "long", "tenant": tenant}]})
+        self.assertEqual(self.selects, [("leases", ["terms", "tenant_id"])])
+        self.assertEqual(self.client.calls["get_all"], 1)
+
+        full = self.http.get("/properties/prop-1/overview").json()
+        self.assertEqual(full["leases"][0]["unit"]["rent"], 1001)
+
+    def test_ledger_export_selects_fields_and_keeps_cursors(self) -> None:
+        response = self.http.get("/landlords/l1/ledger/export", params={"fields": "amount_cents", "page_size": 2})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        entries = [line["entry"] for line in lines[:2]]
+        self.assertEqual(entries, [{"id": "e0", "amount_cents": 0}, {"id": "e1", "amount_cents": 100}])
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(all(select == ["amount_cents", "created_at"] for _, select in self.selects))
+
+        resumed = self.http.get(
+            "/landlords/l1/ledger/export", params={"fields": "amount_cents", "cursor": lines[1]["cursor"]}
+        )
+        self.assertEqual(json.loads(resumed.text.splitlines()[0])["entry"]["id"], "e2")
+
+
+if __name__ == "__main__":
+    unittest.main()
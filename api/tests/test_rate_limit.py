@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+import rate_limit
+from fake_clock import FakeClock
+
+
+def scope(headers: dict[str, str] | None = None, client: str = "10.0.0.1") -> dict:
+    return {
+        "type": "http",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+        "client": (client, 1234),
+    }
+
+
+class TokenBucketTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock(1000.0)
+        self.buckets = rate_limit.TokenBuckets(rate=2, burst=3, max_keys=100, clock=self.clock)
+
+    def test_burst_then_refill(self) -> None:
+        self.assertEqual([self.buckets.take("a") for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.buckets.take("a"), 0.5)
+        self.clock.now += 0.5
+        self.assertEqual(self.buckets.take("a"), 0)
+        self.assertGreater(self.buckets.take("a"), 0)
+
+    def test_keys_are_independent(self) -> None:
+        for _ in range(3):
+            self.buckets.take("a")
+        self.assertGreater(self.buckets.take("a"), 0)
+        self.assertEqual(self.buckets.take("b"), 0)
+
+    def test_idle_buckets_are_swept(self) -> None:
+        for index in range(50):
+            self.buckets.take(f"key-{index}")
+        self.clock.now += self.buckets.idle_after
+        for _ in range(50 // rate_limit.SWEEP_PER_REQUEST + 1):
+            self.buckets.take("active")
+        self.assertEqual(len(self.buckets), 1)
+
+    def test_key_count_is_capped(self) -> None:
+        buckets = rate_limit.TokenBuckets(rate=1, burst=1, max_keys=10, clock=self.clock)
+        for index in range(1000):
+            buckets.take(f"key-{index}")
+        self.assertLessEqual(len(buckets), 10)
+
+
+class ClientKeyTests(unittest.TestCase):
+    def test_unauthenticated_headers_do_not_pick_the_bucket(self) -> None:
+        self.assertEqual(rate_limit.client_key(scope({"X-API-Key": "k1", "X-Landlord-Id": "l1"})), "ip:10.0.0.1")
+        self.assertEqual(rate_limit.client_key(scope()), "ip:10.0.0.1")
+
+    def test_only_trusted_forwarded_hop_is_used(self) -> None:
+        forged = scope({"X-Forwarded-For": "1.2.3.4, 203.0.113.9"})
+        self.assertEqual(rate_limit.client_key(forged), "ip:203.0.113.9")
+
+
+class MiddlewareTests(unittest.TestCase):
+    def setUp(self) -> None:
+        app = FastAPI()
+        self.clock = FakeClock(1000.0)
+        buckets = rate_limit.TokenBuckets(rate=1, burst=2, clock=self.clock)
+        app.add_middleware(
+            rate_limit.RateLimitMiddleware, buckets=buckets, enabled=True, registry=metrics.MetricsRegistry()
+        )
+
+        @app.get("/landlords/{landlord_id}")
+        def landlord(landlord_id: str):
+            return {"id": landlord_id}
+
+        @app.get("/health")
+        def health():
+            return {"status": "ok"}
+
+        self.http = TestClient(app)
+
+    def test_over_limit_gets_429_with_retry_after(self) -> None:
+        self.assertEqual(self.http.get("/landlords/l1").status_code, 200)
+        self.assertEqual(self.http.get("/landlords/l1").status_code, 200)
+        response = self.http.get("/landlords/l1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["retry-after"], "1")
+        other = {"X-Forwarded-For": "203.0.113.9"}
+        self.assertEqual(self.http.get("/landlords/l1", headers=other).status_code, 200)
+
+    def test_rotating_api_keys_share_the_address_bucket(self) -> None:
+        statuses = [
+            self.http.get("/landlords/l1", headers={"X-API-Key": f"key-{index}"}).status_code
+            for index in range(4)
+        ]
+        self.assertEqual(statuses, [200, 200, 429, 429])
+
+    def test_health_checks_are_exempt(self) -> None:
+        for _ in range(10):
+            self.assertEqual(self.http.get("/health").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import cache
+import db_health
+import firestore_client
+import main
+import repository
+from fake_firestore import FakeAsyncClient
+
+
+def seed() -> dict:
+    return {
+        "properties": {"prop-1": {"rc_prop_id": "prop-1", "address": "1 Main St", "landlord_id": "l1"}},
+        "units": {
+            f"u{i}": {"unit_id": f"u{i}", "rc_prop_id": f"prop-{i % 2 + 1}", "rent": 1000 + i * 100}
+            for i in range(6)
+        },
+        "leases": {
+            "l1": {"lease_id": "l1", "rc_prop_id": "prop-1", "status": "active", "terms": {"months": 12}},
+            "l2": {"lease_id": "l2", "rc_prop_id": "prop-2", "status": "ended"},
+        },
+    }
+
+
+class RepositoryContract:
+    """Behaviour both backends must share; subclasses provide `make`."""
+
+    def make(self, data: dict) -> repository.Repository:
+        raise NotImplementedError
+
+    def setUp(self) -> None:
+        self.repo = self.make(seed())
+
+    async def test_get_returns_document_and_a_version_that_moves_on_write(self) -> None:
+        document, version = await self.repo.get("units", "u1")
+        self.assertEqual(document, {"id": "u1", "unit_id": "u1", "rc_prop_id": "prop-2", "rent": 1100})
+        metadata, same = await self.repo.get("units", "u1", metadata_only=True)
+        self.assertEqual((metadata, same), ({"id": "u1"}, version))
+        self.assertEqual(await self.repo.get("units", "nope"), (None, None))
+
+        await self.repo.set("units", "u1", {"rent": 1500}, merge=True)
+        document, changed = await self.repo.get("units", "u1")
+        self.assertEqual(document["rent"], 1500)
+        self.assertEqual(document["rc_prop_id"], "prop-2")
+        self.assertNotEqual(changed, version)
+
+    async def test_merge_set_merges_nested_maps(self) -> None:
+        await self.repo.set("units", "u1", {"address": {"street": "1 Main", "city": "Halifax"}, "tags": ["a"]})
+        await self.repo.set("units", "u1", {"address": {"city": "Dartmouth"}, "tags": ["b"]}, merge=True)
+        document, _ = await self.repo.get("units", "u1")
+        self.assertEqual(document["address"], {"street": "1 Main", "city": "Dartmouth"})
+        self.assertEqual(document["tags"], ["b"])
+
+    async def test_update_applies_only_at_the_version_read(self) -> None:
+        _, version = await self.repo.get("units", "u1")
+        await self.repo.update("units", "u1", {"rent": 1200}, version)
+        document, current = await self.repo.get("units", "u1")
+        self.assertEqual((document["rent"], document["rc_prop_id"]), (1200, "prop-2"))
+        with self.assertRaises(repository.Conflict):
+            await self.repo.update("units", "u1", {"rent": 1300}, version)
+        with self.assertRaises(repository.Conflict):
+            await self.repo.update("units", "nope", {"rent": 1300}, current)
+        self.assertEqual((await self.repo.get("units", "u1"))[0]["rent"], 1200)
+
+    async def test_get_many_leaves_out_missing_documents(self) -> None:
+        found = await self.repo.get_many("units", ["u0", "missing", "u2"])
+        self.assertEqual(sorted(found), ["u0", "u2"])
+        document, version = found["u0"]
+        self.assertEqual(document["id"], "u0")
+        self.assertEqual(version, (await self.repo.get("units", "u0"))[1])
+
+    async def test_query_filters_orders_and_pages(self) -> None:
+        filters = [("rc_prop_id", "==", "prop-1")]
+        first = await self.repo.query("units", filters, ["rent"], None, 2, None)
+        self.assertEqual([doc["id"] for doc in first], ["u0", "u2"])
+        cursor = [first[-1]["rent"], first[-1]["id"]]
+        rest = await self.repo.query("units", filters, ["rent"], cursor, 10, None)
+        self.assertEqual([doc["id"] for doc in rest], ["u4"])
+
+        either = await self.repo.query("leases", [("lease_id", "in", ["l2", "l9"])], [], None, 10, None)
+        self.assertEqual([doc["id"] for doc in either], ["l2"])
+        ranged = await self.repo.query("units", [("rent", ">=", 1400)], [], None, 10, ["rent"])
+        self.assertEqual(ranged, [{"id": "u4", "rent": 1400}, {"id": "u5", "rent": 1500}])
+
+    async def test_set_many_writes_every_document(self) -> None:
+        await self.repo.set_many("units", [(f"n{i}", {"rc_prop_id": "prop-9", "rent": i}) for i in range(3)])
+        page = await self.repo.query("units", [("rc_prop_id", "==", "prop-9")], [], None, 10, None)
+        self.assertEqual([doc["id"] for doc in page], ["n0", "n1", "n2"])
+
+
+class FirestoreRepositoryTests(RepositoryContract, unittest.IsolatedAsyncioTestCase):
+    def make(self, data: dict) -> repository.Repository:
+        self.client = FakeAsyncClient(data)
+        pool = firestore_client.FirestorePool(lambda: self.client, size=1)
+        return repository.FirestoreRepository(lambda: pool)
+
+
+class MemoryRepositoryTests(RepositoryContract, unittest.IsolatedAsyncioTestCase):
+    def make(self, data: dict) -> repository.Repository:
+        return repository.MemoryRepository(data)
+
+    async def test_indexed_filters_do_not_scan(self) -> None:
+        await self.repo.query("units", [("rc_prop_id", "==", "prop-1")], [], None, 10, None)
+        await self.repo.query("leases", [("status", "==", "active"), ("lease_id", "in", ["l1"])], [], None, 10, None)
+        self.assertEqual(self.repo.scans, 0)
+        await self.repo.query("leases", [("status", "==", "active")], [], None, 10, None)
+        self.assertEqual(self.repo.scans, 1)
+
+    async def test_indexes_follow_writes(self) -> None:
+        await self.repo.set("units", "u0", {"rc_prop_id": "prop-2"}, merge=True)
+        moved = await self.repo.query("units", [("rc_prop_id", "==", "prop-1")], [], None, 10, None)
+        self.assertEqual([doc["id"] for doc in moved], ["u2", "u4"])
+        await self.repo.set("units", "u2", {"unit_id": "u2"})
+        remaining = await self.repo.query("units", [("rc_prop_id", "==", "prop-1")], [], None, 10, None)
+        self.assertEqual([doc["id"] for doc in remaining], ["u4"])
+
+    async def test_callers_never_share_state_with_the_store(self) -> None:
+        document, _ = await self.repo.get("leases", "l1")
+        document["terms"]["months"] = 1
+        data = {"terms": {"months": 6}}
+        await self.repo.set("leases", "l3", data)
+        data["terms"]["months"] = 0
+        self.assertEqual((await self.repo.get("leases", "l1"))[0]["terms"], {"months": 12})
+        self.assertEqual((await self.repo.get("leases", "l3"))[0]["terms"], {"months": 6})
+
+    async def test_documents_without_an_ordered_field_are_left_out(self) -> None:
+        page = await self.repo.query("leases", [], ["terms.months"], None, 10, None)
+        self.assertEqual([doc["id"] for doc in page], ["l1"])
+
+
+class BackendSelectionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.addCleanup(repository.set_repository, None)
+
+    def test_backend_comes_from_configuration(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as handle:
+            json.dump(seed(), handle)
+        self.addCleanup(pathlib.Path(handle.name).unlink)
+        with mock.patch.object(repository, "BACKEND", "memory"), \
+                mock.patch.object(repository, "SEED_PATH", handle.name):
+            repository.set_repository(None)
+            backend = repository.get_repository()
+        self.assertIsInstance(backend, repository.MemoryRepository)
+        self.assertEqual(len(backend), 9)
+
+        repository.set_repository(None)
+        self.assertIsInstance(repository.get_repository(), repository.FirestoreRepository)
+        with mock.patch.object(repository, "BACKEND", "postgres"):
+            repository.set_repository(None)
+            with self.assertRaises(ValueError):
+                repository.get_repository()
+
+    def test_routes_run_on_the_memory_backend(self) -> None:
+        repository.set_repository(repository.MemoryRepository(seed()))
+        cache.clear_all()
+        self.addCleanup(cache.clear_all)
+        self.addCleanup(setattr, db_health, "probe", db_health.probe)
+        db_health.probe = db_health.DbHealthProbe()
+        with TestClient(main.app) as http:
+            overview = http.get("/properties/prop-1/overview").json()
+            self.assertEqual([unit["id"] for unit in overview["units"]], ["u0", "u2", "u4"])
+            self.assertEqual(overview["leases"][0]["id"], "l1")
+            self.assertEqual(http.get("/health/db").json()["database"], "memory")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import datetime as dt
+import decimal
+import json
+import unittest
+
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import main
+import responses
+from fake_firestore import FakeAsyncClient
+
+
+PAYLOAD = {
+    "id": "unit-1",
+    "rent_amount": decimal.Decimal("1500.50"),
+    "created_at": dt.datetime(2026, 1, 2, 3, 4, 5, 6000, tzinfo=dt.timezone.utc),
+    "tags": ("a", "b"),
+    "nested": {"label": "Unité 4 — Québec"},
+}
+
+
+class FastJSONResponseTests(unittest.TestCase):
+    @unittest.skipIf(responses.orjson is None, "orjson not installed")
+    def test_fallback_matches_fast_encoder(self) -> None:
+        stdlib_body = responses.stdlib_dumps(PAYLOAD)
+        self.assertEqual(json.loads(stdlib_body), json.loads(responses.orjson_dumps(PAYLOAD)))
+        self.assertEqual(json.loads(stdlib_body)["created_at"], "2026-01-02T03:04:05.006000+00:00")
+
+    def test_response_uses_selected_encoder(self) -> None:
+        self.assertEqual(responses.FastJSONResponse(PAYLOAD).body, responses.dumps(PAYLOAD))
+
+    def test_unknown_types_fail_loudly(self) -> None:
+        with self.assertRaises(TypeError):
+            responses.dumps({"value": object()})
+
+
+class CompressionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        units = {
+            f"unit-{i}": {"unit_id": f"unit-{i}", "rc_prop_id": "prop-1", "rent_amount": 1500}
+            for i in range(200)
+        }
+        self.client = FakeAsyncClient({"properties": {"prop-1": {"rc_prop_id": "prop-1"}}, "units": units})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.http = TestClient(main.create_app())
+
+    def test_large_bodies_are_gzipped_when_accepted(self) -> None:
+        response = self.http.get("/properties/prop-1/overview", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(len(response.json()["units"]), 200)
+
+    def test_identity_when_gzip_not_accepted(self) -> None:
+        response = self.http.get("/properties/prop-1/overview", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_small_bodies_are_not_compressed(self) -> None:
+        response = self.http.get("/health", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+
+
+@unittest.skipIf(responses.msgpack is None, "msgpack not installed")
+class NegotiationTests(unittest.TestCase):
+    def setUp(self) -> None:
+        units = {
+            f"unit-{i}": {"unit_id": f"unit-{i}", "rc_prop_id": "prop-1", "rent_amount": 1500}
+            for i in range(200)
+        }
+        self.client = FakeAsyncClient({"properties": {"prop-1": {"rc_prop_id": "prop-1"}}, "units": units})
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.http = TestClient(main.create_app())
+
+    def test_accept_header_ranking(self) -> None:
+        for accept, wanted in (
+            (b"application/msgpack", True),
+            (b"application/x-msgpack, */*;q=0.1", True),
+            (b"application/msgpack, application/json", True),
+            (b"application/json, application/msgpack;q=0.5", False),
+            (b"application/msgpack;q=0", False),
+            (b"*/*", False),
+            (b"application/json", False),
+        ):
+            with self.subTest(accept=accept):
+                self.assertIs(responses.prefers_msgpack(accept), wanted)
+
+    def test_msgpack_carries_the_same_values_as_json(self) -> None:
+        decoded = responses.msgpack.unpackb(responses.msgpack_dumps(PAYLOAD))
+        self.assertEqual(decoded, json.loads(responses.dumps(PAYLOAD)))
+
+    def test_routes_answer_in_the_requested_format(self) -> None:
+        as_json = self.http.get("/properties/prop-1/overview")
+        self.assertEqual(as_json.headers["content-type"], "application/json")
+        packed = self.http.get("/properties/prop-1/overview", headers={"Accept": "application/msgpack"})
+        self.assertEqual(packed.headers["content-type"], "application/msgpack")
+        self.assertEqual(responses.msgpack.unpackb(packed.content), as_json.json())
+        self.assertLess(len(packed.content), len(as_json.content))
+        for response in (as_json, packed):
+            self.assertIn("Accept", response.headers["vary"])
+
+    def test_compressed_msgpack_keeps_both_vary_entries(self) -> None:
+        response = self.http.get(
+            "/properties/prop-1/overview", headers={"Accept": "application/msgpack", "Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(sorted(response.headers["vary"].split(", ")), ["Accept", "Accept-Encoding"])
+        self.assertEqual(len(responses.msgpack.unpackb(response.content)["units"]), 200)
+
+    def test_errors_stay_json(self) -> None:
+        response = self.http.get("/properties/missing", headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["detail"], "property not found")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+import cache
+import datastore
+import firestore_client
+import singleflight
+from fake_firestore import FakeAsyncClient
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_execution(self) -> None:
+        group = singleflight.SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"value": 1}
+
+        results = await asyncio.gather(*(group.do("k", load) for _ in range(10)))
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(shared for _, shared in results))
+        self.assertEqual((group.leaders, group.followers), (1, 9))
+        self.assertEqual(len(group), 0)
+
+        _, shared = await group.do("k", load)
+        self.assertFalse(shared)
+        self.assertEqual(calls, 2)
+
+    async def test_errors_reach_every_caller(self) -> None:
+        group = singleflight.SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise LookupError("gone")
+
+        results = await asyncio.gather(*(group.do("k", fail) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, LookupError) for result in results))
+        self.assertEqual(len(group), 0)
+
+    async def test_cancelled_leader_does_not_cancel_followers(self) -> None:
+        group = singleflight.SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        leader = asyncio.create_task(group.do("k", load))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.do("k", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await follower, ("done", True))
+
+    def test_fingerprint_is_stable_and_discriminating(self) -> None:
+        first = singleflight.fingerprint("units", [("rc_prop_id", "==", "p1")], 10)
+        self.assertEqual(first, singleflight.fingerprint("units", [("rc_prop_id", "==", "p1")], 10))
+        self.assertNotEqual(first, singleflight.fingerprint("units", [("rc_prop_id", "==", "p2")], 10))
+
+
+class DatastoreCoalescingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {"prop-1": {"rc_prop_id": "prop-1"}},
+            "leases": {f"lease-{i}": {"rc_prop_id": "prop-1"} for i in range(3)},
+        })
+        self.client.latency = 0.01
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+
+    async def test_identical_document_reads_issue_one_rpc(self) -> None:
+        documents = await asyncio.gather(
+            *(datastore.get_document("properties", "prop-1") for _ in range(20))
+        )
+        self.assertEqual(self.client.calls["get"], 1)
+        documents[0]["rc_prop_id"] = "mutated"
+        self.assertEqual(documents[1]["rc_prop_id"], "prop-1")
+
+    async def test_uncached_collections_are_coalesced_too(self) -> None:
+        await asyncio.gather(*(datastore.get_document("leases", "lease-1") for _ in range(5)))
+        self.assertEqual(self.client.calls["get"], 1)
+
+    async def test_identical_queries_issue_one_rpc(self) -> None:
+        pages = await asyncio.gather(*(
+            datastore.query_page("leases", filters=[("rc_prop_id", "==", "prop-1")], limit=10)
+            for _ in range(5)
+        ))
+        self.assertEqual(self.client.calls["query"], 1)
+        self.assertEqual(len(pages[0]), 3)
+        self.assertIsNot(pages[0][0], pages[1][0])
+
+    async def test_reads_after_a_write_do_not_join_an_older_flight(self) -> None:
+        stale_read = asyncio.create_task(datastore.get_document("leases", "lease-1"))
+        await asyncio.sleep(0)
+        await datastore.set_document("leases", "lease-1", {"status": "ended"}, merge=True)
+        fresh = await datastore.get_document("leases", "lease-1")
+        await stale_read
+        self.assertEqual(fresh["status"], "ended")
+        self.assertEqual(self.client.calls["get"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
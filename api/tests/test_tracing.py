@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import pathlib
+import ipaddress
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi.testclient import TestClient
+
+import cache
+import firestore_client
+import jobs
+import main
+import metrics
+import tracing
+from fake_clock import FakeClock
+from fake_firestore import FakeAsyncClient
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = {"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"}
+
+
+def by_name(spans: list[dict]) -> dict[str, dict]:
+    return {span["name"]: span for span in spans}
+
+
+class SpanTests(unittest.IsolatedAsyncioTestCase):
+    async def test_spans_outside_a_trace_are_the_shared_noop(self) -> None:
+        self.assertIs(tracing.span("datastore.get"), tracing.NOOP)
+        with tracing.span("datastore.get") as span:
+            span.set(count=1)
+        self.assertIsNone(tracing.current())
+
+    async def test_nesting_follows_the_context_into_tasks(self) -> None:
+        exporter = tracing.MemoryExporter()
+
+        async def child(name: str) -> None:
+            with tracing.span(name):
+                await asyncio.sleep(0)
+
+        with tracing.start_trace("root", exporter=exporter) as root:
+            with tracing.span("outer"):
+                await asyncio.gather(child("a"), child("b"))
+            with self.assertRaises(KeyError):
+                with tracing.span("failing"):
+                    raise KeyError("x")
+        self.assertIsNone(tracing.current())
+
+        (spans,) = exporter.traces
+        named = by_name(spans)
+        self.assertEqual(named["outer"]["parent_id"], root.span_id)
+        self.assertEqual(named["a"]["parent_id"], named["outer"]["span_id"])
+        self.assertEqual(named["b"]["parent_id"], named["outer"]["span_id"])
+        self.assertEqual(named["failing"]["error"], "KeyError")
+        self.assertEqual({span["trace_id"] for span in spans}, {root.trace_id})
+        self.assertGreaterEqual(named["root"]["duration_ms"], named["outer"]["duration_ms"])
+
+    async def test_span_count_is_capped(self) -> None:
+        exporter = tracing.MemoryExporter()
+        with mock.patch.object(tracing, "MAX_SPANS_PER_TRACE", 3):
+            with tracing.start_trace("root", exporter=exporter):
+                for _ in range(5):
+                    with tracing.span("child"):
+                        pass
+        (spans,) = exporter.traces
+        self.assertEqual(len(spans), 4)  # the root is always kept
+        self.assertEqual(by_name(spans)["root"]["dropped_spans"], 2)
+
+
+class ExporterTests(unittest.TestCase):
+    def test_jsonl_file_rotates(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = str(pathlib.Path(directory.name) / "traces.jsonl")
+        exporter = tracing.JsonlExporter(path, max_bytes=600, backups=2)
+        self.addCleanup(exporter.close)
+        for index in range(12):
+            with tracing.start_trace("root", exporter=exporter, index=index):
+                with tracing.span("child"):
+                    pass
+        exporter.flush()
+        files = sorted(pathlib.Path(directory.name).iterdir())
+        self.assertEqual([file.name for file in files], ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"])
+        for file in files:
+            self.assertLessEqual(file.stat().st_size, 600)
+        latest = [json.loads(line) for line in pathlib.Path(path).read_text().splitlines()]
+        roots = [span for span in latest if span["name"] == "root"]
+        self.assertEqual(roots[-1]["attributes"], {"index": 11})
+
+    def test_jsonl_drops_traces_when_the_writer_falls_behind(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        exporter = tracing.JsonlExporter(str(pathlib.Path(directory.name) / "traces.jsonl"), queue_size=1)
+        self.addCleanup(exporter.close)
+        release = threading.Event()
+        write = exporter._write
+
+        def slow_write(trace: tracing.Trace) -> None:
+            release.wait(5)
+            write(trace)
+
+        exporter._write = slow_write
+        for index in range(3):
+            with tracing.start_trace("root", exporter=exporter, index=index):
+                pass
+            if index == 0:  # let the writer take the first one off the queue
+                for _ in range(500):
+                    if exporter._queue.empty():
+                        break
+                    time.sleep(0.002)
+        self.assertEqual(exporter.dropped, 1)
+        release.set()
+        exporter.close()
+        lines = pathlib.Path(exporter.path).read_text().splitlines()
+        self.assertEqual([json.loads(line)["attributes"]["index"] for line in lines], [0, 1])
+
+    def test_console_prints_a_tree(self) -> None:
+        stream = io.StringIO()
+        with tracing.start_trace("http.request", exporter=tracing.ConsoleExporter(stream), path="/x"):
+            with tracing.span("datastore.get", collection="units"):
+                pass
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("trace "))
+        self.assertTrue(lines[1].startswith("  http.request ") and lines[1].endswith("path=/x"))
+        self.assertTrue(lines[2].startswith("    datastore.get ") and lines[2].endswith("collection=units"))
+
+    def test_traceparent(self) -> None:
+        trace_id, parent_id = TRACE_ID, "00f067aa0ba902b7"
+        self.assertEqual(
+            tracing.parse_traceparent(f"00-{trace_id}-{parent_id}-01".encode()), (trace_id, parent_id, True)
+        )
+        self.assertFalse(tracing.parse_traceparent(f"00-{trace_id}-{parent_id}-00".encode())[2])
+        self.assertIsNone(tracing.parse_traceparent(b"00-zz-00f067aa0ba902b7-01"))
+
+
+class TracedRouteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeAsyncClient({
+            "properties": {"p1": {"rc_prop_id": "p1", "name": "Maple Court"}},
+        })
+        firestore_client.set_client_factory(lambda: self.client)
+        cache.clear_all()
+        self.addCleanup(firestore_client.set_client_factory, None)
+        self.addCleanup(cache.clear_all)
+        self.exporter = tracing.MemoryExporter()
+        # the middleware is built on the first request, so the patches stay on
+        patcher = mock.patch.object(tracing, "default_exporter", self.exporter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_client(self, sample_rate: float) -> TestClient:
+        patcher = mock.patch.object(tracing, "SAMPLE_RATE", sample_rate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return TestClient(main.create_app())
+
+    def test_sampled_request_records_datastore_and_render_spans(self) -> None:
+        response = self.make_client(1.0).get("/properties/p1")
+        self.assertEqual(response.status_code, 200)
+        (spans,) = self.exporter.traces
+        named = by_name(spans)
+        root = named["http.request"]
+        self.assertEqual(response.headers["x-trace-id"], root["trace_id"])
+        self.assertEqual(root["attributes"]["route"], "/properties/{rc_prop_id}")
+        self.assertEqual(root["attributes"]["status"], 200)
+        self.assertEqual(named["datastore.get"]["parent_id"], root["span_id"])
+        self.assertEqual(named["datastore.get"]["attributes"]["collection"], "properties")
+        self.assertEqual(named["response.render"]["parent_id"], root["span_id"])
+
+    def test_untrusted_callers_cannot_force_a_trace(self) -> None:
+        http = self.make_client(0.0)
+        self.assertNotIn("x-trace-id", http.get("/properties/p1").headers)
+        self.assertNotIn("x-trace-id", http.get("/properties/p1", headers=TRACEPARENT).headers)
+        self.assertEqual(self.exporter.traces, [])
+
+    def test_sampled_requests_join_the_callers_trace(self) -> None:
+        response = self.make_client(1.0).get("/properties/p1", headers=TRACEPARENT)
+        self.assertEqual(response.headers["x-trace-id"], TRACE_ID)
+        self.assertEqual(by_name(self.exporter.traces[0])["http.request"]["parent_id"], "00f067aa0ba902b7")
+
+
+class TrustedTraceparentTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        self.clock = FakeClock()
+        self.exporter = tracing.MemoryExporter()
+        self.registry = metrics.MetricsRegistry()
+        middleware = tracing.TracingMiddleware(
+            app, sample_rate=0.0, exporter=self.exporter, registry=self.registry,
+            trusted_sources=(ipaddress.ip_network("10.0.0.0/8"),), trusted_rate=2, clock=self.clock,
+        )
+        self.trusted = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=middleware, client=("10.1.2.3", 4000)), base_url="http://test"
+        )
+        self.outside = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=middleware, client=("203.0.113.9", 4000)), base_url="http://test"
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.trusted.aclose()
+        await self.outside.aclose()
+
+    async def traced(self, http: httpx.AsyncClient) -> bool:
+        return "x-trace-id" in (await http.get("/", headers=TRACEPARENT)).headers
+
+    async def test_trusted_sources_force_traces_up_to_the_rate(self) -> None:
+        self.assertFalse(await self.traced(self.outside))
+        self.assertEqual([await self.traced(self.trusted) for _ in range(3)], [True, True, False])
+        self.clock.now += 0.5
+        self.assertEqual([await self.traced(self.trusted) for _ in range(2)], [True, False])
+        self.assertEqual({span["trace_id"] for (span,) in self.exporter.traces}, {TRACE_ID})
+        self.assertIn("traceparent_capped_total 2", self.registry.render())
+
+
+def echo(params: dict) -> dict:
+    return params
+
+
+class TracedJobTests(unittest.IsolatedAsyncioTestCase):
+    async def test_job_runs_as_a_linked_trace(self) -> None:
+        kinds = {"echo": jobs.JobKind("echo", echo, executor="thread")}
+        runner = jobs.JobRunner(lambda: jobs.JobStore(":memory:"), kinds=kinds, registry=metrics.MetricsRegistry())
+        self.addAsyncCleanup(runner.stop)
+        await runner.start()
+        exporter = tracing.MemoryExporter()
+        with tracing.start_trace("http.request", exporter=exporter) as root:
+            job = await runner.enqueue("echo", "landlord-1", {"n": 1})
+        for _ in range(400):
+            if len(exporter.traces) == 2:
+                break
+            await asyncio.sleep(0.005)
+        request, run = exporter.traces
+        enqueue = by_name(request)["job.enqueue"]
+        self.assertEqual(enqueue["attributes"], {"kind": "echo", "job_id": job["id"]})
+        named = by_name(run)
+        self.assertEqual(named["job"]["trace_id"], root.trace_id)
+        self.assertEqual(named["job"]["parent_id"], enqueue["span_id"])
+        self.assertEqual(named["job.execute"]["parent_id"], named["job"]["span_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
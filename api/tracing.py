@@ -0,0 +1,451 @@
+"""
+Lightweight request tracing: nested, timed spans carried in a contextvar.
+
+`TracingMiddleware` starts a trace for a random `TRACE_SAMPLE_RATE` fraction
+of requests. A sampled request with a W3C `traceparent` header keeps its
+trace ID, so the spans join the caller's trace. The header's sampled flag
+forces a trace only when the request comes straight from an address in
+`TRACE_TRUSTED_SOURCES` (comma-separated networks; none by default), and at
+most `TRACE_TRUSTED_RATE` times a second, so no caller can make every
+request pay for tracing. The root span is `http.request`; traced responses
+carry `X-Trace-Id`.
+
+Code marks a unit of work with
+
+    with tracing.span("datastore.query", collection=collection):
+        ...
+
+The span becomes a child of whatever span is current, and is current itself
+for the code inside, including tasks it creates (they copy the context).
+Outside a sampled trace there is no current span and `span()` returns a
+shared no-op: the cost of instrumented code with sampling off is one
+`ContextVar.get()` and a `with` over an empty object. Datastore RPCs
+(`datastore.*`), response encoding (`response.render`) and job enqueue and
+execution (`job.*`) are instrumented. A job enqueued inside a trace is run
+as a linked trace with the same trace ID and the enqueue span as parent,
+since it runs later, from the runner's own task.
+
+When the root span ends, the trace's spans are handed to the exporter, one
+JSON object per span: `TRACE_EXPORTER=jsonl` (the default) appends them to
+`TRACE_FILE`, rotated at `TRACE_FILE_MAX_BYTES` with `TRACE_FILE_BACKUPS`
+old files kept; `console` prints an indented tree to stderr; `none` turns
+tracing off. The JSONL exporter only queues the trace on the event loop; a
+writer thread encodes and writes it, and traces arriving while
+`TRACE_EXPORT_QUEUE` are waiting are dropped and counted. A trace keeps at most `MAX_SPANS_PER_TRACE` spans and counts
+the rest as dropped, so a bulk request cannot grow one without bound.
+"""
+
+from __future__ import annotations
+
+import abc
+import contextvars
+import ipaddress
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, TextIO
+
+import metrics
+
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(tempfile.gettempdir(), "rentchain-traces.jsonl"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+TRACE_EXPORT_QUEUE = int(os.getenv("TRACE_EXPORT_QUEUE", "1000"))
+TRUSTED_SOURCES = tuple(
+    ipaddress.ip_network(source.strip(), strict=False)
+    for source in os.getenv("TRACE_TRUSTED_SOURCES", "").split(",")
+    if source.strip()
+)
+TRUSTED_RATE = float(os.getenv("TRACE_TRUSTED_RATE", "10"))
+MAX_SPANS_PER_TRACE = 1000
+TRACEPARENT_HEADER = b"traceparent"
+
+logger = logging.getLogger("rentchain.tracing")
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    __slots__ = ("trace_id", "exporter", "spans", "dropped")
+
+    def __init__(self, trace_id: str, exporter: "Exporter") -> None:
+        self.trace_id = trace_id
+        self.exporter = exporter
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start", "duration", "error",
+                 "_started", "_token", "_root")
+
+    def __init__(
+        self, trace: Trace, name: str, parent_id: str | None, attributes: dict[str, Any], root: bool = False
+    ) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = 0.0
+        self.duration: float | None = None
+        self.error: str | None = None
+        self._started = 0
+        self._token: contextvars.Token | None = None
+        self._root = root
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._started = time.perf_counter_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.duration = (time.perf_counter_ns() - self._started) / 1e6
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _current.reset(self._token)
+        trace = self.trace
+        if len(trace.spans) < MAX_SPANS_PER_TRACE or self._root:
+            trace.spans.append(self)
+        else:
+            trace.dropped += 1
+        if self._root:
+            trace.exporter.export(trace)
+
+    def to_dict(self) -> dict[str, Any]:
+        record = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration,
+        }
+        if self.attributes:
+            record["attributes"] = self.attributes
+        if self.error is not None:
+            record["error"] = self.error
+        if self._root and self.trace.dropped:
+            record["dropped_spans"] = self.trace.dropped
+        return record
+
+
+class _NoopSpan:
+    __slots__ = ()
+    span_id = None
+    trace_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def current() -> Span | None:
+    return _current.get()
+
+
+def span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """A child of the current span, or the shared no-op when nothing is being traced."""
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def start_trace(
+    name: str,
+    *,
+    trace_id: str | None = None,
+    parent_id: str | None = None,
+    exporter: "Exporter | None" = None,
+    **attributes: Any,
+) -> Span | _NoopSpan:
+    """The root span of a new trace; a no-op when no exporter is configured."""
+    exporter = exporter if exporter is not None else default_exporter
+    if exporter is None:
+        return NOOP
+    return Span(Trace(trace_id or _new_id(128), exporter), name, parent_id, attributes, root=True)
+
+
+class Exporter(abc.ABC):
+    @abc.abstractmethod
+    def export(self, trace: Trace) -> None:
+        """Called on the event loop when a trace's root span ends; must not block."""
+
+    def close(self) -> None:
+        """Finish any pending exports and release resources."""
+
+
+class MemoryExporter(Exporter):
+    """Keeps finished traces in a list; for tests and benchmarks."""
+
+    def __init__(self) -> None:
+        self.traces: list[list[dict[str, Any]]] = []
+
+    def export(self, trace: Trace) -> None:
+        self.traces.append([span.to_dict() for span in sorted(trace.spans, key=lambda span: span.start)])
+
+
+class JsonlExporter(Exporter):
+    """
+    Queues finished traces for a writer thread, started on the first export,
+    which encodes them and appends them to the file. Traces exported while
+    `queue_size` are waiting are dropped and counted in `dropped`.
+    """
+
+    def __init__(
+        self,
+        path: str = TRACE_FILE,
+        max_bytes: int = TRACE_FILE_MAX_BYTES,
+        backups: int = TRACE_FILE_BACKUPS,
+        queue_size: int = TRACE_EXPORT_QUEUE,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._file: TextIO | None = None
+        self._size = 0
+        self._queue: queue.Queue[Trace | None] = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        # starting and stopping the writer can race between the loop and other threads
+        self._lock = threading.Lock()
+
+    def _open(self) -> TextIO:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+        return self._file
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, trace: Trace) -> None:
+        spans = sorted(trace.spans, key=lambda span: span.start)
+        text = "".join(json.dumps(span.to_dict(), default=str, separators=(",", ":")) + "\n" for span in spans)
+        if self._size and self._size + len(text) > self.max_bytes:
+            self._open()
+            self._rotate()
+        file = self._open()
+        file.write(text)
+        file.flush()
+        self._size += len(text)
+
+    def _run(self) -> None:
+        while True:
+            trace = self._queue.get()
+            try:
+                if trace is None:
+                    return
+                self._write(trace)
+            except Exception:
+                logger.warning("trace export to %s failed", self.path, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def export(self, trace: Trace) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Block until every queued trace is written."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write what is queued and stop the writer; a later export starts a new one."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ConsoleExporter(Exporter):
+    def __init__(self, stream: TextIO | None = None) -> None:
+        self.stream = stream
+
+    def export(self, trace: Trace) -> None:
+        children: dict[str | None, list[Span]] = {}
+        ids = {span.span_id for span in trace.spans}
+        for span in sorted(trace.spans, key=lambda span: span.start):
+            # a linked trace's root has a parent from another trace
+            children.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+        lines = [f"trace {trace.trace_id}"]
+
+        def walk(parent_id: str | None, depth: int) -> None:
+            for span in children.get(parent_id, ()):
+                attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+                error = f" !{span.error}" if span.error else ""
+                lines.append(f"{'  ' * depth}{span.name} {span.duration:.3f}ms {attributes}{error}".rstrip())
+                walk(span.span_id, depth + 1)
+
+        walk(None, 1)
+        (self.stream or sys.stderr).write("\n".join(lines) + "\n")
+
+
+def _configured() -> Exporter | None:
+    if EXPORTER == "jsonl":
+        return JsonlExporter()
+    if EXPORTER == "console":
+        return ConsoleExporter()
+    if EXPORTER == "none":
+        return None
+    raise ValueError(f"unknown TRACE_EXPORTER {EXPORTER!r}")
+
+
+default_exporter = _configured()
+
+
+def parse_traceparent(value: bytes) -> tuple[str, str, bool] | None:
+    """`(trace_id, parent_id, sampled)` from a W3C traceparent header, None if malformed."""
+    parts = value.decode("latin-1").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class TracingMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        sample_rate: float | None = None,
+        exporter: Exporter | None = None,
+        rng: Callable[[], float] = random.random,
+        registry: metrics.MetricsRegistry = metrics.REGISTRY,
+        trusted_sources: tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...] | None = None,
+        trusted_rate: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else SAMPLE_RATE
+        self.exporter = exporter if exporter is not None else default_exporter
+        self.rng = rng
+        self.trusted_sources = trusted_sources if trusted_sources is not None else TRUSTED_SOURCES
+        self.trusted_rate = trusted_rate if trusted_rate is not None else TRUSTED_RATE
+        self.clock = clock
+        # a token bucket holding one second of forced traces
+        self._forced_tokens = self.trusted_rate
+        self._forced_at = clock()
+        self.traced = registry.counter(
+            "traces_total", "Requests traced, by reason.", labelnames=("reason",)
+        )
+        self.capped = registry.counter(
+            "traceparent_capped_total", "Trusted sampled traceparent headers not honored over the rate."
+        )
+
+    def _trusted(self, scope: dict[str, Any]) -> bool:
+        client = scope.get("client")
+        if not self.trusted_sources or not client:
+            return False
+        try:
+            address = ipaddress.ip_address(client[0])
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_sources)
+
+    def _take_forced(self) -> bool:
+        now = self.clock()
+        tokens = min(self.trusted_rate, self._forced_tokens + (now - self._forced_at) * self.trusted_rate)
+        self._forced_at = now
+        if tokens < 1:
+            self._forced_tokens = tokens
+            self.capped.inc()
+            return False
+        self._forced_tokens = tokens - 1
+        return True
+
+    def _root(self, scope: dict[str, Any]) -> tuple[str, str | None, str | None] | None:
+        """`(reason, trace_id, parent_id)` when the request is traced."""
+        parent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                parent = parse_traceparent(value)
+                break
+        if parent is not None and parent[2] and self._trusted(scope) and self._take_forced():
+            return "traceparent", parent[0], parent[1]
+        if self.sample_rate and self.rng() < self.sample_rate:
+            if parent is not None:
+                return "sampled", parent[0], parent[1]
+            return "sampled", None, None
+        return None
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or self.exporter is None:
+            await self.app(scope, receive, send)
+            return
+        root = self._root(scope)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason, trace_id, parent_id = root
+        self.traced.inc((reason,))
+        with start_trace(
+            "http.request", trace_id=trace_id, parent_id=parent_id, exporter=self.exporter,
+            method=scope["method"], path=scope["path"],
+        ) as request_span:
+
+            async def send_with_id(message: dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    request_span.set(status=message["status"])
+                    headers = [*message.get("headers", []), (b"x-trace-id", request_span.trace_id.encode())]
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                request_span.set(route=getattr(scope.get("route"), "path", None))